@@ -1,32 +1,43 @@
-from flask import Flask, render_template, request, jsonify, send_file
-import pandas as pd
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+from flask import Flask, Request, Response, render_template, request, jsonify, send_file
 import os
+import sys
+import threading
+import importlib.util
 from datetime import datetime
-from openpyxl import load_workbook, Workbook
-from openpyxl.styles import Font, Alignment
 import json
 import re
+import uuid
 from werkzeug.utils import secure_filename
 from database import (
     init_database, get_data_for_api, add_item, update_item, delete_items,
     add_category, delete_category, get_item_by_id, import_from_excel_data,
     backup_database, list_backups, restore_database, delete_backup, cleanup_old_backups,
-    update_category_order, update_item_order
+    update_category_order, update_item_order, apply_batch_operations,
+    validate_batch_operations, BatchOperationError,
+    bulk_update_items, bulk_delete_items, run_maintenance, get_database_stats,
+    get_last_maintenance_report, is_database_empty, iter_export_records,
+    get_data_revision, create_job, claim_next_job, update_job, get_job,
+    requeue_interrupted_jobs, cleanup_old_jobs, touch_job, merge_import_excel_data, iter_item_rows,
+    get_item_count, build_item_filter, ITEM_FIELD_COLUMNS, get_all_categories,
+    get_categories_revision, import_item_batches
+)
+from export_cache import ExportCache
+from interchange import (
+    PYARROW_AVAILABLE, INTERCHANGE_FORMATS, INTERCHANGE_MIMETYPES, InterchangeError,
+    WRITERS as INTERCHANGE_WRITERS, format_from_filename, iter_item_batches
 )
+from chunked_upload import ChunkedUploadStore, UploadError
+from font_cache import FontCache, base_charset
+from nl_parser import CategoryMatcher, parse_line, parse_lines
 
-# 尝试导入reportlab用于PDF导出
-try:
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib import colors
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import cm
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-    from reportlab.pdfbase import pdfmetrics
-    from reportlab.pdfbase.ttfonts import TTFont
-    from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
-    REPORTLAB_AVAILABLE = True
-except ImportError:
-    REPORTLAB_AVAILABLE = False
+# pandas / openpyxl / reportlab 都比较重，改为在首次使用时再导入（见各函数内部）
+# 这里只检查reportlab是否已安装，不实际导入
+REPORTLAB_AVAILABLE = importlib.util.find_spec('reportlab') is not None
+# pypdf 是可选依赖，只有并行渲染PDF（合并各进程生成的分段）时才需要
+PYPDF_AVAILABLE = importlib.util.find_spec('pypdf') is not None
 
 # 导入配置模块（简化版，不再需要API key）
 try:
@@ -62,28 +73,40 @@ os.makedirs(app.config['EXPORT_FOLDER'], exist_ok=True)
 # 全局变量：缓存字体注册状态（避免每次PDF生成都重新注册）
 _CHINESE_FONT_REGISTERED = False
 _CHINESE_FONT_NAME = 'Helvetica'
-_TEMP_FONT_FILE = None
+
+# 上传文件在内存中缓冲的上限，超过后才转存到匿名临时文件（关闭即删除，不写入上传目录）
+UPLOAD_SPOOL_MAX_SIZE = int(os.getenv('UPLOAD_SPOOL_MAX_MB', '8')) * 1024 * 1024
+
+class SpooledUploadRequest(Request):
+    """上传文件使用可配置阈值的SpooledTemporaryFile（Werkzeug默认只在内存中缓冲500KB）"""
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        import tempfile
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_SIZE, mode='rb+')
+
+app.request_class = SpooledUploadRequest
 
 def allowed_file(filename):
     """检查文件扩展名是否允许"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def make_upload_path(prefix, original_filename):
+    """生成上传目录中的唯一文件路径
+    secure_filename 会去掉中文等非ASCII字符（"预算.xlsx" 会变成 "xlsx"），所以扩展名单独保留
+    """
+    extension = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else ''
+    stem = secure_filename(original_filename.rsplit('.', 1)[0]) if '.' in original_filename else ''
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    name = '_'.join(part for part in (prefix, timestamp, uuid.uuid4().hex[:8], stem) if part)
+    return os.path.join(app.config['UPLOAD_FOLDER'], f'{name}.{extension}' if extension else name)
+
 # 支持环境变量配置Excel文件路径（用于导入和导出）
 EXCEL_FILE = os.getenv('EXCEL_FILE', '红玺台复式装修预算表.xlsx')
 
-# 初始化数据库
-# 注意：database.py 会自动检测并使用持久存储（/mnt）如果可用
-init_database()
-
 # 如果存在Excel文件且数据库为空，自动导入Excel数据
 def migrate_excel_to_db_if_needed():
     """如果数据库为空且存在Excel文件，自动导入"""
-    from database import get_all_items, get_all_categories
-    items = get_all_items()
-    categories = get_all_categories()
-    
-    # 如果数据库为空且Excel文件存在，则导入
-    if not items and not categories and os.path.exists(EXCEL_FILE):
+    # 先检查文件（最便宜），再检查数据库是否为空（不加载全部数据）
+    if os.path.exists(EXCEL_FILE) and is_database_empty():
         try:
             print("检测到Excel文件，正在导入到数据库...")
             excel_data = parse_excel()
@@ -92,13 +115,6 @@ def migrate_excel_to_db_if_needed():
         except Exception as e:
             print(f"⚠️ Excel导入失败: {e}")
 
-# 启动时执行迁移
-migrate_excel_to_db_if_needed()
-
-# 定期自动备份（使用后台线程）
-import threading
-import time
-
 def auto_backup_worker():
     """后台线程：定期自动备份数据库"""
     while True:
@@ -117,322 +133,761 @@ def auto_backup_worker():
         except Exception as e:
             print(f"⚠️ 自动备份失败: {e}")
 
-# 启动自动备份线程
-backup_thread = threading.Thread(target=auto_backup_worker, daemon=True)
-backup_thread.start()
-print("✅ 自动备份服务已启动（每24小时备份一次）")
+# 数据库维护间隔（小时），可通过环境变量配置
+MAINTENANCE_INTERVAL_HOURS = float(os.getenv('DB_MAINTENANCE_INTERVAL_HOURS', '6'))
 
-def validate_excel_format(file_path):
-    """验证Excel文件格式是否符合要求"""
-    errors = []
-    warnings = []
-    
-    try:
-        df = pd.read_excel(file_path, engine='openpyxl', header=None)
-        
-        if df.empty:
-            errors.append('Excel文件为空')
-            return {'valid': False, 'errors': errors, 'warnings': warnings}
-        
-        # 检查是否有分类行
-        has_category = False
-        has_header = False
-        category_count = 0
-        
-        for i in range(len(df)):
-            row = df.iloc[i].astype(str).tolist()
-            first_col = str(row[0]).strip() if pd.notna(row[0]) else ''
-            
-            # 检查分类行
-            if any(first_col.startswith(prefix) for prefix in ['一、', '二、', '三、', '四、', '五、', '六、', '七、', '八、', '九、', '十、']):
-                has_category = True
-                category_count += 1
+def auto_maintenance_worker():
+    """后台线程：定期维护数据库（回收空闲页、更新统计信息）"""
+    while True:
+        try:
+            time.sleep(MAINTENANCE_INTERVAL_HOURS * 60 * 60)
             
-            # 检查表头行
-            if first_col == '序号' and '项目' in str(row[1]):
-                has_header = True
-        
-        if not has_category:
-            errors.append('未找到分类行（应以"一、"、"二、"等开头）')
-        
-        if not has_header:
-            errors.append('未找到表头行（应包含"序号"和"项目"列）')
-        
-        if category_count == 0:
-            warnings.append('未找到任何分类，建议至少有一个分类')
-        
-        # 检查必需的列
-        if has_header:
-            header_row = None
-            for i in range(len(df)):
-                row = df.iloc[i].astype(str).tolist()
-                if str(row[0]).strip() == '序号':
-                    header_row = i
-                    break
+            report = run_maintenance('scheduled')
+            print(f"🧹 数据库维护完成: {report['after']['page_count']} 页，"
+                  f"空闲 {report['after']['freelist_count']} 页，"
+                  f"回收 {report['pages_reclaimed']} 页，耗时 {report['duration_ms']}ms")
+        except Exception as e:
+            print(f"⚠️ 数据库维护失败: {e}")
+
+# 后台任务：请求线程只负责排队，由后台线程执行耗时操作（导入等）
+# 任务记录保存在数据库中，任何worker进程都可以查询进度
+JOB_POLL_INTERVAL = 1.0  # 没有任务时的轮询间隔（秒），其他进程排队的任务靠轮询发现
+JOB_STALE_SECONDS = int(os.getenv('JOB_STALE_SECONDS', '600'))  # 运行中但超过该时间没有更新的任务视为中断
+JOB_KEEP_DAYS = 7
+# 任务执行期间更新 updated_at 的间隔（秒），必须明显小于 JOB_STALE_SECONDS
+JOB_HEARTBEAT_INTERVAL = max(1, min(60, JOB_STALE_SECONDS // 4))
+JOB_HANDLERS = {}
+JOB_DEDICATED_WORKERS = {}  # 任务类型 -> 专用线程数（这些任务不由通用任务线程执行）
+_JOB_WAKEUP = threading.Event()
+
+class JobFailed(Exception):
+    """任务失败（附带返回给前端的详细结果，例如验证错误列表）"""
+    def __init__(self, message, result=None):
+        super().__init__(message)
+        self.result = result
+
+def job_handler(kind, workers=None):
+    """注册任务处理函数：handler(job) 返回任务结果（dict）
+    workers: 可选，为这类任务启动N个专用线程（同时最多执行N个，也不会阻塞其他类型的任务）
+    """
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        if workers:
+            JOB_DEDICATED_WORKERS[kind] = workers
+        return func
+    return decorator
+
+def enqueue_job(kind, payload=None):
+    """排队一个后台任务，返回任务ID"""
+    job_id = create_job(kind, payload)
+    _JOB_WAKEUP.set()
+    return job_id
+
+def _job_upload_paths(job):
+    """任务使用的上传文件（payload 中的 path，以及 files 列表中每个文件的 path）"""
+    payload = job.get('payload') or {}
+    paths = [payload['path']] if payload.get('path') else []
+    paths.extend(file_info['path'] for file_info in payload.get('files') or [] if file_info.get('path'))
+    return paths
+
+def _job_heartbeat(job_id, stop):
+    """心跳线程：任务执行期间定期更新 updated_at
+    长时间的渲染、导入中途不会更新任务记录，没有心跳时会被其他进程当作中断的任务重新排队并重复执行
+    """
+    while not stop.wait(JOB_HEARTBEAT_INTERVAL):
+        try:
+            if not touch_job(job_id):
+                return
+        except Exception as e:
+            # 例如导入事务持有写锁时超时，下一次再试
+            print(f"⚠️ 任务心跳更新失败 {job_id}: {e}")
+
+def run_job(job):
+    """执行一个已领取的任务，并记录结果
+    执行期间由心跳线程定期更新任务，不会被重新排队；
+    上传文件在任务结束（成功或失败）后才删除：进程中途退出时任务会被重新排队，重试时还需要这些文件
+    """
+    handler = JOB_HANDLERS.get(job['kind'])
+    stop_heartbeat = threading.Event()
+    threading.Thread(target=_job_heartbeat, args=(job['id'], stop_heartbeat), daemon=True).start()
+    try:
+        if handler is None:
+            raise JobFailed(f"未知的任务类型: {job['kind']}")
+        if any(not os.path.exists(path) for path in _job_upload_paths(job)):
+            raise JobFailed('上传的文件已不存在，请重新上传')
+        result = handler(job)
+        update_job(job['id'], status='done', stage='done', result=result)
+    except JobFailed as e:
+        update_job(job['id'], status='failed', stage='failed', error=str(e), result=e.result)
+    except Exception as e:
+        import traceback
+        print(f"⚠️ 后台任务失败 {job['kind']} {job['id']}: {e}\n{traceback.format_exc()}")
+        update_job(job['id'], status='failed', stage='failed', error=str(e))
+    finally:
+        stop_heartbeat.set()
+    
+    for path in _job_upload_paths(job):
+        if os.path.exists(path):
+            os.remove(path)
+
+def job_worker(kinds=None):
+    """后台线程：逐个领取并执行排队中的任务
+    kinds 为空时是通用任务线程：执行没有专用线程的任务类型，并负责定期清理
+    """
+    last_housekeeping = 0
+    while True:
+        try:
+            # 定期把中断的任务重新排队、清理旧任务记录和过期的任务结果文件
+            if kinds is None and time.monotonic() - last_housekeeping > 60:
+                last_housekeeping = time.monotonic()
+                requeued = requeue_interrupted_jobs(stale_seconds=JOB_STALE_SECONDS)
+                if requeued:
+                    print(f"🔁 已重新排队 {requeued} 个中断的后台任务")
+                cleanup_old_jobs(keep_days=JOB_KEEP_DAYS)
+                cleanup_expired_pdf_results()
             
-            if header_row is not None:
-                headers = df.iloc[header_row].astype(str).tolist()
-                required_columns = ['序号', '项目']
-                missing_columns = []
-                
-                for req_col in required_columns:
-                    if req_col not in ' '.join(headers):
-                        missing_columns.append(req_col)
-                
-                if missing_columns:
-                    errors.append(f'缺少必需的列：{", ".join(missing_columns)}')
-        
-        # 检查是否有数据行
-        has_data = False
-        for i in range(len(df)):
-            row = df.iloc[i].astype(str).tolist()
-            first_col = str(row[0]).strip() if pd.notna(row[0]) else ''
-            if first_col.isdigit():
-                has_data = True
+            _JOB_WAKEUP.clear()
+            job = claim_next_job(kinds or [kind for kind in JOB_HANDLERS if kind not in JOB_DEDICATED_WORKERS])
+            if job is None:
+                _JOB_WAKEUP.wait(JOB_POLL_INTERVAL)
+                continue
+            run_job(job)
+        except Exception as e:
+            print(f"⚠️ 后台任务线程出错: {e}")
+            time.sleep(JOB_POLL_INTERVAL)
+
+# 启动耗时报告（用于跟踪冷启动延迟）
+STARTUP_REPORT = {
+    'pid': None,
+    'import_ms': None,
+    'phases': {},
+    'total_ms': None,
+}
+_STARTUP_LOCK = threading.Lock()
+_MIGRATIONS_DONE = False
+_BACKGROUND_SERVICES_STARTED = False
+
+def _record_startup_phase(name, started):
+    """记录一个启动阶段的耗时（毫秒）"""
+    STARTUP_REPORT['phases'][name] = round((time.perf_counter() - started) * 1000, 2)
+
+def run_startup_migrations():
+    """一次性启动任务：初始化/迁移数据库、按需导入Excel
+    在gunicorn中由master进程预加载app时执行一次（见 gunicorn_config.py），
+    worker进程fork后继承完成标记，不会重复执行
+    """
+    global _MIGRATIONS_DONE
+    with _STARTUP_LOCK:
+        if _MIGRATIONS_DONE:
+            return
+        
+        # 注意：database.py 会自动检测并使用持久存储（/mnt）如果可用
+        started = time.perf_counter()
+        init_database()
+        _record_startup_phase('init_database', started)
+        
+        started = time.perf_counter()
+        migrate_excel_to_db_if_needed()
+        _record_startup_phase('migrate_excel', started)
+        
+        _MIGRATIONS_DONE = True
+
+# 后台服务锁：多个进程（gunicorn的多个worker）中只有持有该文件锁的进程运行后台服务
+BACKGROUND_SERVICES_LOCK_FILE = os.path.join(DATA_DIR, 'background_services.lock')
+_BACKGROUND_SERVICES_LOCK = None  # 持有锁的文件对象（进程退出时系统自动释放锁）
+
+def _run_background_services():
+    """在当前进程中启动后台线程（自动备份、数据库维护、后台任务）"""
+    started = time.perf_counter()
+    threading.Thread(target=auto_backup_worker, daemon=True).start()
+    print("✅ 自动备份服务已启动（每24小时备份一次）")
+    threading.Thread(target=auto_maintenance_worker, daemon=True).start()
+    print(f"✅ 数据库维护服务已启动（每{MAINTENANCE_INTERVAL_HOURS:g}小时维护一次）")
+    threading.Thread(target=job_worker, daemon=True).start()
+    for kind, workers in JOB_DEDICATED_WORKERS.items():
+        for _ in range(workers):
+            threading.Thread(target=job_worker, args=([kind],), daemon=True).start()
+    print(f"✅ 后台任务服务已启动（进程 {os.getpid()}）")
+    _record_startup_phase('background_services', started)
+
+def _wait_for_background_services_lock():
+    """后台线程：等待后台服务锁，拿到后在本进程中启动后台服务
+    运行后台服务的worker退出（例如按max_requests重启或被OOM杀掉）时锁被释放，由另一个worker接手
+    """
+    global _BACKGROUND_SERVICES_LOCK
+    import fcntl
+    try:
+        lock_file = open(BACKGROUND_SERVICES_LOCK_FILE, 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+    except OSError as e:
+        print(f"⚠️ 无法获取后台服务锁，本进程不运行后台服务: {e}")
+        return
+    _BACKGROUND_SERVICES_LOCK = lock_file
+    _run_background_services()
+
+def start_background_services():
+    """启动后台服务（自动备份、数据库维护、后台任务），每个进程只调用一次
+    多个进程都调用时，只有拿到 BACKGROUND_SERVICES_LOCK_FILE 文件锁的一个进程真正运行后台服务，
+    其他进程在后台线程中等待这个锁。在gunicorn中由worker进程调用（见 gunicorn_config.py 的 post_fork），
+    master进程不运行任务，不会加载导入/导出用到的重量级依赖
+    """
+    global _BACKGROUND_SERVICES_STARTED
+    with _STARTUP_LOCK:
+        if _BACKGROUND_SERVICES_STARTED:
+            return
+        _BACKGROUND_SERVICES_STARTED = True
+    
+    if importlib.util.find_spec('fcntl') is None:
+        # 没有文件锁（Windows）：只用于单进程开发环境，直接启动
+        _run_background_services()
+        return
+    threading.Thread(target=_wait_for_background_services_lock, daemon=True).start()
+
+def create_app():
+    """应用工厂：执行一次性启动任务并返回Flask应用
+    pandas、openpyxl、reportlab 在首次使用时才导入，worker 不导入/导出文件时不会加载它们
+    """
+    started = time.perf_counter()
+    
+    run_startup_migrations()
+    # 使用 gunicorn_config.py 时app在master中预加载，后台服务由worker的post_fork钩子启动
+    if os.getenv('BACKGROUND_SERVICES_IN_WORKERS', 'False').lower() != 'true':
+        start_background_services()
+    
+    # 可选：启动时预注册中文字体（会导入reportlab），默认在首次导出PDF时再注册
+    if REPORTLAB_AVAILABLE and os.getenv('PRELOAD_PDF_FONTS', 'False').lower() == 'true':
+        threading.Thread(target=_init_fonts_on_startup, daemon=True).start()
+    
+    _record_startup_phase('create_app', started)
+    STARTUP_REPORT['pid'] = os.getpid()
+    STARTUP_REPORT['total_ms'] = round((time.perf_counter() - _IMPORT_STARTED) * 1000, 2)
+    
+    phases = '，'.join(f'{name} {ms}ms' for name, ms in STARTUP_REPORT['phases'].items())
+    print(f"🚀 应用启动完成: 模块导入 {STARTUP_REPORT['import_ms']}ms，{phases}，"
+          f"总计 {STARTUP_REPORT['total_ms']}ms")
+    return app
+
+def validate_excel_format(source):
+    """验证Excel文件格式是否符合要求（不收集解析结果），source 可以是路径或二进制文件对象"""
+    result = run_import_pipeline(source, collect_items=False)
+    return {
+        'valid': result['valid'],
+        'errors': result['errors'],
+        'warnings': result['warnings'],
+        'category_count': result.get('category_count', 0),
+        'has_data': result.get('has_data', False)
+    }
+
+# 分类行前缀：任意中文数字 + 顿号，例如"一、"、"十二、"、"二十一、"
+CATEGORY_PREFIX_RE = re.compile(r'^[零〇一二三四五六七八九十百千两]+、')
+
+# 数值文本（如"24500"、"24500.0"、"-12.5"）
+_NUMBER_TEXT_RE = re.compile(r'^-?(?:\d+(?:\.\d*)?|\.\d+)$')
+
+# 表头列名规则：按顺序匹配，每个单元格只取第一个命中的规则（与原有的if/elif顺序一致）
+_HEADER_RULES = [
+    ('序号', re.compile(r'序号')),
+    ('项目', re.compile(r'项目')),
+    ('单位', re.compile(r'单位')),
+    ('预算数量', re.compile(r'数量')),
+    ('预算费用', re.compile(r'预算')),  # 同时识别 1st/2nd 预算，见 _map_header_row
+    ('当前投入', re.compile(r'(?=.*当前)(?=.*投入)')),
+    ('最终花费', re.compile(r'(?=.*最终)(?=.*花费)')),
+    ('最终实际花费', re.compile(r'(?=.*最终)(?=.*实际)')),
+    ('差价', re.compile(r'差价')),
+    ('备注', re.compile(r'备注')),
+]
+
+# 没有找到表头时使用的默认列位置（兼容旧格式，0-based）
+_DEFAULT_HEADER_ROW = 3
+_DEFAULT_HEADER_COLS = {
+    '序号': 0, '项目': 1, '单位': 2, '预算数量': 3,
+    '1st预算': 4, '2nd预算': 5, '最终实际花费': 6, '差价': 7, '备注': 8
+}
+
+EXCEL_HEADERS = ['序号', '项目', '单位', '预算数量', '预算费用', '当前投入', '最终花费', '差价', '备注']
+
+def _cell_text(value):
+    """单元格值转为去空白的文本（None为空字符串，整数值的浮点数去掉.0）"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+def split_category_prefix(text):
+    """如果文本是分类行（如"十二、水电"），返回去掉前缀的分类名，否则返回None"""
+    match = CATEGORY_PREFIX_RE.match(text)
+    if match:
+        return text[match.end():].strip()
+    return None
+
+def _map_header_row(cells):
+    """根据表头行的单元格文本建立列名到列索引（0-based）的映射"""
+    header_cols = {}
+    for col_idx, cell_str in enumerate(cells):
+        cell_str = cell_str.lower()
+        if not cell_str:
+            continue
+        for key, pattern in _HEADER_RULES:
+            if pattern.search(cell_str):
+                if key == '预算费用':
+                    header_cols.setdefault('预算费用', col_idx)  # 优先使用第一个"预算"列
+                    if '1st' in cell_str:
+                        header_cols.setdefault('1st预算', col_idx)
+                    if '2nd' in cell_str:
+                        header_cols.setdefault('2nd预算', col_idx)
+                else:
+                    header_cols[key] = col_idx
                 break
-        
-        if not has_data:
-            warnings.append('未找到任何数据行（序号为数字的行）')
-        
-        valid = len(errors) == 0
-        
-        return {
-            'valid': valid,
-            'errors': errors,
-            'warnings': warnings,
-            'category_count': category_count,
-            'has_data': has_data
+    return header_cols
+
+# 解析时每攒够多少个数据行做一次整列数值转换
+IMPORT_NORMALIZE_BATCH = 5000
+
+def _coerce_numeric(series):
+    """整列转为数值（向量化），空白、非数值和无穷大都变为NaN"""
+    import numpy as np
+    import pandas as pd
+    values = pd.to_numeric(series, errors='coerce')
+    return values.where(np.isfinite(values))
+
+def resolve_item_numbers(columns, index, validate_current=True):
+    """按列确定项目的金额（向量化）
+    Args:
+        columns: {列名: 原始值Series}，列名为 预算费用/1st预算/2nd预算/当前投入/最终实际花费/最终花费/差价，缺少的列可省略
+        index: 行索引
+        validate_current: 当前投入等于预算时视为错误数据（导入表格时使用；写回用户填写的数据时关闭）
+    Returns:
+        DataFrame，列为 预算费用、当前投入、最终花费、差价（浮点数，空白为NaN）
+    """
+    import numpy as np
+    import pandas as pd
+    
+    blank = pd.Series(np.nan, index=index, dtype=float)
+    numbers = {key: _coerce_numeric(series) for key, series in columns.items()}
+    
+    def number(key):
+        return numbers.get(key, blank)
+    
+    # 预算费用：优先使用新格式的"预算费用"，不是数值时依次使用2nd、1st预算
+    budget = number('预算费用').combine_first(number('2nd预算')).combine_first(number('1st预算'))
+    # 当前投入：优先使用新格式的"当前投入"，否则使用旧格式的"最终实际花费"
+    current = number('当前投入').combine_first(number('最终实际花费'))
+    if validate_current:
+        # 验证：如果当前投入等于预算，可能是错误数据，设为空（默认为0）
+        current = current.mask((budget - current).abs() < 0.01)
+    
+    return pd.DataFrame({
+        '预算费用': budget,
+        '当前投入': current,
+        '最终花费': number('最终花费'),
+        '差价': number('差价')
+    }, index=index)
+
+# 项目记录中的金额字段 -> resolve_item_numbers 的列名（兼容旧格式的1st/2nd预算费用、最终实际花费）
+_RECORD_NUMBER_FIELDS = {
+    '预算费用': '预算费用', '1st预算费用': '1st预算', '2nd预算费用': '2nd预算',
+    '当前投入': '当前投入', '最终实际花费': '最终实际花费', '最终花费': '最终花费',
+}
+
+def resolve_record_numbers(records):
+    """确定一组项目记录（dict）的金额，用于写回Excel：空白和非数值为0，差价 = 预算费用 - 最终花费"""
+    import pandas as pd
+    
+    index = pd.RangeIndex(len(records))
+    numbers = resolve_item_numbers(
+        {column: pd.Series([record.get(field) for record in records], index=index, dtype=object)
+         for field, column in _RECORD_NUMBER_FIELDS.items()},
+        index,
+        validate_current=False
+    ).fillna(0)
+    numbers['差价'] = numbers['预算费用'] - numbers['最终花费']
+    return numbers
+
+def _build_item_records(rows, header_cols):
+    """根据表头映射把一批数据行转换为项目记录：列映射只解析一次，数值列整列转换
+    Args:
+        rows: [(单元格文本列表, 序号, 分类, 原始行索引, 内部ID)]
+    Returns:
+        项目记录列表（金额为浮点数，空白为空字符串），顺序与rows一致
+    """
+    import pandas as pd
+    
+    # object 类型：单元格已经是文本，避免再转换为pandas字符串类型
+    frame = pd.DataFrame([cells for cells, *_ in rows], dtype=object)
+    
+    def column(col_name, default_idx=None):
+        col_idx = header_cols.get(col_name, default_idx)
+        if col_idx is None or col_idx not in frame.columns:
+            return pd.Series('', index=frame.index, dtype=object)
+        return frame[col_idx].fillna('')
+    
+    numbers = resolve_item_numbers(
+        {key: column(key) for key in ('预算费用', '1st预算', '2nd预算', '当前投入', '最终实际花费', '最终花费', '差价')
+         if key in header_cols},
+        frame.index
+    )
+    # NaN 改为空字符串（与未填写的单元格一致）
+    numbers = numbers.astype(object).where(numbers.notna(), '')
+    
+    # 每列一次性转为Python列表，再按行组装记录
+    columns = zip(
+        column('项目', 1).tolist(),
+        column('单位', 2).tolist(),
+        column('预算数量', 3).tolist(),
+        numbers['预算费用'].tolist(),
+        numbers['当前投入'].tolist(),
+        numbers['最终花费'].tolist(),
+        numbers['差价'].tolist(),
+        column('备注').tolist()
+    )
+    return [
+        {
+            'id': item_id,
+            'row_index': row_index,  # 原始行索引
+            'category': category or '未分类',
+            '序号': seq_num,
+            '项目': name,
+            '单位': unit,
+            '预算数量': quantity,
+            '预算费用': budget,
+            '当前投入': current,
+            '最终花费': final,
+            '差价': diff,
+            '备注': remark
         }
+        for (_, seq_num, category, row_index, item_id), (name, unit, quantity, budget, current, final, diff, remark)
+        in zip(rows, columns)
+    ]
+
+def iter_excel_records(source, sheet_name=None, header_scan_rows=10):
+    """流式解析Excel（openpyxl只读模式），逐条产出记录，内存占用与行数无关
+    Args:
+        source: 文件路径或二进制文件对象
+        sheet_name: 工作表名称，默认第一个工作表
+        header_scan_rows: 在前N行中查找表头
+    Yields:
+        首先产出 ('header', 表头信息)，之后是 ('category', 分类名) 或 ('item', 项目记录)
+    """
+    from openpyxl import load_workbook
+    
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet_name] if sheet_name else wb.worksheets[0]
+        rows = ws.iter_rows(values_only=True)
+        
+        # 在前N行中查找表头（包含"序号"和"项目"的行），这些行先缓存起来
+        buffered = []
+        header_row = None
+        header_cols = {}
+        for row in rows:
+            cells = [_cell_text(value) for value in row]
+            buffered.append(cells)
+            row_str = ' '.join(cells)
+            if '序号' in row_str and '项目' in row_str:
+                header_row = len(buffered) - 1
+                header_cols = _map_header_row(cells)
+                break
+            if len(buffered) >= header_scan_rows:
+                break
         
-    except Exception as e:
-        return {
-            'valid': False,
-            'errors': [f'文件读取失败: {str(e)}'],
-            'warnings': []
+        # 先产出表头信息，调用方可以据此提前结束（关闭生成器即可停止读取）
+        yield 'header', {
+            'row': header_row,
+            'cols': dict(header_cols),
+            'rows_scanned': len(buffered)
         }
+        
+        # 如果没找到表头，使用默认位置（兼容旧格式）
+        if header_row is None:
+            header_row = _DEFAULT_HEADER_ROW
+            header_cols = _DEFAULT_HEADER_COLS
+        
+        def all_rows():
+            yield from buffered
+            for row in rows:
+                yield [_cell_text(value) for value in row]
+        
+        # 数据行先攒成一批，整批做数值转换后再按原顺序产出（分类记录也一起缓存，保持顺序）
+        pending = []
+        batch = []
+        
+        def flush():
+            records = iter(_build_item_records(batch, header_cols)) if batch else iter(())
+            for kind, record in pending:
+                yield kind, next(records) if kind == 'item' else record
+            pending.clear()
+            batch.clear()
+        
+        current_category = None
+        item_id = 0  # 内部ID，用于追踪
+        for row_index, cells in enumerate(all_rows()):
+            first_col = cells[0] if cells else ''
+            
+            # 检查是否是分类行（去掉"一、"、"二、"等前缀）
+            category_name = split_category_prefix(first_col)
+            if category_name is not None:
+                current_category = category_name
+                pending.append(('category', category_name))
+            # 检查是否是数据行（序号是数字）
+            elif first_col.isdigit() and row_index > header_row:
+                batch.append((cells, int(first_col), current_category, row_index, item_id))
+                pending.append(('item', None))
+                item_id += 1
+                if len(batch) >= IMPORT_NORMALIZE_BATCH:
+                    yield from flush()
+        yield from flush()
+    finally:
+        wb.close()
 
-def parse_excel():
+def parse_excel(file_path=None):
     """解析Excel文件，返回结构化的数据"""
-    df = pd.read_excel(EXCEL_FILE, engine='openpyxl', header=None)
-    
-    # 查找表头行（包含"序号"和"项目"的行）
-    header_row = None
-    header_cols = {}  # 存储列名到列索引的映射
-    
-    for i in range(min(10, len(df))):  # 在前10行中查找表头
-        row = df.iloc[i].astype(str).tolist()
-        row_str = ' '.join([str(cell).strip() for cell in row if pd.notna(cell)])
-        
-        # 检查是否包含"序号"和"项目"
-        if '序号' in row_str and '项目' in row_str:
-            header_row = i
-            # 建立列名到索引的映射
-            for col_idx, cell_value in enumerate(row):
-                cell_str = str(cell_value).strip().lower() if pd.notna(cell_value) else ''
-                if '序号' in cell_str:
-                    header_cols['序号'] = col_idx
-                elif '项目' in cell_str:
-                    header_cols['项目'] = col_idx
-                elif '单位' in cell_str:
-                    header_cols['单位'] = col_idx
-                elif '预算数量' in cell_str or '数量' in cell_str:
-                    header_cols['预算数量'] = col_idx
-                elif '预算费用' in cell_str or '预算' in cell_str:
-                    if '预算费用' not in header_cols:  # 优先使用"预算费用"
-                        header_cols['预算费用'] = col_idx
-                    if '1st预算' not in header_cols and '1st' in cell_str:
-                        header_cols['1st预算'] = col_idx
-                    if '2nd预算' not in header_cols and '2nd' in cell_str:
-                        header_cols['2nd预算'] = col_idx
-                elif '当前投入' in cell_str or ('当前' in cell_str and '投入' in cell_str):
-                    header_cols['当前投入'] = col_idx
-                elif '最终花费' in cell_str or ('最终' in cell_str and '花费' in cell_str):
-                    header_cols['最终花费'] = col_idx
-                elif '最终实际花费' in cell_str or ('最终' in cell_str and '实际' in cell_str):
-                    header_cols['最终实际花费'] = col_idx
-                elif '差价' in cell_str:
-                    header_cols['差价'] = col_idx
-                elif '备注' in cell_str:
-                    header_cols['备注'] = col_idx
-            break
-    
-    # 如果没找到表头，使用默认位置（兼容旧格式）
-    if header_row is None:
-        header_row = 3
-        header_cols = {
-            '序号': 0, '项目': 1, '单位': 2, '预算数量': 3,
-            '1st预算': 4, '2nd预算': 5, '最终实际花费': 6, '差价': 7, '备注': 8
-        }
+    categories = []
+    seen_categories = set()
+    items = []
     
-    headers = ['序号', '项目', '单位', '预算数量', '预算费用', '当前投入', '最终花费', '差价', '备注']
+    for kind, record in iter_excel_records(file_path or EXCEL_FILE):
+        if kind == 'category':
+            if record not in seen_categories:
+                seen_categories.add(record)
+                categories.append(record)
+        elif kind == 'item':
+            items.append(record)
     
+    return {
+        'categories': categories,
+        'items': items,
+        'headers': list(EXCEL_HEADERS)
+    }
+
+def _header_errors(header):
+    """检查 iter_excel_records 产出的表头记录，返回致命错误列表"""
+    if header['rows_scanned'] == 0:
+        return ['Excel文件为空']
+    if header['row'] is None:
+        return ['未找到表头行（应包含"序号"和"项目"列，且位于前10行）']
+    missing_columns = [col for col in ('序号', '项目') if col not in header['cols']]
+    if missing_columns:
+        return [f'缺少必需的列：{", ".join(missing_columns)}']
+    return []
+
+def check_excel_header(source):
+    """只读取表头所在的前几行做快速检查（不解析数据行），返回致命错误列表"""
+    try:
+        records = iter_excel_records(source)
+        try:
+            _, header = next(records)
+        finally:
+            records.close()
+    except Exception as e:
+        return [f'文件读取失败: {str(e)}']
+    return _header_errors(header)
+
+IMPORT_PROGRESS_INTERVAL = 500  # 解析时每处理多少个项目回调一次进度
+
+def run_import_pipeline(source, collect_items=True, progress=None, sheet_name=None):
+    """一次读取Excel，同时完成格式验证、统计和解析
+    表头缺失等致命错误会立即停止读取
+    Args:
+        source: 文件路径或二进制文件对象
+        collect_items: 是否收集解析出的分类和项目（仅验证时可以关闭）
+        progress: 可选的进度回调 progress(已解析项目数)
+        sheet_name: 工作表名称，默认第一个工作表
+    Returns:
+        {'valid', 'errors', 'warnings', 'category_count', 'item_count', 'has_data',
+         'categories', 'items', 'headers'}
+    """
+    errors = []
+    warnings = []
     categories = []
+    seen_categories = set()
     items = []
-    current_category = None
-    item_id = 0  # 内部ID，用于追踪
-    
-    for i in range(len(df)):
-        row = df.iloc[i].astype(str).tolist()
-        first_col = str(row[0]).strip() if pd.notna(row[0]) else ''
-        
-        # 检查是否是分类行（去掉"一、"、"二、"等前缀）
-        if any(first_col.startswith(prefix) for prefix in ['一、', '二、', '三、', '四、', '五、', '六、', '七、', '八、', '九、', '十、']):
-            # 去掉前缀，只保留分类名称
-            category_name = first_col
-            for prefix in ['一、', '二、', '三、', '四、', '五、', '六、', '七、', '八、', '九、', '十、']:
-                if category_name.startswith(prefix):
-                    category_name = category_name[len(prefix):].strip()
-                    break
-            current_category = category_name
-            if current_category not in categories:
-                categories.append(current_category)
-        # 检查是否是数据行（序号是数字）
-        elif first_col.isdigit() and i > header_row:
-            try:
-                seq_num = int(float(first_col))
-                
-                # 根据表头映射读取数据
-                def get_col_value(col_name, default=''):
-                    col_idx = header_cols.get(col_name)
-                    if col_idx is not None and col_idx < len(row):
-                        val = str(row[col_idx]).strip() if pd.notna(row[col_idx]) and str(row[col_idx]) != 'nan' else ''
-                        return val
-                    return default
-                
-                # 读取预算相关字段
-                val_budget_new = get_col_value('预算费用', '')  # 新格式：直接有"预算费用"列
-                val_1st = get_col_value('1st预算', '')  # 旧格式：1st预算
-                val_2nd = get_col_value('2nd预算', '')  # 旧格式：2nd预算
-                
-                # 读取当前投入和最终花费
-                val_current_new = get_col_value('当前投入', '')  # 新格式：当前投入
-                val_old_actual = get_col_value('最终实际花费', '')  # 旧格式：最终实际花费
-                val_final_new = get_col_value('最终花费', '')  # 新格式：最终花费
-                
-                val_diff = get_col_value('差价', '')
-                val_remark = get_col_value('备注', '')
-                
-                # 确定预算费用：优先使用新格式的"预算费用"，否则合并1st和2nd
-                if val_budget_new and val_budget_new.replace('.','').replace('-','').isdigit():
-                    budget_value = val_budget_new
-                elif val_2nd and val_2nd.replace('.','').replace('-','').isdigit():
-                    budget_value = val_2nd
-                elif val_1st and val_1st.replace('.','').replace('-','').isdigit():
-                    budget_value = val_1st
-                else:
-                    budget_value = ''
-                
-                # 确定当前投入：优先使用新格式的"当前投入"，否则使用旧格式的"最终实际花费"
-                # 但如果等于预算值，说明可能是错误数据，设为空
-                if val_current_new and val_current_new.replace('.','').replace('-','').isdigit():
-                    current_value = val_current_new
+    item_count = 0
+    
+    try:
+        records = iter_excel_records(source, sheet_name=sheet_name)
+        try:
+            for kind, record in records:
+                if kind == 'header':
+                    errors.extend(_header_errors(record))
+                    if errors:
+                        break
+                elif kind == 'category':
+                    if record not in seen_categories:
+                        seen_categories.add(record)
+                        categories.append(record)
                 else:
-                    current_value = val_old_actual
-                
-                # 验证：如果当前投入等于预算，可能是错误数据，设为空
-                if budget_value and current_value:
-                    try:
-                        budget_num = float(budget_value)
-                        current_num = float(current_value)
-                        # 如果当前投入等于预算，可能是错误数据，设为空（默认为0）
-                        if abs(budget_num - current_num) < 0.01:
-                            current_value = ''
-                    except:
-                        pass
-                
-                # 最终花费：优先使用新格式，否则为空
-                final_value = val_final_new if val_final_new else ''
-                
-                item = {
-                    'id': item_id,
-                    'row_index': i,  # 原始行索引
-                    'category': current_category or '未分类',
-                    '序号': seq_num,
-                    '项目': str(row[1]).strip() if pd.notna(row[1]) and str(row[1]) != 'nan' else '',
-                    '单位': str(row[2]).strip() if pd.notna(row[2]) and str(row[2]) != 'nan' else '',
-                    '预算数量': str(row[3]).strip() if pd.notna(row[3]) and str(row[3]) != 'nan' else '',
-                    '预算费用': budget_value,
-                    '当前投入': current_value,
-                    '最终花费': final_value,
-                    '差价': val_diff,
-                    '备注': val_remark
-                }
-                # 清理空值
-                for key in item:
-                    if item[key] == 'nan' or item[key] == '':
-                        item[key] = ''
-                items.append(item)
-                item_id += 1
-            except:
-                pass
+                    item_count += 1
+                    if collect_items:
+                        items.append(record)
+                    if progress and item_count % IMPORT_PROGRESS_INTERVAL == 0:
+                        progress(item_count)
+        finally:
+            records.close()
+    except Exception as e:
+        return {
+            'valid': False,
+            'errors': [f'文件读取失败: {str(e)}'],
+            'warnings': []
+        }
+    
+    # 只有表头正常时才继续检查分类和数据行
+    if not errors:
+        if not categories:
+            errors.append('未找到分类行（应以"一、"、"二、"等开头）')
+            warnings.append('未找到任何分类，建议至少有一个分类')
+        if item_count == 0:
+            warnings.append('未找到任何数据行（序号为数字的行）')
     
     return {
-        'categories': categories,
+        'valid': len(errors) == 0,
+        'errors': errors,
+        'warnings': warnings,
+        'category_count': len(categories),
+        'item_count': item_count,
+        'has_data': item_count > 0,
+        'categories': categories if collect_items else [],
         'items': items,
-        'headers': headers
+        'headers': list(EXCEL_HEADERS)
     }
 
-def save_excel(data):
+_CHINESE_DIGITS = {'零': 0, '〇': 0, '一': 1, '二': 2, '两': 2, '三': 3, '四': 4, '五': 5, '六': 6, '七': 7, '八': 8, '九': 9}
+_CHINESE_UNITS = {'十': 10, '百': 100, '千': 1000}
+
+def chinese_numeral_to_int(text):
+    """中文数字转整数（如"十二"→12、"二十一"→21），无法识别时返回None"""
+    if not text:
+        return None
+    total = 0
+    digit = 0
+    for ch in text:
+        if ch in _CHINESE_DIGITS:
+            digit = _CHINESE_DIGITS[ch]
+        elif ch in _CHINESE_UNITS:
+            total += (digit or 1) * _CHINESE_UNITS[ch]
+            digit = 0
+        else:
+            return None
+    return total + digit
+
+def int_to_chinese_numeral(num):
+    """整数转中文数字（1-9999，如12→"十二"、21→"二十一"）"""
+    digits = '零一二三四五六七八九'
+    parts = []
+    need_zero = False
+    for unit_value, unit_char in ((1000, '千'), (100, '百'), (10, '十'), (1, '')):
+        digit = num // unit_value % 10
+        if digit == 0:
+            if parts:
+                need_zero = True
+            continue
+        if need_zero:
+            parts.append('零')
+            need_zero = False
+        parts.append(digits[digit] + unit_char)
+    text = ''.join(parts)
+    # 10-19 习惯写作"十"、"十二"而不是"一十"、"一十二"
+    if text.startswith('一十'):
+        text = text[1:]
+    return text
+
+def category_prefix_number(text):
+    """分类行的序号（如"十二、水电"→12），不是分类行时返回None"""
+    match = CATEGORY_PREFIX_RE.match(text)
+    if not match:
+        return None
+    return chinese_numeral_to_int(text[:match.end() - 1])
+
+class ExcelSession:
+    """Excel写回会话：工作簿只加载一次，所有修改共享同一个SheetAccessor，
+    退出时（没有异常）按需重新计算一次合计并只保存一次
+    
+    用法：
+        with ExcelSession() as session:
+            add_item_to_excel(item, '基装', session=session)
+            delete_items_from_excel([12], session=session)
+    """
+    
+    def __init__(self, file_path=None):
+        self.file_path = file_path or EXCEL_FILE
+        self.wb = None
+        self.ws = None
+        self.sheet = None
+        self.totals_dirty = False  # 数据行有变化，保存前需要重新计算合计
+    
+    def __enter__(self):
+        from openpyxl import load_workbook
+        
+        self.wb = load_workbook(self.file_path)
+        self.ws = self.wb.active
+        self.sheet = SheetAccessor(self.ws)
+        return self
+    
+    def __exit__(self, exc_type, exc_value, tb):
+        try:
+            if exc_type is None:
+                if self.totals_dirty:
+                    update_totals_in_excel(session=self)
+                self.wb.save(self.file_path)
+        finally:
+            self.wb.close()
+        return False
+
+def save_excel(data, session=None):
     """保存数据到Excel，保持原始格式"""
-    # 读取原始Excel文件
-    wb = load_workbook(EXCEL_FILE)
-    ws = wb.active
-    
-    # 创建项目ID到行索引的映射
-    item_map = {}
-    for item in data['items']:
-        if 'row_index' in item:
-            item_map[item['id']] = item['row_index']
-    
-        # 更新数据行
-        for item in data['items']:
-            if 'row_index' in item and item['row_index'] in item_map.values():
-                row_idx = item['row_index'] + 1  # openpyxl使用1-based索引
-                ws.cell(row=row_idx, column=1, value=item['序号'])
-                ws.cell(row=row_idx, column=2, value=item['项目'])
-                ws.cell(row=row_idx, column=3, value=item['单位'] if item['单位'] else None)
-                ws.cell(row=row_idx, column=4, value=item['预算数量'] if item['预算数量'] else None)
-                
-                # 列顺序：预算费用(5), 当前投入(6), 最终花费(7), 差价(8)
-                # 兼容旧格式
-                val_1st = float(item.get('1st预算费用', 0) or 0) if item.get('1st预算费用') and str(item.get('1st预算费用')).replace('.','').replace('-','').isdigit() else 0
-                val_2nd = float(item.get('2nd预算费用', 0) or 0) if item.get('2nd预算费用') and str(item.get('2nd预算费用')).replace('.','').replace('-','').isdigit() else 0
-                val_budget = float(item.get('预算费用', 0) or 0) if item.get('预算费用') and str(item.get('预算费用')).replace('.','').replace('-','').isdigit() else (val_2nd if val_2nd > 0 else val_1st)
-                val_current = float(item.get('当前投入', 0) or 0) if item.get('当前投入') and str(item.get('当前投入')).replace('.','').replace('-','').isdigit() else (float(item.get('最终实际花费', 0) or 0) if item.get('最终实际花费') and str(item.get('最终实际花费')).replace('.','').replace('-','').isdigit() else 0)
-                val_final = float(item.get('最终花费', 0) or 0) if item.get('最终花费') and str(item.get('最终花费')).replace('.','').replace('-','').isdigit() else 0
-                
-                # 自动计算差价（预算费用 - 最终花费）
-                val_diff = val_budget - val_final
-                
-                ws.cell(row=row_idx, column=5, value=val_budget if val_budget > 0 else None)  # 预算费用
-                ws.cell(row=row_idx, column=6, value=val_current if val_current > 0 else None)  # 当前投入
-                ws.cell(row=row_idx, column=7, value=val_final if val_final > 0 else None)  # 最终花费
-                ws.cell(row=row_idx, column=8, value=val_diff if val_diff != 0 else None)  # 差价（自动计算）
-                ws.cell(row=row_idx, column=9, value=item['备注'] if item['备注'] else None)
-    
-    # 更新合计
-    update_totals_in_excel()
-    
-    wb.save(EXCEL_FILE)
-    wb.close()
+    if session is None:
+        with ExcelSession() as session:
+            return save_excel(data, session=session)
+    
+    sheet = session.sheet
+    
+    # 更新数据行（金额整列确定，见 resolve_record_numbers）
+    items = [item for item in data['items'] if 'row_index' in item]
+    if items:
+        numbers = resolve_record_numbers(items)
+        for item, val_budget, val_current, val_final, val_diff in zip(
+            items,
+            numbers['预算费用'].tolist(),
+            numbers['当前投入'].tolist(),
+            numbers['最终花费'].tolist(),
+            numbers['差价'].tolist()
+        ):
+            row_idx = item['row_index'] + 1  # openpyxl使用1-based索引
+            sheet.set(row_idx, 1, item['序号'])
+            sheet.set(row_idx, 2, item['项目'])
+            sheet.set(row_idx, 3, item['单位'] if item['单位'] else None)
+            sheet.set(row_idx, 4, item['预算数量'] if item['预算数量'] else None)
+            
+            # 列顺序：预算费用(5), 当前投入(6), 最终花费(7), 差价(8，自动计算)
+            sheet.set(row_idx, 5, val_budget if val_budget > 0 else None)  # 预算费用
+            sheet.set(row_idx, 6, val_current if val_current > 0 else None)  # 当前投入
+            sheet.set(row_idx, 7, val_final if val_final > 0 else None)  # 最终花费
+            sheet.set(row_idx, 8, val_diff if val_diff != 0 else None)  # 差价（自动计算）
+            sheet.set(row_idx, 9, item['备注'] if item['备注'] else None)
+    
+    # 合计在会话保存前统一计算
+    session.totals_dirty = True
 
-def add_item_to_excel(item_data, category):
+def add_item_to_excel(item_data, category, session=None):
     """在Excel中添加新项目"""
-    wb = load_workbook(EXCEL_FILE)
-    ws = wb.active
+    if session is None:
+        with ExcelSession() as session:
+            return add_item_to_excel(item_data, category, session=session)
+    
+    ws = session.ws
+    sheet = session.sheet
     
     # 找到分类所在的行（支持带前缀和不带前缀的查找）
     category_row = None
     for i in range(1, ws.max_row + 1):
-        first_cell = safe_get_cell_value(ws, i, 1)
+        first_cell = safe_get_cell_value(sheet, i, 1)
         if first_cell:
             cell_value = str(first_cell).strip()
             # 去掉前缀后匹配
-            category_name = cell_value
-            for prefix in ['一、', '二、', '三、', '四、', '五、', '六、', '七、', '八、', '九、', '十、']:
-                if category_name.startswith(prefix):
-                    category_name = category_name[len(prefix):].strip()
-                    break
+            category_name = split_category_prefix(cell_value)
+            if category_name is None:
+                category_name = cell_value
             # 匹配分类名称
             if category_name == category:
                 category_row = i
@@ -442,76 +897,70 @@ def add_item_to_excel(item_data, category):
         # 找到该分类下的最后一个数据行
         insert_row = category_row + 1
         for i in range(category_row + 1, ws.max_row + 1):
-            first_cell = safe_get_cell_value(ws, i, 1)
-            if first_cell and (str(first_cell).strip() == '合计' or 
-                              any(str(first_cell).strip().startswith(prefix) for prefix in ['一、', '二、', '三、', '四、', '五、'])):
+            first_cell = safe_get_cell_value(sheet, i, 1)
+            if first_cell and (str(first_cell).strip() == '合计' or
+                               CATEGORY_PREFIX_RE.match(str(first_cell).strip())):
                 insert_row = i
                 break
-            elif first_cell and str(first_cell).strip().isdigit():
+            elif _cell_text(first_cell).isdigit():
                 insert_row = i + 1
         
         # 获取该分类下的最大序号
         max_seq = 0
         for i in range(category_row + 1, insert_row):
-            seq_val = safe_get_cell_value(ws, i, 1)
-            if seq_val and str(seq_val).strip().isdigit():
-                max_seq = max(max_seq, int(float(str(seq_val).strip())))
-        
-        # 插入新行
-        ws.insert_rows(insert_row)
-        ws.cell(insert_row, 1, value=max_seq + 1)
-        ws.cell(insert_row, 2, value=item_data.get('项目', ''))
-        ws.cell(insert_row, 3, value=item_data.get('单位', '') if item_data.get('单位') else None)
-        ws.cell(insert_row, 4, value=item_data.get('预算数量', '') if item_data.get('预算数量') else None)
-        
-        # 列顺序：预算费用(5), 当前投入(6), 最终花费(7), 差价(8)
-        val_budget = float(item_data['预算费用']) if item_data.get('预算费用') and str(item_data['预算费用']).replace('.','').replace('-','').isdigit() else 0
-        val_current = float(item_data['当前投入']) if item_data.get('当前投入') and str(item_data['当前投入']).replace('.','').replace('-','').isdigit() else 0
-        val_final = float(item_data['最终花费']) if item_data.get('最终花费') and str(item_data['最终花费']).replace('.','').replace('-','').isdigit() else 0
-        
-        # 自动计算差价（预算费用 - 最终花费）
-        val_diff = val_budget - val_final
-        
-        ws.cell(insert_row, 5, value=val_budget if val_budget > 0 else None)  # 预算费用
-        ws.cell(insert_row, 6, value=val_current if val_current > 0 else None)  # 当前投入
-        ws.cell(insert_row, 7, value=val_final if val_final > 0 else None)  # 最终花费
-        ws.cell(insert_row, 8, value=val_diff if val_diff != 0 else None)  # 差价（自动计算）
-        ws.cell(insert_row, 9, value=item_data.get('备注', '') if item_data.get('备注') else None)
-        
-        # 更新合计
-        update_totals_in_excel()
-    
-    wb.save(EXCEL_FILE)
-    wb.close()
-
-def add_category_to_excel(category_name):
+            seq_val = _cell_text(safe_get_cell_value(sheet, i, 1))
+            if seq_val.isdigit():
+                max_seq = max(max_seq, int(seq_val))
+        
+        # 插入新行（插入位置在合并区域内部时区域会扩大，新行通过 sheet.set 写入，合并区域中只写左上角）
+        sheet.insert_rows(insert_row)
+        sheet.set(insert_row, 1, max_seq + 1)
+        sheet.set(insert_row, 2, item_data.get('项目', ''))
+        sheet.set(insert_row, 3, item_data.get('单位', '') if item_data.get('单位') else None)
+        sheet.set(insert_row, 4, item_data.get('预算数量', '') if item_data.get('预算数量') else None)
+        
+        # 列顺序：预算费用(5), 当前投入(6), 最终花费(7), 差价(8，预算费用 - 最终花费)
+        numbers = resolve_record_numbers([item_data]).iloc[0]
+        val_budget, val_current, val_final, val_diff = (
+            float(numbers['预算费用']), float(numbers['当前投入']), float(numbers['最终花费']), float(numbers['差价'])
+        )
+        
+        sheet.set(insert_row, 5, val_budget if val_budget > 0 else None)  # 预算费用
+        sheet.set(insert_row, 6, val_current if val_current > 0 else None)  # 当前投入
+        sheet.set(insert_row, 7, val_final if val_final > 0 else None)  # 最终花费
+        sheet.set(insert_row, 8, val_diff if val_diff != 0 else None)  # 差价（自动计算）
+        sheet.set(insert_row, 9, item_data.get('备注', '') if item_data.get('备注') else None)
+        
+        # 合计在会话保存前统一计算
+        session.totals_dirty = True
+
+def add_category_to_excel(category_name, session=None):
     """在Excel中添加新分类"""
-    wb = load_workbook(EXCEL_FILE)
-    ws = wb.active
+    if session is None:
+        with ExcelSession() as session:
+            return add_category_to_excel(category_name, session=session)
+    
+    ws = session.ws
+    sheet = session.sheet
     
     # 找到最后一个分类行的位置和序号
     last_category_row = 0
     last_category_num = 0
     
     for i in range(1, ws.max_row + 1):
-        first_cell = safe_get_cell_value(ws, i, 1)
+        first_cell = safe_get_cell_value(sheet, i, 1)
         if first_cell:
             first_col = str(first_cell).strip()
-            if any(first_col.startswith(prefix) for prefix in ['一、', '二、', '三、', '四、', '五、', '六、', '七、', '八、', '九、', '十、']):
+            if CATEGORY_PREFIX_RE.match(first_col):
                 last_category_row = i
-                # 提取序号
-                for prefix in ['一、', '二、', '三、', '四、', '五、', '六、', '七、', '八、', '九、', '十、']:
-                    if first_col.startswith(prefix):
-                        num_map = {'一': 1, '二': 2, '三': 3, '四': 4, '五': 5, '六': 6, '七': 7, '八': 8, '九': 9, '十': 10}
-                        last_category_num = max(last_category_num, num_map.get(prefix[0], 0))
-                        break
+                last_category_num = max(last_category_num, category_prefix_number(first_col) or 0)
     
     # 找到最后一个分类的合计行位置
     insert_row = ws.max_row + 1  # 默认插入到最后
     if last_category_row > 0:
         # 从最后一个分类行开始查找合计行
         for i in range(last_category_row + 1, ws.max_row + 1):
-            first_cell = safe_get_cell_value(ws, i, 1)
+            first_cell = safe_get_cell_value(sheet, i, 1)
             if first_cell:
                 first_col = str(first_cell).strip()
                 if first_col == '合计':
@@ -519,54 +968,54 @@ def add_category_to_excel(category_name):
                     insert_row = i + 1
                     break
                 # 如果遇到下一个分类，停止查找
-                if any(first_col.startswith(prefix) for prefix in ['一、', '二、', '三、', '四、', '五、', '六、', '七、', '八、', '九、', '十、']):
+                if CATEGORY_PREFIX_RE.match(first_col):
                     # 在遇到下一个分类之前插入
                     insert_row = i
                     break
     
     # 生成新分类的序号前缀
-    num_to_prefix = {1: '一、', 2: '二、', 3: '三、', 4: '四、', 5: '五、', 6: '六、', 7: '七、', 8: '八、', 9: '九、', 10: '十、'}
-    new_prefix = num_to_prefix.get(last_category_num + 1, '')
+    new_prefix = int_to_chinese_numeral(last_category_num + 1) + '、'
     
-    # 插入分类行
-    ws.insert_rows(insert_row)
-    ws.cell(insert_row, 1, value=f"{new_prefix}{category_name}")
+    # 插入分类行（与 add_item_to_excel 一样通过 sheet.set 写入，插入位置可能在合并区域内部）
+    sheet.insert_rows(insert_row)
+    sheet.set(insert_row, 1, f"{new_prefix}{category_name}")
     
     # 插入表头行
-    ws.insert_rows(insert_row + 1)
-    ws.cell(insert_row + 1, 1, value='序号')
-    ws.cell(insert_row + 1, 2, value='项目')
-    ws.cell(insert_row + 1, 3, value='单位')
-    ws.cell(insert_row + 1, 4, value='预算数量')
-    ws.cell(insert_row + 1, 5, value='预算费用')
-    ws.cell(insert_row + 1, 6, value='当前投入')
-    ws.cell(insert_row + 1, 7, value='最终花费')
-    ws.cell(insert_row + 1, 8, value='差价')
-    ws.cell(insert_row + 1, 9, value='备注：选购意向（网购/实体店，品牌，型号等）')
+    sheet.insert_rows(insert_row + 1)
+    sheet.set(insert_row + 1, 1, '序号')
+    sheet.set(insert_row + 1, 2, '项目')
+    sheet.set(insert_row + 1, 3, '单位')
+    sheet.set(insert_row + 1, 4, '预算数量')
+    sheet.set(insert_row + 1, 5, '预算费用')
+    sheet.set(insert_row + 1, 6, '当前投入')
+    sheet.set(insert_row + 1, 7, '最终花费')
+    sheet.set(insert_row + 1, 8, '差价')
+    sheet.set(insert_row + 1, 9, '备注：选购意向（网购/实体店，品牌，型号等）')
     
     # 插入合计行
-    ws.insert_rows(insert_row + 2)
-    ws.cell(insert_row + 2, 1, value='合计')
-    
-    wb.save(EXCEL_FILE)
-    wb.close()
+    sheet.insert_rows(insert_row + 2)
+    sheet.set(insert_row + 2, 1, '合计')
 
-def delete_items_from_excel(row_indices):
+def delete_items_from_excel(row_indices, session=None):
     """从Excel中删除项目，严格保护分类行、表头行和合计行"""
-    wb = load_workbook(EXCEL_FILE)
-    ws = wb.active
+    if session is None:
+        with ExcelSession() as session:
+            return delete_items_from_excel(row_indices, session=session)
+    
+    ws = session.ws
+    sheet = session.sheet
     
     # 先扫描所有受保护的行（分类行、表头行、合计行）
     protected_row_indices = set()
     
     for i in range(1, ws.max_row + 1):
-        first_cell = safe_get_cell_value(ws, i, 1)
+        first_cell = safe_get_cell_value(sheet, i, 1)
         if first_cell:
             first_col = str(first_cell).strip()
             row_idx = i - 1  # 转换为0-based索引
             
             # 检查是否是分类行（一、二、三等开头）
-            if any(first_col.startswith(prefix) for prefix in ['一、', '二、', '三、', '四、', '五、', '六、', '七、', '八、', '九、', '十、']):
+            if CATEGORY_PREFIX_RE.match(first_col):
                 protected_row_indices.add(row_idx)
                 continue
             
@@ -585,280 +1034,254 @@ def delete_items_from_excel(row_indices):
     blocked_count = len(row_indices) - len(safe_row_indices)
     
     if not safe_row_indices:
-        wb.close()
+        # 抛出异常时会话不会保存
         raise ValueError(f'不能删除分类行、表头行或合计行（尝试删除 {blocked_count} 个受保护的行）')
     
     # 按倒序删除，避免索引变化
     for row_idx in sorted(safe_row_indices, reverse=True):
-        ws.delete_rows(row_idx + 1)  # openpyxl使用1-based索引
+        sheet.delete_rows(row_idx + 1)  # openpyxl使用1-based索引
     
-    # 删除后重新计算合计
-    update_totals_in_excel()
-    
-    wb.save(EXCEL_FILE)
-    wb.close()
+    # 删除后在会话保存前统一重新计算合计
+    session.totals_dirty = True
     
     if blocked_count > 0:
         return f'已删除 {len(safe_row_indices)} 项，跳过了 {blocked_count} 个受保护的行（分类行/表头行/合计行）'
     return None
 
-def safe_get_cell_value(ws, row, col):
-    """安全地获取单元格值，处理合并单元格"""
-    try:
-        # 首先检查该单元格是否在合并范围内
+class SheetAccessor:
+    """工作表访问器：一次性建立合并单元格索引（(行, 列) -> 合并区域左上角），
+    插入/删除行时同步更新索引，单元格读写不再需要遍历所有合并区域"""
+    
+    def __init__(self, ws):
+        self.ws = ws
+        self._anchors = {}
         for merged_range in ws.merged_cells.ranges:
-            if (row >= merged_range.min_row and row <= merged_range.max_row and 
-                col >= merged_range.min_col and col <= merged_range.max_col):
-                # 如果在合并范围内，返回合并区域左上角单元格的值
-                return ws.cell(merged_range.min_row, merged_range.min_col).value
-        
-        # 如果不在合并范围内，直接获取单元格值
-        cell = ws.cell(row, col)
-        # 检查是否是MergedCell对象（这种情况不应该发生，但为了安全）
-        if hasattr(cell, 'value'):
-            return cell.value
-        else:
-            # 如果是MergedCell对象，尝试获取合并区域的主单元格值
-            for merged_range in ws.merged_cells.ranges:
-                if (row >= merged_range.min_row and row <= merged_range.max_row and 
-                    col >= merged_range.min_col and col <= merged_range.max_col):
-                    return ws.cell(merged_range.min_row, merged_range.min_col).value
+            self._index_range(merged_range)
+    
+    def _index_range(self, merged_range):
+        anchor = (merged_range.min_row, merged_range.min_col)
+        for row in range(merged_range.min_row, merged_range.max_row + 1):
+            for col in range(merged_range.min_col, merged_range.max_col + 1):
+                self._anchors[(row, col)] = anchor
+    
+    def _unindex_range(self, merged_range):
+        for row in range(merged_range.min_row, merged_range.max_row + 1):
+            for col in range(merged_range.min_col, merged_range.max_col + 1):
+                self._anchors.pop((row, col), None)
+    
+    def _move_ranges(self, changes):
+        """把合并区域移动/调整到新的行范围，changes 为 [(合并区域, 新起始行, 新结束行), ...]
+        （openpyxl的insert_rows/delete_rows只移动单元格，不调整合并区域）"""
+        # 先全部移出再全部加入，避免调整后的区域与尚未调整的区域在索引/集合中冲突
+        for merged_range, _, _ in changes:
+            self._unindex_range(merged_range)
+            self.ws.merged_cells.remove(merged_range)
+        for merged_range, min_row, max_row in changes:
+            if max_row - min_row == merged_range.max_row - merged_range.min_row:
+                merged_range.shift(row_shift=min_row - merged_range.min_row)
+                self.ws.merged_cells.add(merged_range)
+                self._index_range(merged_range)
+            else:
+                self._resize_range(merged_range, min_row, max_row)
+    
+    def _resize_range(self, merged_range, min_row, max_row):
+        """合并区域跨过插入/删除位置时改变行数（与Excel一致）：
+        在区域内部插入行时扩大，删除区域的部分行时缩小，行全部被删除或只剩一个单元格时取消合并"""
+        from openpyxl.cell.cell import MergedCell
+        from openpyxl.worksheet.cell_range import CellRange
+        
+        if max_row < min_row:
+            return
+        min_col, max_col = merged_range.min_col, merged_range.max_col
+        # 原左上角所在行被删除时，新的左上角是合并占位单元格（只读），换回普通单元格
+        if isinstance(self.ws._cells.get((min_row, min_col)), MergedCell):
+            del self.ws._cells[(min_row, min_col)]
+        if min_row == max_row and min_col == max_col:
+            return
+        # merge_cells 会把新插入行中的单元格也换成合并占位单元格，并补齐边框
+        self.ws.merge_cells(start_row=min_row, start_column=min_col, end_row=max_row, end_column=max_col)
+        self._index_range(CellRange(min_col=min_col, min_row=min_row, max_col=max_col, max_row=max_row))
+    
+    def get(self, row, col):
+        """安全地获取单元格值，合并单元格返回左上角单元格的值"""
+        try:
+            anchor = self._anchors.get((row, col))
+            if anchor:
+                row, col = anchor
+            return self.ws.cell(row, col).value
+        except Exception:
             return None
-    except Exception:
-        # 如果所有方法都失败，返回None
-        return None
+    
+    def set(self, row, col, value):
+        """安全地设置单元格值，合并单元格只更新左上角单元格（其余单元格跳过）"""
+        try:
+            anchor = self._anchors.get((row, col))
+            if anchor and anchor != (row, col):
+                return
+            self.ws.cell(row, col, value=value)
+        except Exception:
+            pass
+    
+    def insert_rows(self, idx, amount=1):
+        """插入行：插入位置之后的合并区域一起下移，插入位置在区域内部时区域扩大"""
+        self.ws.insert_rows(idx, amount)
+        changes = []
+        for merged_range in self.ws.merged_cells.ranges:
+            if merged_range.min_row >= idx:
+                changes.append((merged_range, merged_range.min_row + amount, merged_range.max_row + amount))
+            elif merged_range.max_row >= idx:
+                changes.append((merged_range, merged_range.min_row, merged_range.max_row + amount))
+        self._move_ranges(changes)
+    
+    def delete_rows(self, idx, amount=1):
+        """删除行：之后的合并区域一起上移，与删除范围相交的合并区域缩小（全部被删除时移除）"""
+        last = idx + amount - 1
+        self.ws.delete_rows(idx, amount)
+        changes = []
+        for merged_range in self.ws.merged_cells.ranges:
+            if merged_range.min_row > last:
+                changes.append((merged_range, merged_range.min_row - amount, merged_range.max_row - amount))
+            elif merged_range.max_row >= idx:
+                deleted = min(merged_range.max_row, last) - max(merged_range.min_row, idx) + 1
+                min_row = min(merged_range.min_row, idx)
+                changes.append((merged_range, min_row, min_row + merged_range.max_row - merged_range.min_row - deleted))
+        self._move_ranges(changes)
+
+def safe_get_cell_value(ws, row, col):
+    """安全地获取单元格值，处理合并单元格（传入SheetAccessor可复用其合并单元格索引）"""
+    sheet = ws if isinstance(ws, SheetAccessor) else SheetAccessor(ws)
+    return sheet.get(row, col)
 
 def safe_set_cell_value(ws, row, col, value):
-    """安全地设置单元格值，处理合并单元格"""
-    try:
-        # 检查该单元格是否在合并范围内
-        for merged_range in ws.merged_cells.ranges:
-            if (row >= merged_range.min_row and row <= merged_range.max_row and 
-                col >= merged_range.min_col and col <= merged_range.max_col):
-                # 如果在合并范围内，只更新合并区域的主单元格（左上角）
-                if row == merged_range.min_row and col == merged_range.min_col:
-                    ws.cell(row, col, value=value)
-                # 否则跳过（不更新合并单元格的非主单元格）
-                return
-        # 如果不在合并范围内，直接更新
-        ws.cell(row, col, value=value)
-    except Exception:
-        # 如果更新失败，尝试直接更新（忽略错误）
-        pass
+    """安全地设置单元格值，处理合并单元格（传入SheetAccessor可复用其合并单元格索引）"""
+    sheet = ws if isinstance(ws, SheetAccessor) else SheetAccessor(ws)
+    sheet.set(row, col, value)
 
-def normalize_imported_data():
+def normalize_imported_data(session=None):
     """规范化导入的数据：设置默认值并同步2nd预算"""
-    wb = load_workbook(EXCEL_FILE)
-    ws = wb.active
+    if session is None:
+        with ExcelSession() as session:
+            return normalize_imported_data(session=session)
     
-    # 查找表头行（包含"序号"和"项目"的行）
+    ws = session.ws
+    sheet = session.sheet
+    
+    # 查找表头行（包含"序号"和"项目"的行），列映射与解析时使用同一套规则（_HEADER_RULES）
     header_row = None
     header_cols = {}  # 存储列名到列索引的映射（openpyxl使用1-based索引）
     
     for i in range(1, min(11, ws.max_row + 1)):  # 在前10行中查找表头
-        row_values = []
-        for col in range(1, min(20, ws.max_column + 1)):  # 检查前20列
-            cell_value = safe_get_cell_value(ws, i, col)
-            if cell_value is not None:
-                row_values.append(str(cell_value).strip().lower())
-        
-        row_str = ' '.join(row_values)
+        cells = [_cell_text(safe_get_cell_value(sheet, i, col)) for col in range(1, min(20, ws.max_column + 1))]  # 检查前20列
+        row_str = ' '.join(cells)
         
         # 检查是否包含"序号"和"项目"
         if '序号' in row_str and '项目' in row_str:
             header_row = i
-            # 建立列名到索引的映射
-            for col in range(1, min(20, ws.max_column + 1)):
-                cell_value = safe_get_cell_value(ws, i, col)
-                if cell_value is not None:
-                    cell_str = str(cell_value).strip().lower()
-                    if '序号' in cell_str:
-                        header_cols['序号'] = col
-                    elif '项目' in cell_str:
-                        header_cols['项目'] = col
-                    elif '预算费用' in cell_str or ('预算' in cell_str and '费用' in cell_str):
-                        if '预算费用' not in header_cols:
-                            header_cols['预算费用'] = col
-                    elif '1st预算' in cell_str or '1st' in cell_str:
-                        header_cols['1st预算'] = col
-                    elif '2nd预算' in cell_str or '2nd' in cell_str:
-                        header_cols['2nd预算'] = col
-                    elif '当前投入' in cell_str or ('当前' in cell_str and '投入' in cell_str):
-                        header_cols['当前投入'] = col
-                    elif '最终花费' in cell_str or ('最终' in cell_str and '花费' in cell_str):
-                        header_cols['最终花费'] = col
-                    elif '最终实际花费' in cell_str:
-                        header_cols['最终实际花费'] = col
-                    elif '差价' in cell_str:
-                        header_cols['差价'] = col
+            header_cols = {key: col_idx + 1 for key, col_idx in _map_header_row(cells).items()}
+            # 旧格式的"1st预算"/"2nd预算"列同时被识别为预算费用列：规范化时按2nd、1st的顺序取值并写回2nd预算列
+            if header_cols.get('预算费用') in (header_cols.get('1st预算'), header_cols.get('2nd预算')):
+                header_cols.pop('预算费用', None)
             break
     
     # 如果没找到表头，使用默认位置（兼容旧格式）
     if header_row is None:
-        header_row = 4  # openpyxl使用1-based，所以第4行是索引4
-        header_cols = {
-            '序号': 1, '项目': 2, '单位': 3, '预算数量': 4,
-            '1st预算': 5, '2nd预算': 6, '最终实际花费': 7, '差价': 8, '备注': 9
-        }
-    
-    # 检查值是否为空（None或空字符串）
-    def is_empty(val):
-        return val is None or (isinstance(val, str) and not val.strip())
-    
-    # 遍历所有数据行
+        header_row = _DEFAULT_HEADER_ROW + 1
+        header_cols = {key: col_idx + 1 for key, col_idx in _DEFAULT_HEADER_COLS.items()}
+    
+    # 先找出所有数据行（序号是数字），读取需要的列
+    seq_col = header_cols.get('序号', 1)
+    source_keys = [key for key in ('预算费用', '1st预算', '2nd预算', '当前投入', '最终实际花费', '最终花费')
+                   if key in header_cols]
+    data_rows = []
+    raw_values = {key: [] for key in source_keys}
     for i in range(header_row + 1, ws.max_row + 1):
-        seq_col = header_cols.get('序号', 1)
-        first_cell = safe_get_cell_value(ws, i, seq_col)
-        # 检查是否是数据行（序号是数字）
-        if first_cell and str(first_cell).strip().isdigit():
-            # 根据表头映射读取数据
-            def get_col_value(col_name, default=None):
-                col_idx = header_cols.get(col_name)
-                if col_idx:
-                    return safe_get_cell_value(ws, i, col_idx)
-                return default
-            
-            val_budget_new = get_col_value('预算费用')  # 新格式：直接有"预算费用"列
-            val_1st = get_col_value('1st预算')
-            val_2nd = get_col_value('2nd预算')
-            val_current_new = get_col_value('当前投入')  # 新格式：当前投入
-            val_old_actual = get_col_value('最终实际花费')  # 旧格式：最终实际花费
-            val_final = get_col_value('最终花费')
-            
-            # 处理预算费用：优先使用新格式的"预算费用"，否则合并1st和2nd
-            val_budget = 0
-            if not is_empty(val_budget_new):
-                try:
-                    val_budget = float(val_budget_new)
-                except (ValueError, TypeError):
-                    val_budget = 0
-            elif not is_empty(val_2nd):
-                try:
-                    val_budget = float(val_2nd)
-                except (ValueError, TypeError):
-                    if not is_empty(val_1st):
-                        try:
-                            val_budget = float(val_1st)
-                        except (ValueError, TypeError):
-                            val_budget = 0
-                    else:
-                        val_budget = 0
-            elif not is_empty(val_1st):
-                try:
-                    val_budget = float(val_1st)
-                except (ValueError, TypeError):
-                    val_budget = 0
-            
-            # 处理当前投入：优先使用新格式的"当前投入"，否则使用旧格式的"最终实际花费"
-            val_current = 0
-            if not is_empty(val_current_new):
-                try:
-                    val_current = float(val_current_new)
-                except (ValueError, TypeError):
-                    val_current = 0
-            elif not is_empty(val_old_actual):
-                try:
-                    val_current = float(val_old_actual)
-                except (ValueError, TypeError):
-                    val_current = 0
-            
-            # 验证：如果当前投入等于预算，可能是错误数据，设为0
-            if val_budget > 0 and val_current > 0 and abs(val_budget - val_current) < 0.01:
-                val_current = 0
-            
-            # 处理最终花费：如果为空，设为0
-            if is_empty(val_final):
-                val_final = 0
-            else:
-                try:
-                    val_final = float(val_final)
-                except (ValueError, TypeError):
-                    val_final = 0
-            
-            # 计算差价（预算费用 - 最终花费）
-            val_diff = val_budget - val_final
-            
-            # 更新Excel中的值（保留0值，因为0是有效的）
-            # 根据表头映射更新，如果没有找到对应列，使用默认位置
-            budget_col = header_cols.get('预算费用', header_cols.get('2nd预算', 5))
-            current_col = header_cols.get('当前投入', header_cols.get('最终实际花费', 6))
-            final_col = header_cols.get('最终花费', 7)
-            diff_col = header_cols.get('差价', 8)
-            
-            safe_set_cell_value(ws, i, budget_col, val_budget if val_budget > 0 else None)  # 预算费用
-            safe_set_cell_value(ws, i, current_col, val_current if val_current > 0 else None)  # 当前投入
-            safe_set_cell_value(ws, i, final_col, val_final if val_final > 0 else None)  # 最终花费
-            safe_set_cell_value(ws, i, diff_col, val_diff if val_diff != 0 else None)  # 差价
+        if _cell_text(safe_get_cell_value(sheet, i, seq_col)).isdigit():
+            data_rows.append(i)
+            for key in source_keys:
+                raw_values[key].append(safe_get_cell_value(sheet, i, header_cols[key]))
+    if not data_rows:
+        session.totals_dirty = True
+        return
+    
+    # 整列确定预算费用、当前投入、最终花费，再计算差价（预算费用 - 最终花费）
+    import pandas as pd
+    index = pd.RangeIndex(len(data_rows))
+    numbers = resolve_item_numbers(
+        {key: pd.Series(values, index=index, dtype=object) for key, values in raw_values.items()},
+        index
+    ).fillna(0)
+    numbers['差价'] = numbers['预算费用'] - numbers['最终花费']
+    
+    # 更新Excel中的值（保留0值，因为0是有效的）
+    # 根据表头映射更新，如果没有找到对应列，使用默认位置
+    budget_col = header_cols.get('预算费用', header_cols.get('2nd预算', 5))
+    current_col = header_cols.get('当前投入', header_cols.get('最终实际花费', 6))
+    final_col = header_cols.get('最终花费', 7)
+    diff_col = header_cols.get('差价', 8)
+    for i, val_budget, val_current, val_final, val_diff in zip(
+        data_rows,
+        numbers['预算费用'].tolist(),
+        numbers['当前投入'].tolist(),
+        numbers['最终花费'].tolist(),
+        numbers['差价'].tolist()
+    ):
+        safe_set_cell_value(sheet, i, budget_col, val_budget if val_budget > 0 else None)  # 预算费用
+        safe_set_cell_value(sheet, i, current_col, val_current if val_current > 0 else None)  # 当前投入
+        safe_set_cell_value(sheet, i, final_col, val_final if val_final > 0 else None)  # 最终花费
+        safe_set_cell_value(sheet, i, diff_col, val_diff if val_diff != 0 else None)  # 差价
+    
+    # 合计在会话保存前统一计算
+    session.totals_dirty = True
+
+def update_totals_in_excel(session=None):
+    """更新所有合计行的数值（单次线性扫描：分类行开始一个分类块，遇到合计行时写入该块的合计）"""
+    if session is None:
+        with ExcelSession() as session:
+            return update_totals_in_excel(session=session)
     
-    # 更新合计
-    update_totals_in_excel()
+    ws = session.ws
+    sheet = session.sheet
     
-    wb.save(EXCEL_FILE)
-    wb.close()
-
-def update_totals_in_excel():
-    """更新所有合计行的数值"""
-    wb = load_workbook(EXCEL_FILE)
-    ws = wb.active
+    in_block = False  # 当前是否处于"分类行之后、合计行之前"
+    total_budget = total_current = total_final = 0
     
-    # 找到所有分类行和对应的合计行
-    category_rows = []
     for i in range(1, ws.max_row + 1):
-        first_cell = safe_get_cell_value(ws, i, 1)
-        if first_cell:
-            first_col = str(first_cell).strip()
-            if any(first_col.startswith(prefix) for prefix in ['一、', '二、', '三、', '四、', '五、', '六、', '七、', '八、', '九、', '十、']):
-                category_rows.append(i)
-    
-    # 为每个分类计算合计
-    for cat_row in category_rows:
-        # 找到该分类下的合计行
-        total_row = None
-        for i in range(cat_row + 1, ws.max_row + 1):
-            first_cell = safe_get_cell_value(ws, i, 1)
-            if first_cell:
-                first_col = str(first_cell).strip()
-                if first_col == '合计':
-                    total_row = i
-                    break
-                # 如果遇到下一个分类，停止查找
-                if any(first_col.startswith(prefix) for prefix in ['一、', '二、', '三、', '四、', '五、', '六、', '七、', '八、', '九、', '十、']):
-                    break
-        
-        if total_row:
-            # 计算该分类下所有项目的合计
-            total_budget = 0
-            total_current = 0
-            total_final = 0
-            total_diff = 0
-            
-            # 从分类行后到合计行前，累加所有数字序号行的费用
-            for i in range(cat_row + 1, total_row):
-                first_cell = safe_get_cell_value(ws, i, 1)
-                if first_cell and str(first_cell).strip().isdigit():
-                    # 列顺序：预算费用(5), 当前投入(6), 最终花费(7), 差价(8)
-                    val_budget = safe_get_cell_value(ws, i, 5)
-                    val_current = safe_get_cell_value(ws, i, 6)
-                    val_final = safe_get_cell_value(ws, i, 7)
-                    
-                    if val_budget and isinstance(val_budget, (int, float)):
-                        total_budget += float(val_budget)
-                    if val_current and isinstance(val_current, (int, float)):
-                        total_current += float(val_current)
-                    if val_final and isinstance(val_final, (int, float)):
-                        total_final += float(val_final)
-            
+        first_cell = safe_get_cell_value(sheet, i, 1)
+        if not first_cell:
+            continue
+        first_col = str(first_cell).strip()
+        
+        if CATEGORY_PREFIX_RE.match(first_col):
+            # 新的分类块（上一个分类没有合计行时直接丢弃其累计值）
+            in_block = True
+            total_budget = total_current = total_final = 0
+        elif not in_block:
+            continue
+        elif first_col == '合计':
             # 计算差价合计（预算费用 - 最终花费）
             total_diff = total_budget - total_final
             
             # 更新合计行（列顺序：预算费用(5), 当前投入(6), 最终花费(7), 差价(8)）
-            safe_set_cell_value(ws, total_row, 5, total_budget if total_budget > 0 else None)  # 预算费用
-            safe_set_cell_value(ws, total_row, 6, total_current if total_current > 0 else None)  # 当前投入
-            safe_set_cell_value(ws, total_row, 7, total_final if total_final > 0 else None)  # 最终花费
-            safe_set_cell_value(ws, total_row, 8, total_diff if total_diff != 0 else None)  # 差价
-    
-    wb.save(EXCEL_FILE)
-    wb.close()
+            safe_set_cell_value(sheet, i, 5, total_budget if total_budget > 0 else None)  # 预算费用
+            safe_set_cell_value(sheet, i, 6, total_current if total_current > 0 else None)  # 当前投入
+            safe_set_cell_value(sheet, i, 7, total_final if total_final > 0 else None)  # 最终花费
+            safe_set_cell_value(sheet, i, 8, total_diff if total_diff != 0 else None)  # 差价
+            in_block = False
+        elif first_col.isdigit():
+            # 列顺序：预算费用(5), 当前投入(6), 最终花费(7), 差价(8)
+            val_budget = safe_get_cell_value(sheet, i, 5)
+            val_current = safe_get_cell_value(sheet, i, 6)
+            val_final = safe_get_cell_value(sheet, i, 7)
+            
+            if val_budget and isinstance(val_budget, (int, float)):
+                total_budget += float(val_budget)
+            if val_current and isinstance(val_current, (int, float)):
+                total_current += float(val_current)
+            if val_final and isinstance(val_final, (int, float)):
+                total_final += float(val_final)
+    
+    # 合计已是最新，会话退出时无需再算一次
+    session.totals_dirty = False
 
 @app.route('/')
 def index():
@@ -1035,12 +1458,33 @@ def delete_backup_route():
         import traceback
         return jsonify({'error': str(e), 'traceback': traceback.format_exc()}), 500
 
-@app.route('/api/update-category-order', methods=['POST'])
-def update_category_order_route():
-    """更新分类排序"""
+@app.route('/api/maintenance', methods=['GET', 'POST'])
+def maintenance_route():
+    """查看数据库状态（GET）或立即执行数据库维护（POST）"""
     try:
-        data = request.json
-        category_orders = data.get('orders', [])
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            report = run_maintenance('manual', analyze=bool(data.get('analyze', False)))
+            return jsonify({'success': True, 'message': '数据库维护完成', 'report': report})
+        
+        return jsonify({
+            'success': True,
+            'stats': get_database_stats(),
+            'last_report': get_last_maintenance_report(),
+            'data_revision': get_data_revision(),
+            'export_cache': EXPORT_CACHE.stats(),
+            'font_cache': FONT_CACHE.stats()
+        })
+    except Exception as e:
+        import traceback
+        return jsonify({'error': str(e), 'traceback': traceback.format_exc()}), 500
+
+@app.route('/api/update-category-order', methods=['POST'])
+def update_category_order_route():
+    """更新分类排序"""
+    try:
+        data = request.json
+        category_orders = data.get('orders', [])
         
         if not category_orders:
             return jsonify({'error': '请提供分类排序数据'}), 400
@@ -1127,9 +1571,135 @@ def delete_item_route():
         import traceback
         return jsonify({'error': str(e), 'traceback': traceback.format_exc()}), 500
 
+# 单次批量请求允许的最大操作数
+MAX_BATCH_OPERATIONS = 1000
+
+@app.route('/api/batch', methods=['POST'])
+def batch_route():
+    """批量执行增/改/删/排序操作（一次请求、一个事务）"""
+    try:
+        data = request.json or {}
+        operations = data.get('operations', [])
+
+        if not operations:
+            return jsonify({'error': '请提供要执行的操作'}), 400
+        if not isinstance(operations, list):
+            return jsonify({'error': 'operations 必须是列表'}), 400
+        if len(operations) > MAX_BATCH_OPERATIONS:
+            return jsonify({'error': f'单次最多执行 {MAX_BATCH_OPERATIONS} 个操作'}), 400
+
+        # 先检查每个操作的类型和必填字段，再计算差价
+        validate_batch_operations(operations)
+
+        for operation in operations:
+            if operation.get('op') in ('add', 'update'):
+                item = operation.get('item', {})
+                # 计算差价
+                budget_cost = float(item.get('预算费用', 0) or 0)
+                final_cost = float(item.get('最终花费', 0) or 0)
+                item['差价'] = str(budget_cost - final_cost)
+                # 分类可以放在操作上，也可以放在item里（与/api/update保持一致）
+                if not operation.get('category') and item.get('category'):
+                    operation['category'] = item['category']
+
+        results = apply_batch_operations(operations)
+
+        return jsonify({
+            'success': True,
+            'message': f'批量操作成功（共 {len(results)} 个操作）',
+            'results': results
+        })
+    except BatchOperationError as e:
+        return jsonify({'error': str(e), 'index': e.index}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        import traceback
+        return jsonify({'error': str(e), 'traceback': traceback.format_exc()}), 500
+
+@app.route('/api/bulk-update', methods=['POST'])
+def bulk_update_route():
+    """按筛选条件批量更新项目"""
+    try:
+        data = request.json or {}
+        filters = data.get('filter', {})
+        changes = data.get('changes', {})
+        
+        result = bulk_update_items(filters, changes)
+        
+        message = f'已更新 {result["updated"]} 项'
+        if result['protected'] > 0:
+            message += f'，跳过了 {result["protected"]} 个受保护的行（合计行/总计行）'
+        return jsonify({'success': True, 'message': message, **result})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        import traceback
+        return jsonify({'error': str(e), 'traceback': traceback.format_exc()}), 500
+
+@app.route('/api/bulk-delete', methods=['POST'])
+def bulk_delete_route():
+    """按筛选条件批量删除项目"""
+    try:
+        data = request.json or {}
+        filters = data.get('filter', {})
+        
+        result = bulk_delete_items(filters)
+        
+        message = f'已删除 {result["deleted"]} 项'
+        if result['protected'] > 0:
+            message += f'，跳过了 {result["protected"]} 个受保护的行（合计行/总计行）'
+        return jsonify({'success': True, 'message': message, **result})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        import traceback
+        return jsonify({'error': str(e), 'traceback': traceback.format_exc()}), 500
+
+IMPORT_MODES = ('replace', 'merge')
+
+@job_handler('import')
+def run_import_job(job):
+    """后台导入任务：解析上传的文件（显式传入路径）并导入数据库（上传文件在任务结束后由 run_job 删除）"""
+    job_id = job['id']
+    upload_path = job['payload']['path']
+    
+    update_job(job_id, stage='parsing', rows_processed=0)
+    # 一次读取：同时验证格式并解析数据
+    result = run_import_pipeline(
+        upload_path,
+        progress=lambda rows: update_job(job_id, rows_processed=rows)
+    )
+    
+    if not result['valid']:
+        raise JobFailed('文件格式验证失败', {
+            'errors': result['errors'],
+            'warnings': result['warnings']
+        })
+    
+    # 导入到数据库：replace 清空后全量写入，merge 只写入有变化的行
+    update_job(job_id, stage='importing', rows_processed=result['item_count'])
+    mode = job['payload'].get('mode', 'replace')
+    changes = None
+    if mode == 'merge':
+        changes = merge_import_excel_data(result)
+    else:
+        import_from_excel_data(result)
+    
+    return {
+        'message': '导入成功',
+        'mode': mode,
+        'category_count': result['category_count'],
+        'item_count': result['item_count'],
+        'changes': changes,
+        'warnings': result['warnings']
+    }
+
 @app.route('/api/import', methods=['POST'])
 def import_file():
-    """导入Excel文件"""
+    """导入Excel文件：保存上传文件后排队后台导入任务，立即返回任务ID（进度见 /api/jobs/<id>）
+    表单字段 mode: replace（默认）或 merge
+    """
     try:
         if 'file' not in request.files:
             return jsonify({'error': '没有上传文件'}), 400
@@ -1142,60 +1712,266 @@ def import_file():
         if not allowed_file(file.filename):
             return jsonify({'error': '不支持的文件格式，请上传 .xlsx 或 .xls 文件'}), 400
         
-        # 保存上传的文件
-        filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        upload_filename = f'import_{timestamp}_{filename}'
-        upload_path = os.path.join(app.config['UPLOAD_FOLDER'], upload_filename)
-        file.save(upload_path)
+        # 导入模式：replace（默认，清空后全量导入）或 merge（按分类+名称+序号合并，只写入变化）
+        mode = request.form.get('mode', 'replace')
+        if mode not in IMPORT_MODES:
+            return jsonify({'error': f'不支持的导入模式: {mode}'}), 400
         
-        # 验证文件格式
-        validation = validate_excel_format(upload_path)
-        
-        if not validation['valid']:
-            # 删除无效文件
-            os.remove(upload_path)
+        # 先直接从上传流检查表头，格式不对的文件不会写入磁盘
+        header_errors = check_excel_header(file.stream)
+        if header_errors:
             return jsonify({
                 'success': False,
                 'error': '文件格式验证失败',
-                'errors': validation['errors'],
-                'warnings': validation['warnings']
+                'errors': header_errors,
+                'warnings': []
             }), 400
         
-        # 解析Excel文件并导入到数据库
-        # 临时使用上传的文件路径进行解析
-        global EXCEL_FILE
-        original_excel_file = EXCEL_FILE
+        # 后台任务可能由其他进程执行，需要把文件交给任务（文件名带随机后缀，同一秒内的多次上传不会互相覆盖）
+        file.stream.seek(0)
+        upload_path = make_upload_path('import', file.filename)
+        file.save(upload_path)
         try:
-            # 临时设置Excel文件路径为上传的文件
-            EXCEL_FILE = upload_path
-            
-            # 解析Excel数据
-            excel_data = parse_excel()
-            
-            # 导入到数据库
-            import_from_excel_data(excel_data)
-            
-            # 恢复原Excel文件路径
-            EXCEL_FILE = original_excel_file
-        except Exception as e:
-            EXCEL_FILE = original_excel_file
-            raise e
+            job_id = enqueue_job('import', {'path': upload_path, 'filename': file.filename, 'mode': mode})
+        except Exception:
+            os.remove(upload_path)
+            raise
         
-        # 删除临时上传文件
-        os.remove(upload_path)
+        return jsonify({
+            'success': True,
+            'message': '文件已上传，正在后台导入',
+            'job_id': job_id,
+            'status_url': f'/api/jobs/{job_id}'
+        }), 202
         
-        # 从数据库获取统计信息
-        data = get_data_for_api()
+    except Exception as e:
+        import traceback
+        return jsonify({
+            'success': False,
+            'error': f'导入失败: {str(e)}',
+            'traceback': traceback.format_exc()
+        }), 500
+
+# 多工作表/多文件导入：每个工作表在进程池中单独解析，再按命名模板合并为分类
+PROJECT_IMPORT_POOL_SIZE = int(os.getenv('IMPORT_POOL_SIZE', str(min(4, os.cpu_count() or 1))))
+PROJECT_NAMING_FIELDS = {'file', 'sheet', 'category'}
+DEFAULT_PROJECT_NAMING = '{category}'
+
+def validate_naming_template(template):
+    """检查分类命名模板，只允许 {file}、{sheet}、{category} 占位符，返回错误信息（没有错误返回None）"""
+    import string
+    try:
+        fields = {field for _, field, _, _ in string.Formatter().parse(template) if field is not None}
+    except ValueError as e:
+        return f'命名模板格式错误: {e}'
+    unknown = fields - PROJECT_NAMING_FIELDS
+    if unknown:
+        return f'命名模板中有不支持的占位符: {", ".join(sorted(unknown))}（可用 {{file}}、{{sheet}}、{{category}}）'
+    if not fields:
+        return '命名模板至少需要包含一个占位符'
+    return None
+
+def list_sheet_names(path):
+    """列出工作簿中所有工作表的名称（只读模式，不加载数据）"""
+    from openpyxl import load_workbook
+    wb = load_workbook(path, read_only=True)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+def parse_sheet_task(path, sheet_name):
+    """进程池任务：解析一个工作表，返回解析结果和耗时"""
+    started = time.perf_counter()
+    result = run_import_pipeline(path, sheet_name=sheet_name)
+    result['duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return result
+
+def merge_sheet_results(sheet_results, naming=DEFAULT_PROJECT_NAMING):
+    """按命名模板把多个工作表的解析结果合并为一份导入数据
+    Args:
+        sheet_results: [(文件名, 工作表名, run_import_pipeline结果)]，按导入顺序排列
+    Returns:
+        与 run_import_pipeline 相同结构的 {'categories', 'items', ...}
+    """
+    categories = []
+    seen_categories = set()
+    items = []
+    sources = {}  # 合并后的分类 -> 来源工作表集合
+    for filename, sheet_name, result in sheet_results:
+        file_stem = filename.rsplit('.', 1)[0] if '.' in filename else filename
+        names = {}
+        for category in result['categories']:
+            names[category] = naming.format(file=file_stem, sheet=sheet_name, category=category).strip()
+            if names[category] not in seen_categories:
+                seen_categories.add(names[category])
+                categories.append(names[category])
+        for item in result['items']:
+            category = names.get(item.get('category'))
+            if category is None:
+                category = naming.format(file=file_stem, sheet=sheet_name, category=item.get('category') or '未分类').strip()
+            items.append(dict(item, category=category))
+            sources.setdefault(category, set()).add((filename, sheet_name))
+    
+    # 多个工作表合并到同一个分类时，序号按合并后的顺序重新编排，避免重复
+    next_seq = {}
+    for item in items:
+        if len(sources[item['category']]) > 1:
+            next_seq[item['category']] = next_seq.get(item['category'], 0) + 1
+            item['序号'] = next_seq[item['category']]
+    
+    return {
+        'valid': True,
+        'errors': [],
+        'warnings': [],
+        'category_count': len(categories),
+        'item_count': len(items),
+        'has_data': len(items) > 0,
+        'categories': categories,
+        'items': items,
+        'headers': list(EXCEL_HEADERS)
+    }
+
+@job_handler('import_project')
+def run_project_import_job(job):
+    """后台导入任务：发现所有文件的所有工作表，在进程池中并行解析，按命名模板合并后导入
+    （上传文件在任务结束后由 run_job 删除）
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    import multiprocessing
+    
+    job_id = job['id']
+    payload = job['payload']
+    files = payload['files']
+    naming = payload.get('naming') or DEFAULT_PROJECT_NAMING
+    mode = payload.get('mode', 'replace')
+    
+    update_job(job_id, stage='discovering', rows_processed=0)
+    tasks = []  # (文件序号, 工作表序号, 文件名, 工作表名, 路径)
+    warnings = []
+    for file_index, file_info in enumerate(files):
+        try:
+            sheet_names = list_sheet_names(file_info['path'])
+        except Exception as e:
+            warnings.append(f"{file_info['filename']}: 文件读取失败: {e}")
+            continue
+        for sheet_index, sheet_name in enumerate(sheet_names):
+            tasks.append((file_index, sheet_index, file_info['filename'], sheet_name, file_info['path']))
+    if not tasks:
+        raise JobFailed('没有可导入的工作表', {'errors': warnings, 'warnings': []})
+    
+    update_job(job_id, stage='parsing')
+    started = time.perf_counter()
+    results = {}
+    rows_processed = 0
+    pool_size = max(1, min(PROJECT_IMPORT_POOL_SIZE, len(tasks)))
+    if pool_size == 1:
+        for task in tasks:
+            results[task[:2]] = parse_sheet_task(task[4], task[3])
+            rows_processed += results[task[:2]].get('item_count', 0)
+            update_job(job_id, rows_processed=rows_processed)
+    else:
+        # spawn：后台任务运行在多线程进程中，fork 可能复制到被其他线程持有的锁
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=pool_size, mp_context=context) as pool:
+            futures = {pool.submit(parse_sheet_task, task[4], task[3]): task for task in tasks}
+            for future in as_completed(futures):
+                task = futures[future]
+                results[task[:2]] = future.result()
+                rows_processed += results[task[:2]].get('item_count', 0)
+                update_job(job_id, rows_processed=rows_processed)
+    parse_wall_ms = round((time.perf_counter() - started) * 1000, 2)
+    
+    # 按 文件顺序、工作表顺序 合并；没有表头的工作表（如说明页）跳过
+    sheets = []
+    valid_results = []
+    for file_index, sheet_index, filename, sheet_name, _ in tasks:
+        result = results[(file_index, sheet_index)]
+        sheet_report = {
+            'file': filename,
+            'sheet': sheet_name,
+            'status': 'imported' if result['valid'] else 'skipped',
+            'category_count': result.get('category_count', 0),
+            'item_count': result.get('item_count', 0),
+            'duration_ms': result.get('duration_ms'),
+            'errors': result['errors']
+        }
+        sheets.append(sheet_report)
+        if result['valid']:
+            valid_results.append((filename, sheet_name, result))
+            warnings.extend(f'{filename}/{sheet_name}: {w}' for w in result['warnings'])
+    
+    if not valid_results:
+        raise JobFailed('所有工作表都未通过格式验证', {'errors': warnings, 'warnings': [], 'sheets': sheets})
+    
+    merged = merge_sheet_results(valid_results, naming)
+    update_job(job_id, stage='importing', rows_processed=merged['item_count'])
+    changes = None
+    if mode == 'merge':
+        changes = merge_import_excel_data(merged)
+    else:
+        import_from_excel_data(merged)
+    
+    return {
+        'message': '导入成功',
+        'mode': mode,
+        'naming': naming,
+        'category_count': merged['category_count'],
+        'item_count': merged['item_count'],
+        'changes': changes,
+        'sheets': sheets,
+        'parse_wall_ms': parse_wall_ms,
+        'parse_total_ms': round(sum(sheet['duration_ms'] or 0 for sheet in sheets), 2),
+        'pool_size': pool_size,
+        'warnings': warnings
+    }
+
+@app.route('/api/import-project', methods=['POST'])
+def import_project():
+    """多文件/多工作表导入：上传一个或多个Excel文件（字段名 files），导入所有工作表
+    表单字段 naming: 分类命名模板，可用 {file}、{sheet}、{category}，默认 {category}（同名分类合并）
+    表单字段 mode: replace（默认）或 merge
+    """
+    try:
+        files = [f for f in request.files.getlist('files') if f and f.filename]
+        if not files:
+            return jsonify({'error': '没有上传文件'}), 400
+        for file in files:
+            if not allowed_file(file.filename):
+                return jsonify({'error': f'不支持的文件格式: {file.filename}，请上传 .xlsx 或 .xls 文件'}), 400
+        
+        mode = request.form.get('mode', 'replace')
+        if mode not in IMPORT_MODES:
+            return jsonify({'error': f'不支持的导入模式: {mode}'}), 400
+        naming = request.form.get('naming') or DEFAULT_PROJECT_NAMING
+        naming_error = validate_naming_template(naming)
+        if naming_error:
+            return jsonify({'error': naming_error}), 400
+        
+        saved = []
+        try:
+            for file in files:
+                upload_path = make_upload_path('project', file.filename)
+                file.save(upload_path)
+                saved.append({'path': upload_path, 'filename': file.filename})
+            job_id = enqueue_job('import_project', {
+                'files': saved,
+                'filename': '、'.join(f['filename'] for f in saved),
+                'naming': naming,
+                'mode': mode
+            })
+        except Exception:
+            for file_info in saved:
+                if os.path.exists(file_info['path']):
+                    os.remove(file_info['path'])
+            raise
         
         return jsonify({
             'success': True,
-            'message': '导入成功',
-            'category_count': len(data['categories']),
-            'item_count': len(data['items']),
-            'warnings': validation['warnings']
-        })
-        
+            'message': f'已上传 {len(saved)} 个文件，正在后台导入所有工作表',
+            'job_id': job_id,
+            'status_url': f'/api/jobs/{job_id}'
+        }), 202
     except Exception as e:
         import traceback
         return jsonify({
@@ -1204,6 +1980,115 @@ def import_file():
             'traceback': traceback.format_exc()
         }), 500
 
+# 分块断点续传上传：单个分块受 MAX_CONTENT_LENGTH 限制，整个文件不超过 MAX_CHUNKED_UPLOAD_MB
+UPLOAD_CHUNK_SIZE = 2 * 1024 * 1024
+UPLOAD_STORE = ChunkedUploadStore(
+    os.path.join(app.config['UPLOAD_FOLDER'], 'staging'),
+    max_size=int(os.getenv('MAX_CHUNKED_UPLOAD_MB', '200')) * 1024 * 1024
+)
+
+def _upload_session_json(meta, **extra):
+    """上传会话的返回格式"""
+    data = {
+        'success': True,
+        'upload_id': meta['id'],
+        'filename': meta['filename'],
+        'size': meta['size'],
+        'offset': meta['offset'],
+        'complete': meta['offset'] == meta['size'],
+        'chunk_size': UPLOAD_CHUNK_SIZE
+    }
+    data.update(extra)
+    return data
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    """新建分块上传会话：{filename, size, checksum(可选，整个文件的SHA-256), mode(导入模式)}"""
+    try:
+        data = request.get_json(silent=True) or {}
+        filename = data.get('filename', '')
+        mode = data.get('mode', 'replace')
+        
+        if not filename or not allowed_file(filename):
+            return jsonify({'error': '不支持的文件格式，请上传 .xlsx 或 .xls 文件'}), 400
+        if mode not in IMPORT_MODES:
+            return jsonify({'error': f'不支持的导入模式: {mode}'}), 400
+        try:
+            size = int(data.get('size'))
+        except (TypeError, ValueError):
+            return jsonify({'error': '缺少文件大小'}), 400
+        
+        meta = UPLOAD_STORE.create(filename, size, data.get('checksum'), extra={'mode': mode})
+        return jsonify(_upload_session_json(meta)), 201
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
+    except Exception as e:
+        import traceback
+        return jsonify({'error': str(e), 'traceback': traceback.format_exc()}), 500
+
+@app.route('/api/uploads/<upload_id>', methods=['GET', 'PUT', 'DELETE'])
+def upload_chunk(upload_id):
+    """分块上传：GET 查询已接收的偏移量，PUT ?offset=N 追加一块（请求体为原始字节，
+    可带 X-Chunk-Checksum 头校验SHA-256），DELETE 放弃上传；最后一块到达后立即排队导入任务"""
+    try:
+        if request.method == 'GET':
+            return jsonify(_upload_session_json(UPLOAD_STORE.status(upload_id)))
+        
+        if request.method == 'DELETE':
+            UPLOAD_STORE.discard(upload_id)
+            return jsonify({'success': True, 'message': '上传已取消'})
+        
+        offset = request.args.get('offset', type=int)
+        if offset is None:
+            return jsonify({'error': '缺少偏移量参数 offset'}), 400
+        
+        meta = UPLOAD_STORE.append(upload_id, offset, request.stream,
+                                   checksum=request.headers.get('X-Chunk-Checksum'))
+        if meta['offset'] < meta['size']:
+            return jsonify(_upload_session_json(meta))
+        
+        # 最后一块：移动到上传目录并立即开始后台导入
+        upload_path = make_upload_path('import', meta['filename'])
+        UPLOAD_STORE.finish(upload_id, upload_path)
+        job_id = enqueue_job('import', {
+            'path': upload_path,
+            'filename': meta['filename'],
+            'mode': meta['extra'].get('mode', 'replace')
+        })
+        return jsonify(_upload_session_json(meta, job_id=job_id, status_url=f'/api/jobs/{job_id}'))
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e), 'offset': e.offset}), e.status
+    except Exception as e:
+        import traceback
+        return jsonify({'error': str(e), 'traceback': traceback.format_exc()}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """查询后台任务状态：阶段、已处理行数、结果或错误"""
+    try:
+        job = get_job(job_id)
+        if job is None:
+            return jsonify({'success': False, 'error': '任务不存在'}), 404
+        
+        return jsonify({
+            'success': True,
+            'job': {
+                'id': job['id'],
+                'kind': job['kind'],
+                'status': job['status'],
+                'stage': job['stage'],
+                'rows_processed': job['rows_processed'],
+                'filename': job['payload'].get('filename'),
+                'result': job['result'],
+                'error': job['error'],
+                'created_at': job['created_at'],
+                'updated_at': job['updated_at']
+            }
+        })
+    except Exception as e:
+        import traceback
+        return jsonify({'error': str(e), 'traceback': traceback.format_exc()}), 500
+
 @app.route('/api/validate', methods=['POST'])
 def validate_file():
     """验证Excel文件格式（不导入）"""
@@ -1219,18 +2104,8 @@ def validate_file():
         if not allowed_file(file.filename):
             return jsonify({'error': '不支持的文件格式，请上传 .xlsx 或 .xls 文件'}), 400
         
-        # 保存临时文件
-        filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        upload_filename = f'validate_{timestamp}_{filename}'
-        upload_path = os.path.join(app.config['UPLOAD_FOLDER'], upload_filename)
-        file.save(upload_path)
-        
-        # 验证文件格式
-        validation = validate_excel_format(upload_path)
-        
-        # 删除临时文件
-        os.remove(upload_path)
+        # 直接从上传流验证（内存缓冲，大文件才转存匿名临时文件），表头错误时提前结束
+        validation = validate_excel_format(file.stream)
         
         return jsonify({
             'success': True,
@@ -1249,11 +2124,14 @@ def validate_file():
             'traceback': traceback.format_exc()
         }), 500
 
-def add_grand_total_to_excel(file_path):
+def add_grand_total_to_excel(file_path, session=None):
     """在Excel文件末尾添加总合计行"""
-    # 先更新所有合计行，确保合计值是最新的
-    wb = load_workbook(file_path)
-    ws = wb.active
+    if session is None:
+        with ExcelSession(file_path) as session:
+            return add_grand_total_to_excel(file_path, session=session)
+    
+    ws = session.ws
+    sheet = session.sheet
     
     # 找到所有分类行和对应的合计行，直接累加数据行的值
     grand_total_1st = 0
@@ -1265,13 +2143,13 @@ def add_grand_total_to_excel(file_path):
     
     # 直接遍历所有数据行，累加所有数字序号行的费用
     for i in range(header_row + 1, ws.max_row + 1):
-        first_cell = safe_get_cell_value(ws, i, 1)
+        first_cell = safe_get_cell_value(sheet, i, 1)
         # 检查是否是数据行（序号是数字）
         if first_cell and str(first_cell).strip().isdigit():
             # 列顺序：1st预算(5), 2nd预算(6), 实际花费(7), 差价(8)
-            val_1st = safe_get_cell_value(ws, i, 5)
-            val_2nd = safe_get_cell_value(ws, i, 6)
-            val_actual = safe_get_cell_value(ws, i, 7)
+            val_1st = safe_get_cell_value(sheet, i, 5)
+            val_2nd = safe_get_cell_value(sheet, i, 6)
+            val_actual = safe_get_cell_value(sheet, i, 7)
             
             if val_1st and isinstance(val_1st, (int, float)):
                 grand_total_1st += float(val_1st)
@@ -1287,162 +2165,236 @@ def add_grand_total_to_excel(file_path):
     insert_row = ws.max_row + 1
     
     # 添加空行分隔
-    ws.insert_rows(insert_row)
+    sheet.insert_rows(insert_row)
     insert_row += 1
     
     # 添加总合计行
-    ws.cell(insert_row, 1, value='总计')
-    safe_set_cell_value(ws, insert_row, 5, grand_total_1st if grand_total_1st > 0 else None)  # 1st预算
-    safe_set_cell_value(ws, insert_row, 6, grand_total_2nd if grand_total_2nd > 0 else None)  # 2nd预算
-    safe_set_cell_value(ws, insert_row, 7, grand_total_actual if grand_total_actual > 0 else None)  # 实际花费
-    safe_set_cell_value(ws, insert_row, 8, grand_total_diff if grand_total_diff != 0 else None)  # 差价
-    
-    wb.save(file_path)
-    wb.close()
-
-def rebuild_excel_from_data():
-    """基于数据库数据重新构建Excel文件"""
-    # 从数据库获取当前数据
-    data = get_data_for_api()
-    categories = data['categories']
-    items = data['items']
-    
-    # 创建新的工作簿
-    wb = Workbook()
-    ws = wb.active
-    
-    # 设置列宽
-    ws.column_dimensions['A'].width = 8
-    ws.column_dimensions['B'].width = 25
-    ws.column_dimensions['C'].width = 8
-    ws.column_dimensions['D'].width = 10
-    ws.column_dimensions['E'].width = 12
-    ws.column_dimensions['F'].width = 12
-    ws.column_dimensions['G'].width = 12
-    ws.column_dimensions['H'].width = 12
-    ws.column_dimensions['I'].width = 40
-    
-    # 先计算总合计
-    grand_total_1st = 0
-    grand_total_2nd = 0
-    grand_total_actual = 0
-    grand_total_diff = 0
-    
-    # 累加所有项目的值
-    for item in items:
-        val_1st = float(item.get('1st预算费用', 0) or 0) if item.get('1st预算费用') and str(item.get('1st预算费用')).replace('.','').isdigit() else 0
-        val_2nd = float(item.get('2nd预算费用', 0) or 0) if item.get('2nd预算费用') and str(item.get('2nd预算费用')).replace('.','').isdigit() else val_1st
-        val_actual = float(item.get('最终实际花费', 0) or 0) if item.get('最终实际花费') and str(item.get('最终实际花费')).replace('.','').isdigit() else 0
-        
-        grand_total_1st += val_1st
-        grand_total_2nd += val_2nd
-        grand_total_actual += val_actual
-    
-    grand_total_diff = grand_total_2nd - grand_total_actual
-    
-    # 在文件开头添加总合计行
-    current_row = 1
-    
-    # 添加总合计行
-    ws.cell(current_row, 1, value='总计')
-    ws.cell(current_row, 5, value=grand_total_1st if grand_total_1st > 0 else None)
-    ws.cell(current_row, 6, value=grand_total_2nd if grand_total_2nd > 0 else None)
-    ws.cell(current_row, 7, value=grand_total_actual if grand_total_actual > 0 else None)
-    ws.cell(current_row, 8, value=grand_total_diff if grand_total_diff != 0 else None)
-    current_row += 1
-    
-    # 添加空行分隔
-    current_row += 1
-    
-    # 按分类组织数据
-    items_by_category = {}
-    for item in items:
-        cat = item.get('category', '未分类')
-        if cat not in items_by_category:
-            items_by_category[cat] = []
-        items_by_category[cat].append(item)
-    
-    # 数字到中文前缀的映射
-    num_to_prefix = {1: '一、', 2: '二、', 3: '三、', 4: '四、', 5: '五、', 6: '六、', 7: '七、', 8: '八、', 9: '九、', 10: '十、'}
-    
-    # 遍历所有分类（包括前端显示的）
-    for idx, category in enumerate(categories, 1):
-        prefix = num_to_prefix.get(idx, '')
-        
-        # 添加分类行
-        ws.cell(current_row, 1, value=f"{prefix}{category}")
-        current_row += 1
-        
-        # 添加表头行
-        ws.cell(current_row, 1, value='序号')
-        ws.cell(current_row, 2, value='项目')
-        ws.cell(current_row, 3, value='单位')
-        ws.cell(current_row, 4, value='预算数量')
-        ws.cell(current_row, 5, value='预算费用')
-        ws.cell(current_row, 6, value='当前投入')
-        ws.cell(current_row, 7, value='最终花费')
-        ws.cell(current_row, 8, value='差价')
-        ws.cell(current_row, 9, value='备注：选购意向（网购/实体店，品牌，型号等）')
-        current_row += 1
-        
-        # 添加该分类下的项目
-        category_items = items_by_category.get(category, [])
-        category_total_budget = 0
-        category_total_current = 0
-        category_total_final = 0
-        category_total_diff = 0
-        
-        # 每个分类的序号从1开始重新生成
-        seq_num_in_category = 0
-        
-        for item in category_items:
-            # 解析数值（兼容旧格式）
-            val_1st = float(item.get('1st预算费用', 0) or 0) if item.get('1st预算费用') and str(item.get('1st预算费用')).replace('.','').replace('-','').isdigit() else 0
-            val_2nd = float(item.get('2nd预算费用', 0) or 0) if item.get('2nd预算费用') and str(item.get('2nd预算费用')).replace('.','').replace('-','').isdigit() else 0
-            val_budget = float(item.get('预算费用', 0) or 0) if item.get('预算费用') and str(item.get('预算费用')).replace('.','').replace('-','').isdigit() else (val_2nd if val_2nd > 0 else val_1st)
-            val_current = float(item.get('当前投入', 0) or 0) if item.get('当前投入') and str(item.get('当前投入')).replace('.','').replace('-','').isdigit() else (float(item.get('最终实际花费', 0) or 0) if item.get('最终实际花费') and str(item.get('最终实际花费')).replace('.','').replace('-','').isdigit() else 0)
-            val_final = float(item.get('最终花费', 0) or 0) if item.get('最终花费') and str(item.get('最终花费')).replace('.','').replace('-','').isdigit() else 0
+    safe_set_cell_value(sheet, insert_row, 1, '总计')
+    safe_set_cell_value(sheet, insert_row, 5, grand_total_1st if grand_total_1st > 0 else None)  # 1st预算
+    safe_set_cell_value(sheet, insert_row, 6, grand_total_2nd if grand_total_2nd > 0 else None)  # 2nd预算
+    safe_set_cell_value(sheet, insert_row, 7, grand_total_actual if grand_total_actual > 0 else None)  # 实际花费
+    safe_set_cell_value(sheet, insert_row, 8, grand_total_diff if grand_total_diff != 0 else None)  # 差价
+
+# 导出表格的列宽（A-I）
+EXPORT_COLUMN_WIDTHS = {'A': 8, 'B': 25, 'C': 8, 'D': 10, 'E': 12, 'F': 12, 'G': 12, 'H': 12, 'I': 40}
+EXPORT_CATEGORY_HEADER = ['序号', '项目', '单位', '预算数量', '预算费用', '当前投入', '最终花费', '差价', '备注：选购意向（网购/实体店，品牌，型号等）']
+
+# 部分导出：可选择的列（与 EXPORT_CATEGORY_HEADER 顺序一致），序号列始终保留（合计行、总计行的标签在这一列）
+EXPORT_FIELDS = ('seq_num', 'project_name', 'unit', 'budget_quantity', 'budget_cost',
+                 'current_investment', 'final_cost', 'diff', 'remark')
+EXPORT_FIELD_ALIASES = {**ITEM_FIELD_COLUMNS, '序号': 'seq_num', '项目名称': 'project_name', '数量': 'budget_quantity'}
+# 导出筛选：查询参数名与 build_item_filter 的筛选键相同；这些键可以重复或用逗号分隔传多个值
+EXPORT_FILTER_KEYS = ('category', 'category_id', 'status', 'empty', 'name_contains', 'remark_contains',
+                      'budget_min', 'budget_max', 'current_min', 'current_max',
+                      'final_min', 'final_max', 'diff_min', 'diff_max')
+EXPORT_LIST_FILTERS = ('category', 'category_id', 'status', 'empty')
+
+def parse_export_options(args):
+    """从查询参数解析部分导出的筛选条件和列，返回 (filters, columns)；没有指定时为 ({}, None)
+    例如 ?category=厨房&category=卫生间&status=pending&budget_min=100&columns=项目,预算费用,备注
+    列名可以用表头的中文名或数据库列名；参数不合法时抛出 ValueError
+    """
+    filters = {}
+    for key in EXPORT_FILTER_KEYS:
+        if key in EXPORT_LIST_FILTERS:
+            values = args.getlist(key)
+            if key in ('status', 'empty', 'category_id'):
+                values = [part for value in values for part in value.split(',')]
+            values = sorted({value.strip() for value in values if value.strip()})
+            if values:
+                filters[key] = values
+        else:
+            value = args.get(key, '').strip()
+            if value:
+                filters[key] = value
+    # 提前校验（生成文件时才发现条件错误会变成500）
+    try:
+        build_item_filter(filters)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'导出筛选条件错误: {e}')
+    
+    columns = None
+    requested = [name.strip() for name in args.get('columns', '').split(',') if name.strip()]
+    if requested:
+        selected = {'seq_num'}
+        for name in requested:
+            field = EXPORT_FIELD_ALIASES.get(name, name)
+            if field not in EXPORT_FIELDS:
+                raise ValueError(f'不支持导出的列: {name}（可用 序号、{"、".join(ITEM_FIELD_COLUMNS)}）')
+            selected.add(field)
+        if len(selected) < len(EXPORT_FIELDS):
+            columns = [field for field in EXPORT_FIELDS if field in selected]
+    return filters, columns
+
+def export_cache_options(filters=None, columns=None, **options):
+    """导出缓存的选项：筛选条件和列只在指定时加入（完整导出的缓存键不变）"""
+    if filters:
+        options['filters'] = filters
+    if columns:
+        options['columns'] = columns
+    return options
+
+def _export_total_row(label, budget, current, final):
+    """合计/总计行（列顺序：预算费用(5), 当前投入(6), 最终花费(7), 差价(8)）"""
+    diff = budget - final
+    return [label, None, None, None,
+            budget if budget > 0 else None,
+            current if current > 0 else None,
+            final if final > 0 else None,
+            diff if diff != 0 else None]
+
+def iter_export_rows(filters=None, columns=None):
+    """按导出格式逐行产出Excel行（总计行 → 空行 → 每个分类：分类行、表头行、项目行、合计行）
+    filters 见 build_item_filter（在数据库查询中筛选）；columns 为要输出的列（EXPORT_FIELDS 的子集），None 为全部
+    """
+    records = iter_export_records(filters)
+    category_index = 0
+    category_open = False
+    total_budget = total_current = total_final = 0
+    seq_num_in_category = 0
+    
+    indexes = [EXPORT_FIELDS.index(field) for field in columns] if columns else None
+    
+    def project(row):
+        """只保留选中的列（合计行比项目行短，缺少的列为空）"""
+        if indexes is None:
+            return row
+        return [row[i] if i < len(row) else None for i in indexes]
+    
+    for kind, record in records:
+        if kind == 'totals':
+            # 总计行放在开头，数值由SQL一次汇总得到
+            yield project(_export_total_row('总计', record['budget_cost'] or 0,
+                                            record['current_investment'] or 0, record['final_cost'] or 0))
+            yield []
+        elif kind == 'category':
+            if category_open:
+                yield project(_export_total_row('合计', total_budget, total_current, total_final))
+            category_index += 1
+            category_open = True
+            total_budget = total_current = total_final = 0
+            seq_num_in_category = 0  # 每个分类的序号从1开始重新生成
+            yield [f"{int_to_chinese_numeral(category_index)}、{record['name']}"]
+            yield project(list(EXPORT_CATEGORY_HEADER))
+        else:
+            val_budget = record['budget_cost'] or 0
+            val_current = record['current_investment'] or 0
+            val_final = record['final_cost'] or 0
             
             # 计算差价（预算费用 - 最终花费）
             val_diff = val_budget - val_final
             
-            # 累加分类合计
-            category_total_budget += val_budget
-            category_total_current += val_current
-            category_total_final += val_final
-            category_total_diff += val_diff
-            
-            # 重新生成序号（每个分类从1开始）
+            total_budget += val_budget
+            total_current += val_current
+            total_final += val_final
             seq_num_in_category += 1
             
-            ws.cell(current_row, 1, value=seq_num_in_category)
-            ws.cell(current_row, 2, value=item.get('项目', ''))
-            ws.cell(current_row, 3, value=item.get('单位', '') if item.get('单位') else None)
-            ws.cell(current_row, 4, value=item.get('预算数量', '') if item.get('预算数量') else None)
-            ws.cell(current_row, 5, value=val_budget if val_budget > 0 else None)
-            ws.cell(current_row, 6, value=val_current if val_current > 0 else None)
-            ws.cell(current_row, 7, value=val_final if val_final > 0 else None)
-            ws.cell(current_row, 8, value=val_diff if val_diff != 0 else None)
-            ws.cell(current_row, 9, value=item.get('备注', '') if item.get('备注') else None)
-            current_row += 1
-        
-        # 添加分类合计行
-        ws.cell(current_row, 1, value='合计')
-        ws.cell(current_row, 5, value=category_total_budget if category_total_budget > 0 else None)
-        ws.cell(current_row, 6, value=category_total_current if category_total_current > 0 else None)
-        ws.cell(current_row, 7, value=category_total_final if category_total_final > 0 else None)
-        ws.cell(current_row, 8, value=category_total_diff if category_total_diff != 0 else None)
-        current_row += 1
+            yield project([
+                seq_num_in_category,
+                record['project_name'] or '',
+                record['unit'] or None,
+                record['budget_quantity'] or None,
+                val_budget if val_budget > 0 else None,
+                val_current if val_current > 0 else None,
+                val_final if val_final > 0 else None,
+                val_diff if val_diff != 0 else None,
+                record['remark'] or None,
+            ])
+    
+    if category_open:
+        yield project(_export_total_row('合计', total_budget, total_current, total_final))
+
+def rebuild_excel_from_data(filters=None, columns=None):
+    """基于数据库数据重新构建Excel文件（write_only模式，逐行写入，内存占用与行数无关）
+    filters / columns 用于部分导出，见 iter_export_rows
+    
+    返回的工作簿只能保存一次
+    """
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+    
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    
+    # 设置列宽（write_only模式下必须在写入行之前设置）；部分导出时各列沿用原来的宽度
+    widths = list(EXPORT_COLUMN_WIDTHS.values())
+    for position, field in enumerate(columns or EXPORT_FIELDS, start=1):
+        ws.column_dimensions[get_column_letter(position)].width = widths[EXPORT_FIELDS.index(field)]
+    
+    for row in iter_export_rows(filters, columns):
+        ws.append(row)
     
     return wb
 
-def register_chinese_fonts():
-    """注册中文字体（只执行一次，使用缓存）"""
-    global _CHINESE_FONT_REGISTERED, _CHINESE_FONT_NAME, _TEMP_FONT_FILE
+# 中文字体候选（按优先级）：项目 fonts/ 目录中的字体最快，其次是系统TTF，最后才从系统TTC字体集合中提取
+_FONT_DIR = os.path.join(os.path.dirname(__file__), 'fonts')
+LOCAL_FONT_FILES = [
+    os.path.join(_FONT_DIR, 'PingFang-Regular.ttf'),  # 苹方（优先，更现代美观）
+    os.path.join(_FONT_DIR, 'SimHei.ttf'),  # 黑体（已提取的PingFang）
+    os.path.join(_FONT_DIR, 'SimSun.ttf'),   # 宋体
+    os.path.join(_FONT_DIR, 'Arial Unicode.ttf'),  # Arial Unicode（支持中文）
+    os.path.join(_FONT_DIR, 'NotoSansCJK-Regular.ttf'),  # 思源黑体
+    os.path.join(_FONT_DIR, 'SourceHanSansCN-Regular.otf'),  # 思源黑体OTF
+]
+SYSTEM_FONT_FILES = [
+    '/Library/Fonts/Microsoft/SimHei.ttf',  # 黑体（macOS）
+    '/Library/Fonts/Microsoft/SimSun.ttf',  # 宋体（macOS）
+    '/System/Library/Fonts/PingFang.ttc',  # 苹方（TTC，需要提取）
+    '/System/Library/Fonts/STHeiti Light.ttc',  # 黑体
+    '/System/Library/Fonts/STHeiti Medium.ttc',
+]
+
+# 字体缓存：TTC提取出的字体和子集字体保存在磁盘上，所有worker共享
+# PDF_FONT_SUBSET=false 时直接注册完整字体（reportlab嵌入时仍会只嵌入用到的字形，但解析完整CJK字体很慢）
+FONT_CACHE = FontCache(
+    os.getenv('FONT_CACHE_DIR', os.path.join(DATA_DIR, 'font_cache')),
+    max_subsets=int(os.getenv('FONT_CACHE_MAX_SUBSETS', '16')),
+    max_bytes=int(os.getenv('FONT_CACHE_MAX_MB', '200')) * 1024 * 1024
+)
+PDF_FONT_SUBSET = os.getenv('PDF_FONT_SUBSET', 'True').lower() == 'true'
+_CHINESE_FONT_SOURCE = None  # 选中的完整字体文件（None：还没有查找；''：没有可用的中文字体）
+_REGISTERED_FONT_FILES = {}  # 已注册的字体文件 -> 字体名
+_FONT_LOCK = threading.Lock()
+# 每个进程最多注册的字体文件数：每种额外字符组合都是一个新的子集字体，reportlab注册后不能注销，
+# 达到上限后遇到新的字符组合时改用完整字体（只注册一次，包含所有字符）
+PDF_FONT_MAX_REGISTERED = int(os.getenv('PDF_FONT_MAX_REGISTERED', '8'))
+
+def _prepare_font_file(source_path, text=''):
+    """返回实际要注册的字体文件：启用子集时是包含常用汉字和text中所有字符的子集字体
+    字符集相同的子集使用同一个文件（文件名是字符集的哈希），已注册的直接复用
+    """
+    if not PDF_FONT_SUBSET:
+        return source_path
+    chars = base_charset()
+    extra = set(text) - chars
+    if extra:
+        chars = chars | extra
+    try:
+        if (FONT_CACHE.subset_path(source_path, chars) not in _REGISTERED_FONT_FILES
+                and len(_REGISTERED_FONT_FILES) >= PDF_FONT_MAX_REGISTERED):
+            return source_path
+        return FONT_CACHE.subset(source_path, chars)
+    except Exception as e:
+        print(f"⚠️ 生成子集字体失败，使用完整字体: {e}")
+        return source_path
+
+def _register_font_file(font_path):
+    """注册字体文件（每个文件在每个进程中只注册一次），返回字体名"""
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
     
-    # 如果已经注册过，直接返回缓存的结果
-    if _CHINESE_FONT_REGISTERED:
-        return _CHINESE_FONT_REGISTERED, _TEMP_FONT_FILE
+    font_name = _REGISTERED_FONT_FILES.get(font_path)
+    if font_name is None:
+        font_name = 'ChineseFont' if not _REGISTERED_FONT_FILES else f'ChineseFont{len(_REGISTERED_FONT_FILES) + 1}'
+        pdfmetrics.registerFont(TTFont(font_name, font_path))
+        _REGISTERED_FONT_FILES[font_path] = font_name
+    return font_name
+
+def register_chinese_fonts(text=''):
+    """注册中文字体，返回 (是否成功, 字体名)
+    text 为PDF中要显示的文字：包含常用字符集以外的字符时，会使用（并缓存）额外包含这些字符的子集字体
+    """
+    global _CHINESE_FONT_REGISTERED, _CHINESE_FONT_NAME, _CHINESE_FONT_SOURCE
     
     import warnings
     import logging
@@ -1451,690 +2403,1040 @@ def register_chinese_fonts():
     logging.getLogger('fontTools').setLevel(logging.ERROR)
     warnings.filterwarnings('ignore', category=UserWarning)
     
-    # 尝试注册中文字体
-    font_registered = False
-    temp_font_file = None
-    
-    # 优先使用项目本地的字体文件（最快，无需提取）
-    # 优先使用PingFang（更现代、更美观）
-    local_font_paths = [
-        os.path.join(os.path.dirname(__file__), 'fonts', 'PingFang-Regular.ttf'),  # 苹方（优先，更现代美观）
-        os.path.join(os.path.dirname(__file__), 'fonts', 'SimHei.ttf'),  # 黑体（已提取的PingFang）
-        os.path.join(os.path.dirname(__file__), 'fonts', 'SimSun.ttf'),   # 宋体
-        os.path.join(os.path.dirname(__file__), 'fonts', 'Arial Unicode.ttf'),  # Arial Unicode（支持中文）
-        os.path.join(os.path.dirname(__file__), 'fonts', 'NotoSansCJK-Regular.ttf'),  # 思源黑体
-        os.path.join(os.path.dirname(__file__), 'fonts', 'SourceHanSansCN-Regular.otf'),  # 思源黑体OTF
-    ]
-    
-    for font_path in local_font_paths:
-        if os.path.exists(font_path):
-            try:
-                pdfmetrics.registerFont(TTFont('ChineseFont', font_path))
-                font_registered = True
+    with _FONT_LOCK:
+        if _CHINESE_FONT_SOURCE is None:
+            # 第一次调用：按优先级查找第一个能成功注册的字体
+            _CHINESE_FONT_SOURCE = ''
+            for font_path in LOCAL_FONT_FILES + SYSTEM_FONT_FILES:
+                if not os.path.exists(font_path):
+                    continue
+                try:
+                    if font_path.lower().endswith('.ttc'):
+                        # 从TTC提取第一个字体（只在字体缓存中没有时提取）
+                        font_path = FONT_CACHE.extract_ttc(font_path)
+                    _CHINESE_FONT_NAME = _register_font_file(_prepare_font_file(font_path, text))
+                except Exception:
+                    continue
+                _CHINESE_FONT_SOURCE = font_path
+                _CHINESE_FONT_REGISTERED = True
                 break
-            except Exception as e:
-                continue
-    
-    # 如果本地字体不可用，尝试系统字体
-    if not font_registered:
-        import platform
-        import tempfile
+        elif _CHINESE_FONT_SOURCE:
+            _CHINESE_FONT_NAME = _register_font_file(_prepare_font_file(_CHINESE_FONT_SOURCE, text))
         
-        if platform.system() == 'Darwin':  # macOS
-            # 优先尝试TTF文件
-            ttf_paths = [
-                '/Library/Fonts/Microsoft/SimHei.ttf',  # 黑体
-                '/Library/Fonts/Microsoft/SimSun.ttf',  # 宋体
-            ]
-            
-            for font_path in ttf_paths:
-                if os.path.exists(font_path):
-                    try:
-                        pdfmetrics.registerFont(TTFont('ChineseFont', font_path))
-                        font_registered = True
-                        break
-                    except:
-                        continue
-            
-            # 如果TTF文件不可用，尝试从TTC提取（最慢）
-            if not font_registered:
-                ttc_paths = [
-                    '/System/Library/Fonts/PingFang.ttc',  # 苹方
-                    '/System/Library/Fonts/STHeiti Light.ttc',  # 黑体
-                    '/System/Library/Fonts/STHeiti Medium.ttc',
-                ]
-                
-                try:
-                    from fontTools.ttLib import TTFont as FTTTFont
-                    
-                    # 抑制fonttools的警告
-                    import sys
-                    original_stderr = sys.stderr
-                    try:
-                        # 临时重定向stderr以抑制警告
-                        sys.stderr = open(os.devnull, 'w')
-                        
-                        for ttc_path in ttc_paths:
-                            if os.path.exists(ttc_path):
-                                try:
-                                    # 从TTC文件中提取第一个字体（编号0）
-                                    ttc = FTTTFont(ttc_path, fontNumber=0)
-                                    if len(ttc.getGlyphSet()) > 0:
-                                        # 创建临时TTF文件
-                                        temp_font_file = tempfile.NamedTemporaryFile(delete=False, suffix='.ttf')
-                                        ttc.save(temp_font_file.name)
-                                        temp_font_file.close()
-                                        
-                                        # 注册临时字体文件
-                                        pdfmetrics.registerFont(TTFont('ChineseFont', temp_font_file.name))
-                                        font_registered = True
-                                        break
-                                except Exception as e:
-                                    continue
-                    finally:
-                        # 恢复stderr
-                        sys.stderr.close()
-                        sys.stderr = original_stderr
-                except ImportError:
-                    # fonttools未安装，跳过TTC处理
-                    pass
-    
-    # 缓存结果
-    _CHINESE_FONT_REGISTERED = font_registered
-    _CHINESE_FONT_NAME = 'ChineseFont' if font_registered else 'Helvetica'
-    _TEMP_FONT_FILE = temp_font_file
-    
-    return font_registered, temp_font_file
-
-def generate_pdf():
-    """使用reportlab生成PDF（从数据库读取数据）"""
-    global _CHINESE_FONT_NAME
-    
+        return _CHINESE_FONT_REGISTERED, _CHINESE_FONT_NAME
+
+def pdf_generated_at():
+    """PDF中显示的生成时间（精确到分钟），在生成PDF时取值
+    缓存的PDF显示的是它实际生成的时间；导出缓存只按数据版本号和导出选项区分，数据没变时一直复用
+    """
+    return datetime.now().strftime('%Y年%m月%d日 %H:%M')
+
+def generate_pdf(filters=None, columns=None, output=None, generated_at=None):
+    """使用reportlab生成PDF（从数据库读取数据），返回 output
+    filters / columns 用于部分导出：筛选条件在数据库查询中执行，columns 为要输出的列（EXPORT_FIELDS 的子集）
+    output 为文件路径或二进制文件对象；不传时写入 EXPORT_FOLDER 下随机命名的文件（同时进行的多个导出不会写同一个文件）
+    generated_at 为显示的生成时间（见 pdf_generated_at），不传时取当前时间
+    """
     import warnings
     import logging
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import cm
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.enums import TA_CENTER, TA_LEFT
     
     # 抑制fonttools和reportlab的警告
     warnings.filterwarnings('ignore', category=UserWarning)
     warnings.filterwarnings('ignore', message='.*CFF.*')
     logging.getLogger('fontTools').setLevel(logging.ERROR)
     
-    # 注册中文字体（使用缓存，只注册一次）
-    chinese_font_registered, temp_font_file = register_chinese_fonts()
-    chinese_font_name = _CHINESE_FONT_NAME
-    
-    try:
-        # 从数据库获取数据
-        data = get_data_for_api()
-        categories = data['categories']
-        items = data['items']
-        
-        # 按分类组织数据
-        items_by_category = {}
-        for item in items:
-            cat = item.get('category', '未分类')
-            if cat not in items_by_category:
-                items_by_category[cat] = []
-            items_by_category[cat].append(item)
-        
-        # 计算总合计（使用新字段名）
-        grand_total_budget = 0
-        grand_total_current = 0
-        grand_total_final = 0
-        grand_total_diff = 0
-        
-        for item in items:
-            val_budget = float(item.get('预算费用', 0) or 0) if item.get('预算费用') and str(item.get('预算费用')).replace('.','').isdigit() else 0
-            val_current = float(item.get('当前投入', 0) or 0) if item.get('当前投入') and str(item.get('当前投入')).replace('.','').isdigit() else 0
-            val_final = float(item.get('最终花费', 0) or 0) if item.get('最终花费') and str(item.get('最终花费')).replace('.','').isdigit() else 0
-            
-            grand_total_budget += val_budget
-            grand_total_current += val_current
-            grand_total_final += val_final
-        
-        grand_total_diff = grand_total_budget - grand_total_final
-        
-        def format_number(value):
-            """格式化数字"""
-            if not value or str(value).strip() == '':
-                return '0.00'
-            try:
-                num = float(value)
-                return f'{num:,.2f}'
-            except:
-                return '0.00'
-        
-        # 创建PDF文档
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        export_filename = f'红玺台复式装修预算表_导出_{timestamp}.pdf'
-        export_path = os.path.join(app.config['EXPORT_FOLDER'], export_filename)
-        
-        doc = SimpleDocTemplate(export_path, pagesize=A4,
-                               rightMargin=2*cm, leftMargin=2*cm,
-                               topMargin=2*cm, bottomMargin=2*cm)
-        
-        # 创建样式（使用中文字体）
-        styles = getSampleStyleSheet()
-        
-        # 自定义样式（使用中文字体）
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontName=chinese_font_name,
-            fontSize=20,
-            textColor=colors.HexColor('#667eea'),
-            alignment=TA_CENTER,
-            spaceAfter=20
-        )
-        
-        header_style = ParagraphStyle(
-            'CustomHeader',
-            parent=styles['Heading2'],
-            fontName=chinese_font_name,
-            fontSize=14,
-            textColor=colors.white,
-            backColor=colors.HexColor('#667eea'),
-            alignment=TA_LEFT,
-            spaceAfter=10,
-            spaceBefore=10,
-            leftIndent=10,
-            rightIndent=10
-        )
-        
-        summary_style = ParagraphStyle(
-            'CustomSummary',
-            parent=styles['Normal'],
-            fontName=chinese_font_name,
-            fontSize=11,
-            alignment=TA_CENTER,
-            textColor=colors.HexColor('#667eea'),
-            spaceAfter=15
-        )
-        
-        normal_style = ParagraphStyle(
-            'CustomNormal',
-            parent=styles['Normal'],
-            fontName=chinese_font_name,
-            fontSize=9
-        )
-        
-        # 备注样式（更小的字体）
-        remark_style = ParagraphStyle(
-            'Remark',
-            parent=styles['Normal'],
-            fontName=chinese_font_name,
-            fontSize=7,  # 备注使用7号字体，比正文小
-            textColor=colors.HexColor('#666666'),
-            leading=8  # 行距
-        )
-        
-        time_style = ParagraphStyle(
-            'Time',
-            parent=styles['Normal'],
-            fontName=chinese_font_name,
-            fontSize=10,
-            textColor=colors.grey,
-            alignment=TA_CENTER
-        )
-        
-        footer_style = ParagraphStyle(
-            'Footer',
-            parent=styles['Normal'],
-            fontName=chinese_font_name,
-            fontSize=8,
-            textColor=colors.grey,
-            alignment=TA_CENTER
-        )
+    # 从数据库获取数据（按分类分组，总合计由SQL汇总，两者来自同一个读事务）
+    totals, sections = load_pdf_sections(filters)
+    
+    # 注册中文字体（字体文件来自字体缓存，子集包含预算表中用到的所有字符）
+    chinese_font_registered, chinese_font_name = register_chinese_fonts(_pdf_sections_text(sections))
+    
+    # 计算总合计
+    grand_total_budget = totals['budget_cost']
+    grand_total_current = totals['current_investment']
+    grand_total_final = totals['final_cost']
+    grand_total_diff = grand_total_budget - grand_total_final
+    
+    # 部分导出时只保留选中的列，列宽按比例放大到与整页表格同宽
+    fields = list(columns or EXPORT_FIELDS)
+    indexes = [EXPORT_FIELDS.index(field) for field in fields]
+    full_widths = [0.8, 4, 1, 1, 1.8, 1.8, 1.8, 1.8, 2]
+    width_scale = 16 / sum(full_widths[i] for i in indexes)
+    col_widths = [full_widths[i] * width_scale * cm for i in indexes]
+    
+    def format_number(value):
+        """格式化数字"""
+        if not value or str(value).strip() == '':
+            return '0.00'
+        try:
+            num = float(value)
+            return f'{num:,.2f}'
+        except:
+            return '0.00'
+    
+    # 创建PDF文档
+    if output is None:
+        output = os.path.join(app.config['EXPORT_FOLDER'], f'pdf_{uuid.uuid4().hex}.pdf')
+    
+    doc = SimpleDocTemplate(output, pagesize=A4,
+                           rightMargin=2*cm, leftMargin=2*cm,
+                           topMargin=2*cm, bottomMargin=2*cm)
+    
+    # 创建样式（使用中文字体）
+    styles = getSampleStyleSheet()
+    
+    # 自定义样式（使用中文字体）
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontName=chinese_font_name,
+        fontSize=20,
+        textColor=colors.HexColor('#667eea'),
+        alignment=TA_CENTER,
+        spaceAfter=20
+    )
+    
+    header_style = ParagraphStyle(
+        'CustomHeader',
+        parent=styles['Heading2'],
+        fontName=chinese_font_name,
+        fontSize=14,
+        textColor=colors.white,
+        backColor=colors.HexColor('#667eea'),
+        alignment=TA_LEFT,
+        spaceAfter=10,
+        spaceBefore=10,
+        leftIndent=10,
+        rightIndent=10
+    )
+    
+    summary_style = ParagraphStyle(
+        'CustomSummary',
+        parent=styles['Normal'],
+        fontName=chinese_font_name,
+        fontSize=11,
+        alignment=TA_CENTER,
+        textColor=colors.HexColor('#667eea'),
+        spaceAfter=15
+    )
+    
+    normal_style = ParagraphStyle(
+        'CustomNormal',
+        parent=styles['Normal'],
+        fontName=chinese_font_name,
+        fontSize=9
+    )
+    
+    # 备注样式（更小的字体）
+    remark_style = ParagraphStyle(
+        'Remark',
+        parent=styles['Normal'],
+        fontName=chinese_font_name,
+        fontSize=7,  # 备注使用7号字体，比正文小
+        textColor=colors.HexColor('#666666'),
+        leading=8  # 行距
+    )
+    
+    time_style = ParagraphStyle(
+        'Time',
+        parent=styles['Normal'],
+        fontName=chinese_font_name,
+        fontSize=10,
+        textColor=colors.grey,
+        alignment=TA_CENTER
+    )
+    
+    footer_style = ParagraphStyle(
+        'Footer',
+        parent=styles['Normal'],
+        fontName=chinese_font_name,
+        fontSize=8,
+        textColor=colors.grey,
+        alignment=TA_CENTER
+    )
+    
+    def truncate_text(text, max_length=25):
+        """截断文本，超出部分用...显示"""
+        if not text:
+            return ''
+        text = str(text).strip()
+        if len(text) <= max_length:
+            return text
+        return text[:max_length-3] + '...'
+    
+    # 构建PDF内容
+    story = []
+    
+    # 标题
+    story.append(Paragraph('装修预算表', title_style))
+    story.append(Paragraph(f'生成时间：{generated_at or pdf_generated_at()}', time_style))
+    story.append(Spacer(1, 0.5*cm))
+    
+    # 总合计（使用reportlab支持的颜色格式）
+    diff_color = "green" if grand_total_diff >= 0 else "red"
+    total_text = f'<b>总合计：</b> 预算费用 <b><font color=blue>{format_number(grand_total_budget)}</font></b> 元 | ' \
+                 f'当前投入 <b><font color=orange>{format_number(grand_total_current)}</font></b> 元 | ' \
+                 f'最终花费 <b><font color=green>{format_number(grand_total_final)}</font></b> 元 | ' \
+                 f'差价 <b><font color={diff_color}>{format_number(grand_total_diff)}</font></b> 元'
+    
+    total_table = Table([[Paragraph(total_text, summary_style)]], 
+                        colWidths=[16*cm],
+                        style=TableStyle([
+                            ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f8f9fa')),
+                            ('BOX', (0, 0), (-1, -1), 2, colors.HexColor('#667eea')),
+                            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                            ('LEFTPADDING', (0, 0), (-1, -1), 10),
+                            ('RIGHTPADDING', (0, 0), (-1, -1), 10),
+                            ('TOPPADDING', (0, 0), (-1, -1), 15),
+                            ('BOTTOMPADDING', (0, 0), (-1, -1), 15),
+                        ]))
+    story.append(total_table)
+    story.append(Spacer(1, 0.5*cm))
+    
+    # 遍历所有分类
+    for category, category_items in sections:
+        category_total_budget = 0
+        category_total_current = 0
+        category_total_final = 0
+        category_total_diff = 0
         
-        def truncate_text(text, max_length=25):
-            """截断文本，超出部分用...显示"""
-            if not text:
-                return ''
-            text = str(text).strip()
-            if len(text) <= max_length:
-                return text
-            return text[:max_length-3] + '...'
-        
-        # 构建PDF内容
-        story = []
-        
-        # 标题
-        story.append(Paragraph('装修预算表', title_style))
-        story.append(Paragraph(f'生成时间：{datetime.now().strftime("%Y年%m月%d日 %H:%M")}', time_style))
-        story.append(Spacer(1, 0.5*cm))
-        
-        # 总合计（使用reportlab支持的颜色格式）
-        diff_color = "green" if grand_total_diff >= 0 else "red"
-        total_text = f'<b>总合计：</b> 预算费用 <b><font color=blue>{format_number(grand_total_budget)}</font></b> 元 | ' \
-                     f'当前投入 <b><font color=orange>{format_number(grand_total_current)}</font></b> 元 | ' \
-                     f'最终花费 <b><font color=green>{format_number(grand_total_final)}</font></b> 元 | ' \
-                     f'差价 <b><font color={diff_color}>{format_number(grand_total_diff)}</font></b> 元'
-        
-        total_table = Table([[Paragraph(total_text, summary_style)]], 
-                            colWidths=[16*cm],
-                            style=TableStyle([
-                                ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f8f9fa')),
-                                ('BOX', (0, 0), (-1, -1), 2, colors.HexColor('#667eea')),
-                                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                                ('LEFTPADDING', (0, 0), (-1, -1), 10),
-                                ('RIGHTPADDING', (0, 0), (-1, -1), 10),
-                                ('TOPPADDING', (0, 0), (-1, -1), 15),
-                                ('BOTTOMPADDING', (0, 0), (-1, -1), 15),
-                            ]))
-        story.append(total_table)
-        story.append(Spacer(1, 0.5*cm))
-        
-        # 遍历所有分类
-        for category in categories:
-            category_items = items_by_category.get(category, [])
-            category_total_budget = 0
-            category_total_current = 0
-            category_total_final = 0
-            category_total_diff = 0
-            
-            # 分类标题
-            category_header = Table([[Paragraph(f'{category} <font size=10>({len(category_items)} 项)</font>', header_style)]],
-                                    colWidths=[16*cm],
-                                    style=TableStyle([
-                                        ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#667eea')),
-                                        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                                        ('LEFTPADDING', (0, 0), (-1, -1), 10),
-                                        ('RIGHTPADDING', (0, 0), (-1, -1), 10),
-                                        ('TOPPADDING', (0, 0), (-1, -1), 10),
-                                        ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
-                                    ]))
-            story.append(category_header)
+        # 分类标题
+        category_header = Table([[Paragraph(f'{category} <font size=10>({len(category_items)} 项)</font>', header_style)]],
+                                colWidths=[16*cm],
+                                style=TableStyle([
+                                    ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#667eea')),
+                                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                                    ('LEFTPADDING', (0, 0), (-1, -1), 10),
+                                    ('RIGHTPADDING', (0, 0), (-1, -1), 10),
+                                    ('TOPPADDING', (0, 0), (-1, -1), 10),
+                                    ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
+                                ]))
+        story.append(category_header)
+        
+        if len(category_items) > 0:
+            # 表头（使用中文字体）
+            headers = ['序号', '项目名称', '单位', '数量', '预算费用', '当前投入', '最终花费', '差价', '备注']
+            table_data = [[headers[i] for i in indexes]]
             
-            if len(category_items) > 0:
-                # 表头（使用中文字体）
-                table_data = [['序号', '项目名称', '单位', '数量', '预算费用', '当前投入', '最终花费', '差价', '备注']]
-                
-                seq_num = 0
-                for item in category_items:
-                    seq_num += 1
-                    # 兼容旧格式
-                    val_1st = float(item.get('1st预算费用', 0) or 0) if item.get('1st预算费用') and str(item.get('1st预算费用')).replace('.','').replace('-','').isdigit() else 0
-                    val_2nd = float(item.get('2nd预算费用', 0) or 0) if item.get('2nd预算费用') and str(item.get('2nd预算费用')).replace('.','').replace('-','').isdigit() else 0
-                    val_budget = float(item.get('预算费用', 0) or 0) if item.get('预算费用') and str(item.get('预算费用')).replace('.','').replace('-','').isdigit() else (val_2nd if val_2nd > 0 else val_1st)
-                    val_current = float(item.get('当前投入', 0) or 0) if item.get('当前投入') and str(item.get('当前投入')).replace('.','').replace('-','').isdigit() else (float(item.get('最终实际花费', 0) or 0) if item.get('最终实际花费') and str(item.get('最终实际花费')).replace('.','').replace('-','').isdigit() else 0)
-                    val_final = float(item.get('最终花费', 0) or 0) if item.get('最终花费') and str(item.get('最终花费')).replace('.','').replace('-','').isdigit() else 0
-                    val_diff = val_budget - val_final
-                    
-                    category_total_budget += val_budget
-                    category_total_current += val_current
-                    category_total_final += val_final
-                    category_total_diff += val_diff
-                    
-                    # 处理备注：截断并用小字体显示
-                    remark_text = truncate_text(item.get('备注', ''), max_length=25)
-                    remark_cell = Paragraph(remark_text, remark_style) if remark_text else ''
-                    
-                    table_data.append([
-                        str(seq_num),
-                        Paragraph(item.get('项目', ''), normal_style),
-                        item.get('单位', ''),
-                        item.get('预算数量', ''),
-                        format_number(val_budget),
-                        format_number(val_current),
-                        format_number(val_final),
-                        format_number(val_diff),
-                        remark_cell  # 使用Paragraph样式，字体更小
-                    ])
+            for seq_num, item in enumerate(category_items, start=1):
+                val_budget = item['budget_cost'] or 0
+                val_current = item['current_investment'] or 0
+                val_final = item['final_cost'] or 0
+                val_diff = val_budget - val_final
                 
-                # 创建表格
-                table = Table(table_data, colWidths=[0.8*cm, 4*cm, 1*cm, 1*cm, 1.8*cm, 1.8*cm, 1.8*cm, 1.8*cm, 2*cm],
-                             repeatRows=1)
+                category_total_budget += val_budget
+                category_total_current += val_current
+                category_total_final += val_final
+                category_total_diff += val_diff
                 
-                table.setStyle(TableStyle([
-                    # 表头样式
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f8f9fa')),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-                    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                    ('ALIGN', (4, 0), (7, -1), 'RIGHT'),  # 数字列右对齐
-                    ('FONTNAME', (0, 0), (-1, 0), chinese_font_name),
-                    ('FONTSIZE', (0, 0), (-1, 0), 9),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-                    ('TOPPADDING', (0, 0), (-1, 0), 8),
-                    # 边框
-                    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-                    ('LINEBELOW', (0, 0), (-1, 0), 2, colors.black),
-                    # 数据行样式（除了备注列）
-                    ('FONTNAME', (0, 1), (-1, -1), chinese_font_name),
-                    ('FONTSIZE', (0, 1), (7, -1), 8),  # 前8列（不包括备注）使用8号字体
-                    ('FONTSIZE', (8, 1), (8, -1), 7),  # 备注列（第9列）使用7号字体
-                    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9f9f9')]),
-                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                    ('LEFTPADDING', (0, 0), (-1, -1), 5),
-                    ('RIGHTPADDING', (0, 0), (-1, -1), 5),
-                    ('TOPPADDING', (0, 0), (-1, -1), 4),
-                    ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-                ]))
+                # 处理备注：截断并用小字体显示
+                remark_text = truncate_text(item['remark'], max_length=25)
+                remark_cell = Paragraph(remark_text, remark_style) if remark_text else ''
                 
-                story.append(table)
+                row = [
+                    str(seq_num),
+                    Paragraph(item['project_name'] or '', normal_style),
+                    item['unit'] or '',
+                    item['budget_quantity'] or '',
+                    format_number(val_budget),
+                    format_number(val_current),
+                    format_number(val_final),
+                    format_number(val_diff),
+                    remark_cell  # 使用Paragraph样式，字体更小
+                ]
+                table_data.append([row[i] for i in indexes])
             
-            # 分类合计
-            summary_text = f'本分类合计：预算费用 <b>{format_number(category_total_budget)}</b> 元 | ' \
-                          f'当前投入 <b>{format_number(category_total_current)}</b> 元 | ' \
-                          f'最终花费 <b>{format_number(category_total_final)}</b> 元 | ' \
-                          f'差价 <b>{format_number(category_total_diff)}</b> 元'
+            # 创建表格
+            table = Table(table_data, colWidths=col_widths, repeatRows=1)
             
-            summary_table = Table([[Paragraph(summary_text, summary_style)]],
-                                 colWidths=[16*cm],
-                                 style=TableStyle([
-                                     ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f0f0f0')),
-                                     ('LINEABOVE', (0, 0), (-1, -1), 2, colors.grey),
-                                     ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                                     ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                                     ('LEFTPADDING', (0, 0), (-1, -1), 10),
-                                     ('RIGHTPADDING', (0, 0), (-1, -1), 10),
-                                     ('TOPPADDING', (0, 0), (-1, -1), 8),
-                                     ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-                                 ]))
-            story.append(summary_table)
-            story.append(Spacer(1, 0.3*cm))
-        
-        # 页脚
-        story.append(Spacer(1, 0.5*cm))
-        story.append(Paragraph('本预算表由装修预算表管理系统自动生成', footer_style))
-        
-        # 构建PDF
-        doc.build(story)
-        
-        # 清理临时字体文件
-        if temp_font_file and os.path.exists(temp_font_file.name):
-            try:
-                os.unlink(temp_font_file.name)
-            except:
-                pass
-        
-        return export_path
-        
-    except Exception as e:
-        # 清理临时字体文件
-        if temp_font_file and os.path.exists(temp_font_file.name):
-            try:
-                os.unlink(temp_font_file.name)
-            except:
-                pass
+            # 数字列右对齐，备注列使用7号字体
+            column_styles = [('ALIGN', (col, 0), (col, -1), 'RIGHT')
+                             for col, field in enumerate(fields) if field in ('budget_cost', 'current_investment', 'final_cost', 'diff')]
+            if 'remark' in fields:
+                column_styles.append(('FONTSIZE', (fields.index('remark'), 1), (fields.index('remark'), -1), 7))
+            
+            table.setStyle(TableStyle([
+                # 表头样式
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f8f9fa')),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                ('FONTNAME', (0, 0), (-1, 0), chinese_font_name),
+                ('FONTSIZE', (0, 0), (-1, 0), 9),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+                ('TOPPADDING', (0, 0), (-1, 0), 8),
+                # 边框
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+                ('LINEBELOW', (0, 0), (-1, 0), 2, colors.black),
+                # 数据行样式（除了备注列）
+                ('FONTNAME', (0, 1), (-1, -1), chinese_font_name),
+                ('FONTSIZE', (0, 1), (-1, -1), 8),
+                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9f9f9')]),
+                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                ('LEFTPADDING', (0, 0), (-1, -1), 5),
+                ('RIGHTPADDING', (0, 0), (-1, -1), 5),
+                ('TOPPADDING', (0, 0), (-1, -1), 4),
+                ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+            ] + column_styles))
+            
+            story.append(table)
+        
+        # 分类合计
+        summary_text = f'本分类合计：预算费用 <b>{format_number(category_total_budget)}</b> 元 | ' \
+                      f'当前投入 <b>{format_number(category_total_current)}</b> 元 | ' \
+                      f'最终花费 <b>{format_number(category_total_final)}</b> 元 | ' \
+                      f'差价 <b>{format_number(category_total_diff)}</b> 元'
+        
+        summary_table = Table([[Paragraph(summary_text, summary_style)]],
+                             colWidths=[16*cm],
+                             style=TableStyle([
+                                 ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#f0f0f0')),
+                                 ('LINEABOVE', (0, 0), (-1, -1), 2, colors.grey),
+                                 ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                                 ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                                 ('LEFTPADDING', (0, 0), (-1, -1), 10),
+                                 ('RIGHTPADDING', (0, 0), (-1, -1), 10),
+                                 ('TOPPADDING', (0, 0), (-1, -1), 8),
+                                 ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+                             ]))
+        story.append(summary_table)
+        story.append(Spacer(1, 0.3*cm))
+    
+    # 页脚
+    story.append(Spacer(1, 0.5*cm))
+    story.append(Paragraph('本预算表由装修预算表管理系统自动生成', footer_style))
+    
+    # 构建PDF
+    doc.build(story)
+    
+    return output
+
+# 项目数达到该值时自动使用快速渲染（直接在canvas上绘制），较小的预算表仍使用带样式的platypus排版
+PDF_FAST_RENDER_MIN_ITEMS = int(os.getenv('PDF_FAST_RENDER_MIN_ITEMS', '500'))
+# 项目数达到该值（且有多个渲染进程、已安装pypdf）时自动使用并行渲染：分类切成几段，在多个进程中同时绘制后合并
+PDF_PARALLEL_RENDER_MIN_ITEMS = int(os.getenv('PDF_PARALLEL_RENDER_MIN_ITEMS', '5000'))
+PDF_PARALLEL_WORKERS = max(1, int(os.getenv('PDF_PARALLEL_WORKERS', str(os.cpu_count() or 1))))
+# 每段至少的项目数：段太小时进程间传输和合并的开销超过并行的收益
+PDF_PARALLEL_MIN_CHUNK_ITEMS = int(os.getenv('PDF_PARALLEL_MIN_CHUNK_ITEMS', '1000'))
+PDF_RENDERERS = ('styled', 'fast', 'parallel')
+
+def choose_pdf_renderer(requested=None, filters=None):
+    """确定PDF渲染方式：显式指定 styled/fast/parallel 时直接使用，否则（auto）按（筛选后的）项目数选择"""
+    if requested == 'parallel' and not PYPDF_AVAILABLE:
+        raise ValueError('并行渲染PDF需要安装pypdf: pip install pypdf')
+    if requested in PDF_RENDERERS:
+        return requested
+    if requested not in (None, '', 'auto'):
+        raise ValueError(f'不支持的PDF渲染方式: {requested}（可用 auto、{"、".join(PDF_RENDERERS)}）')
+    item_count = get_item_count(filters)
+    if item_count >= PDF_PARALLEL_RENDER_MIN_ITEMS and PDF_PARALLEL_WORKERS > 1 and PYPDF_AVAILABLE:
+        return 'parallel'
+    return 'fast' if item_count >= PDF_FAST_RENDER_MIN_ITEMS else 'styled'
+
+def load_pdf_sections(filters=None):
+    """一次读取所有数据（同一个读事务），返回 (总合计, [(分类名, [项目行])])；filters 见 build_item_filter"""
+    totals = None
+    sections = []
+    for kind, record in iter_export_records(filters):
+        if kind == 'totals':
+            totals = record
+        elif kind == 'category':
+            sections.append((record['name'], []))
+        else:
+            sections[-1][1].append(record)
+    return totals, sections
+
+def _pdf_sections_text(sections):
+    """PDF中要显示的所有文字（用于生成子集字体）"""
+    pdf_text = set()
+    for name, rows in sections:
+        pdf_text.update(name)
+        for row in rows:
+            for key in ('project_name', 'unit', 'budget_quantity', 'remark'):
+                pdf_text.update(row[key] or '')
+    return ''.join(sorted(pdf_text))
+
+def generate_pdf_fast(output, filters=None, columns=None, generated_at=None):
+    """快速PDF渲染：不经过platypus排版，按预先计算的列宽直接在canvas上逐行绘制并手动分页（见 pdf_fast.py）
+    output 为文件路径或二进制文件对象（例如内存缓冲区）；适合几千行以上的大预算表
+    filters / columns / generated_at 见 generate_pdf
+    """
+    from reportlab.pdfgen import canvas as pdf_canvas
+    from pdf_fast import FastPdfRenderer, PAGE_WIDTH, PAGE_HEIGHT
+    
+    totals, sections = load_pdf_sections(filters)
+    font_registered, font_name = register_chinese_fonts(_pdf_sections_text(sections))
+    
+    c = pdf_canvas.Canvas(output, pagesize=(PAGE_WIDTH, PAGE_HEIGHT))
+    c.setTitle('装修预算表')
+    renderer = FastPdfRenderer(c, font_name, columns=columns)
+    renderer.title(totals, generated_at or pdf_generated_at())
+    for name, rows in sections:
+        renderer.section(name, rows)
+    renderer.closing_note()
+    renderer.finish()
+
+def split_pdf_sections(sections, chunk_count, min_items=PDF_PARALLEL_MIN_CHUNK_ITEMS):
+    """把分类按顺序切成项目数大致相同的若干段（连续的小分类合为一段，大分类按行拆到相邻几段）
+    sections 为 [(分类名, [项目行], 分类合计)]，返回 [[part, ...], ...]，part 是 FastPdfRenderer.section 的参数
+    """
+    total_items = sum(len(rows) for _, rows, _ in sections)
+    target = max(min_items, -(-total_items // max(1, chunk_count)), 1)
+    chunks = [[]]
+    filled = 0
+    for name, rows, totals in sections:
+        start = 0
+        while True:
+            if filled >= target:
+                chunks.append([])
+                filled = 0
+            part_rows = rows[start:start + target - filled]
+            end = start + len(part_rows)
+            chunks[-1].append({
+                'name': name,
+                'rows': part_rows,
+                'item_count': len(rows),
+                'start_seq': start + 1,
+                'continued': start > 0,
+                'summary': end >= len(rows),
+                'totals': totals,
+            })
+            filled += len(part_rows)
+            start = end
+            if start >= len(rows):
+                break
+    return chunks
+
+def render_pdf_chunk_task(font_path, parts, first_page, closing, output_path, columns=None):
+    """进程池任务：渲染并行PDF的一段（从新的一页开始，页码从first_page开始），返回实际页数"""
+    from reportlab.pdfgen import canvas as pdf_canvas
+    from pdf_fast import FastPdfRenderer, PAGE_WIDTH, PAGE_HEIGHT
+    
+    # 与主进程注册同一个（子集）字体文件，各段的字形和文字宽度完全一致
+    font_name = _register_font_file(font_path) if font_path else _CHINESE_FONT_NAME
+    c = pdf_canvas.Canvas(output_path, pagesize=(PAGE_WIDTH, PAGE_HEIGHT))
+    renderer = FastPdfRenderer(c, font_name, first_page, columns)
+    for part in parts:
+        renderer.section(**part)
+    if closing:
+        renderer.closing_note()
+    return renderer.finish()
+
+def generate_pdf_parallel(output, filters=None, columns=None, pool=None, generated_at=None):
+    """并行PDF渲染：分类切成项目数相近的几段，每段在独立进程中用快速渲染绘制，最后用pypdf按顺序合并
+    首页是总合计和分类汇总表（含各分类的起始页码）；每段从新的一页开始，
+    各段的起始页码先用不绘制的分页计算确定，所以合并后页码连续，汇总表中的页码与正文一致
+    filters / columns / generated_at 见 generate_pdf；pool 为绘制各段的进程池，不传时使用共享的分段进程池
+    """
+    import tempfile
+    from pypdf import PdfWriter
+    from reportlab.pdfgen import canvas as pdf_canvas
+    from concurrent.futures.process import BrokenProcessPool
+    from pdf_fast import FastPdfRenderer, PAGE_WIDTH, PAGE_HEIGHT, section_totals
+    
+    started = time.perf_counter()
+    totals, sections = load_pdf_sections(filters)
+    text = _pdf_sections_text(sections)
+    font_registered, font_name = register_chinese_fonts(text)
+    font_path = _prepare_font_file(_CHINESE_FONT_SOURCE, text) if font_registered else None
+    
+    sections = [(name, rows, section_totals(rows)) for name, rows in sections]
+    chunks = split_pdf_sections(sections, PDF_PARALLEL_WORKERS)
+    entries = [{'name': name, 'item_count': len(rows), 'totals': category_totals, 'page': None}
+               for name, rows, category_totals in sections]
+    
+    # 只计算分页：首页（汇总表）占几页、每段从第几页开始、每个分类从第几页开始
+    summary_layout = FastPdfRenderer()
+    summary_layout.title(totals)
+    summary_layout.summary_table(entries)
+    first_pages = []
+    expected_pages = []
+    next_page = summary_layout.page_number + 1
+    entry_index = 0
+    for index, parts in enumerate(chunks):
+        layout = FastPdfRenderer(first_page=next_page)
+        for part in parts:
+            page = layout.section(**part)
+            if not part['continued']:
+                entries[entry_index]['page'] = page
+                entry_index += 1
+        if index == len(chunks) - 1:
+            layout.closing_note()
+        first_pages.append(next_page)
+        expected_pages.append(layout.page_count)
+        next_page += layout.page_count
+    
+    with tempfile.TemporaryDirectory(prefix='pdf_parallel_') as work_dir:
+        chunk_paths = [os.path.join(work_dir, f'part_{index}.pdf') for index in range(len(chunks))]
+        shared_pool = pool is None
+        if shared_pool:
+            pool = _get_pdf_pool('chunks')
+        try:
+            futures = [
+                pool.submit(render_pdf_chunk_task, font_path, parts, first_pages[index],
+                            index == len(chunks) - 1, chunk_paths[index], columns)
+                for index, parts in enumerate(chunks)
+            ]
+            
+            # 各段渲染的同时在本进程绘制首页
+            summary_path = os.path.join(work_dir, 'summary.pdf')
+            c = pdf_canvas.Canvas(summary_path, pagesize=(PAGE_WIDTH, PAGE_HEIGHT))
+            summary = FastPdfRenderer(c, font_name)
+            summary.title(totals, generated_at or pdf_generated_at())
+            summary.summary_table(entries)
+            summary.finish()
+            
+            rendered_pages = [future.result() for future in futures]
+        except BrokenProcessPool:
+            if shared_pool:
+                _reset_pdf_pool('chunks')
+            raise
+        if rendered_pages != expected_pages:
+            raise RuntimeError(f'PDF分段页数与预先计算的不一致: {rendered_pages} != {expected_pages}')
+        
+        writer = PdfWriter()
+        for path in [summary_path] + chunk_paths:
+            writer.append(path)
+        writer.add_metadata({'/Title': '装修预算表'})
+        writer.write(output)
+    
+    print(f"📄 并行渲染PDF: {len(chunks)} 段, {next_page - 1} 页, "
+          f"{(time.perf_counter() - started) * 1000:.0f}ms")
+
+# 导出文件在内存中缓冲的上限，超过后自动转存到匿名临时文件（关闭即删除）
+EXPORT_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+# exports 目录最多保留的导出文件数量
+EXPORT_KEEP_COUNT = int(os.getenv('EXPORT_KEEP_COUNT', '10'))
+
+# 导出缓存：按 (格式, 选项, 数据版本号) 复用已生成的文件，多个worker共享；EXPORT_CACHE_MAX_MB=0 时关闭
+EXPORT_CACHE = ExportCache(
+    os.path.join(DATA_DIR, 'export_cache'),
+    max_bytes=int(os.getenv('EXPORT_CACHE_MAX_MB', '200')) * 1024 * 1024,
+    max_entries=int(os.getenv('EXPORT_CACHE_MAX_ENTRIES', '50'))
+)
+
+def cleanup_old_exports(keep_count=EXPORT_KEEP_COUNT):
+    """清理exports目录中的旧导出文件，只保留最新的N个"""
+    export_dir = app.config['EXPORT_FOLDER']
+    try:
+        files = [os.path.join(export_dir, name) for name in os.listdir(export_dir)]
+    except OSError:
+        return 0
+    files = [path for path in files if os.path.isfile(path)]
+    files.sort(key=os.path.getmtime, reverse=True)
+    
+    deleted_count = 0
+    for path in files[keep_count:]:
+        try:
+            os.remove(path)
+            deleted_count += 1
+        except OSError:
+            continue
+    return deleted_count
+
+def open_export(fmt, options, build):
+    """获取导出文件，返回 (文件对象, 缓存状态HIT/MISS/BYPASS)
+    
+    build(f) 把导出内容写入f；启用缓存时数据版本号不变就直接复用，关闭缓存时生成到临时缓冲区
+    """
+    if EXPORT_CACHE.enabled:
+        f, hit = EXPORT_CACHE.open_or_build(fmt, options, get_data_revision(), build)
+        return f, 'HIT' if hit else 'MISS'
+    
+    import tempfile
+    buffer = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_SIZE)
+    try:
+        build(buffer)
+    except Exception:
+        buffer.close()
         raise
+    buffer.seek(0)
+    return buffer, 'BYPASS'
+
+def _build_excel_export(f, filters=None, columns=None):
+    """把基于数据库数据构建的Excel写入文件对象"""
+    wb = rebuild_excel_from_data(filters, columns)
+    wb.save(f)
+
+def _build_pdf_export(f, renderer='styled', filters=None, columns=None, generated_at=None):
+    """把生成的PDF直接写入文件对象"""
+    if renderer == 'fast':
+        generate_pdf_fast(f, filters, columns, generated_at)
+    elif renderer == 'parallel':
+        generate_pdf_parallel(f, filters, columns, generated_at=generated_at)
+    else:
+        generate_pdf(filters, columns, f, generated_at)
 
 @app.route('/api/export', methods=['GET'])
 def export_file():
-    """导出Excel文件（基于前端数据重新构建）"""
+    """导出Excel文件（基于数据库数据流式构建，默认不在服务器上保留文件；?save=1 时另存一份到exports目录）
+    部分导出：?category=&status=&budget_min=...&columns=...，见 parse_export_options
+    """
+    import shutil
+    
     try:
+        try:
+            filters, columns = parse_export_options(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         export_filename = f'红玺台复式装修预算表_导出_{timestamp}.xlsx'
-        export_path = os.path.join(app.config['EXPORT_FOLDER'], export_filename)
         
-        # 基于前端数据重新构建Excel
-        wb = rebuild_excel_from_data()
-        wb.save(export_path)
-        wb.close()
-        
-        return send_file(
-            export_path,
+        f, cache_status = open_export('xlsx', export_cache_options(filters, columns),
+                                      lambda out: _build_excel_export(out, filters, columns))
+        try:
+            if request.args.get('save', '').lower() in ('1', 'true', 'yes'):
+                export_path = os.path.join(app.config['EXPORT_FOLDER'], export_filename)
+                with open(export_path, 'wb') as out:
+                    shutil.copyfileobj(f, out)
+                f.seek(0)
+                cleanup_old_exports()
+        except Exception:
+            f.close()
+            raise
+        
+        response = send_file(
+            f,
             as_attachment=True,
             download_name=export_filename,
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
         )
+        response.headers['X-Export-Cache'] = cache_status
+        return response
     except Exception as e:
         import traceback
         return jsonify({'error': str(e), 'traceback': traceback.format_exc()}), 500
 
 @app.route('/api/export-pdf', methods=['GET'])
 def export_pdf():
-    """导出PDF文件（基于前端数据生成）"""
+    """导出PDF文件（基于前端数据生成，数据未变化时直接返回缓存）
+    ?renderer=auto（默认，按项目数选择）| styled | fast | parallel
+    部分导出：?category=&status=&budget_min=...&columns=...，见 parse_export_options
+    """
     if not REPORTLAB_AVAILABLE:
         return jsonify({'error': 'PDF导出功能不可用，请安装reportlab: pip install reportlab'}), 500
     
     try:
-        # 生成PDF
-        export_path = generate_pdf()
-        export_filename = os.path.basename(export_path)
+        try:
+            filters, columns = parse_export_options(request.args)
+            renderer = choose_pdf_renderer(request.args.get('renderer'), filters)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        return send_file(
-            export_path,
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        export_filename = f'红玺台复式装修预算表_导出_{timestamp}.pdf'
+        
+        # 生成时间在生成时写入PDF（不是缓存键的一部分），数据没变时直接使用缓存
+        f, cache_status = open_export(
+            'pdf', export_cache_options(filters, columns, renderer=renderer),
+            lambda out: _build_pdf_export(out, renderer, filters, columns)
+        )
+        
+        response = send_file(
+            f,
             as_attachment=True,
             download_name=export_filename,
             mimetype='application/pdf'
         )
+        response.headers['X-Export-Cache'] = cache_status
+        response.headers['X-PDF-Renderer'] = renderer
+        return response
     except Exception as e:
         import traceback
         return jsonify({'error': str(e), 'traceback': traceback.format_exc()}), 500
 
-def parse_text_local(text):
-    """使用本地规则解析自然语言文本，提取装修项目信息"""
+# PDF后台渲染：在进程池中生成（不占用web worker），同时渲染的数量不超过 PDF_RENDER_WORKERS
+PDF_RENDER_WORKERS = max(1, int(os.getenv('PDF_RENDER_WORKERS', str(min(2, os.cpu_count() or 1)))))
+PDF_RESULT_TTL_SECONDS = int(os.getenv('PDF_RESULT_TTL_SECONDS', '3600'))  # 生成的PDF保留时间
+PDF_RESULT_DIR = os.path.join(DATA_DIR, 'pdf_jobs')
+_PDF_POOLS = {}  # 'render'：整份PDF的渲染进程池；'chunks'：在当前进程中并行渲染时绘制各段的进程池
+_PDF_POOL_LOCK = threading.Lock()
+
+def _get_pdf_pool(kind='render'):
+    """PDF渲染进程池（首次使用时创建，spawn方式启动，子进程不继承任务线程和数据库连接）"""
+    with _PDF_POOL_LOCK:
+        pool = _PDF_POOLS.get(kind)
+        if pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+            import multiprocessing
+            pool = _PDF_POOLS[kind] = ProcessPoolExecutor(
+                max_workers=PDF_RENDER_WORKERS if kind == 'render' else PDF_PARALLEL_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return pool
+
+def _reset_pdf_pool(kind='render'):
+    """子进程异常退出（例如被OOM杀掉）后进程池不可再用，丢弃它以便下次重新创建"""
+    with _PDF_POOL_LOCK:
+        _PDF_POOLS.pop(kind, None)
+
+def render_pdf_task(db_file, renderer='styled', filters=None, columns=None, generated_at=None):
+    """进程池任务：生成PDF到随机命名的文件并返回路径（子进程使用与主进程相同的数据库文件）
+    并行渲染也整体在子进程中执行（读取数据、注册字体、合并），各段由该子进程自己的分段进程池绘制
+    """
+    import database
+    database.DB_FILE = db_file
+    export_path = os.path.join(app.config['EXPORT_FOLDER'], f'pdf_{uuid.uuid4().hex}.pdf')
     try:
-        # 从数据库获取现有分类
-        data = get_data_for_api()
-        categories = data['categories']
-        
-        result = {
-            '项目': '',
-            'category': '',
-            '单位': '',
-            '预算数量': '',
-            '预算费用': '',  # 使用新字段名
-            '当前投入': '',  # 使用新字段名
-            '最终花费': '',  # 使用新字段名
-            '备注': ''
+        if renderer == 'fast':
+            generate_pdf_fast(export_path, filters, columns, generated_at)
+        elif renderer == 'parallel':
+            # 分段进程池只在本次渲染期间存在：进程池子进程中长期保留的嵌套进程池在退出时无法正常关闭
+            from concurrent.futures import ProcessPoolExecutor
+            import multiprocessing
+            with ProcessPoolExecutor(max_workers=PDF_PARALLEL_WORKERS,
+                                     mp_context=multiprocessing.get_context('spawn')) as pool:
+                generate_pdf_parallel(export_path, filters, columns, pool, generated_at)
+        else:
+            generate_pdf(filters, columns, export_path, generated_at)
+    except Exception:
+        if os.path.exists(export_path):
+            os.remove(export_path)
+        raise
+    return export_path
+
+def _build_pdf_export_in_pool(f, renderer='styled', filters=None, columns=None, generated_at=None):
+    """在进程池中生成PDF，再写入文件对象（供导出缓存使用）"""
+    import shutil
+    import database
+    from concurrent.futures.process import BrokenProcessPool
+    try:
+        export_path = _get_pdf_pool().submit(
+            render_pdf_task, database.DB_FILE, renderer, filters, columns, generated_at
+        ).result()
+    except BrokenProcessPool:
+        _reset_pdf_pool()
+        raise
+    try:
+        with open(export_path, 'rb') as src:
+            shutil.copyfileobj(src, f)
+    finally:
+        os.remove(export_path)
+
+def _pdf_result_path(job_id):
+    return os.path.join(PDF_RESULT_DIR, f'{job_id}.pdf')
+
+def cleanup_expired_pdf_results():
+    """删除超过保留时间的PDF任务结果，返回删除的文件数"""
+    deadline = time.time() - PDF_RESULT_TTL_SECONDS
+    deleted = 0
+    try:
+        names = os.listdir(PDF_RESULT_DIR)
+    except OSError:
+        return 0
+    for name in names:
+        path = os.path.join(PDF_RESULT_DIR, name)
+        try:
+            if os.path.getmtime(path) < deadline:
+                os.remove(path)
+                deleted += 1
+        except OSError:
+            continue
+    return deleted
+
+@job_handler('pdf', workers=PDF_RENDER_WORKERS)
+def run_pdf_job(job):
+    """后台PDF任务：数据未变化时直接使用导出缓存，否则在进程池中生成，结果保留 PDF_RESULT_TTL_SECONDS 秒"""
+    import shutil
+    
+    renderer = job['payload'].get('renderer', 'styled')
+    filters = job['payload'].get('filters') or {}
+    columns = job['payload'].get('columns')
+    update_job(job['id'], stage='rendering')
+    started = time.perf_counter()
+    f, cache_status = open_export(
+        'pdf', export_cache_options(filters, columns, renderer=renderer),
+        lambda out: _build_pdf_export_in_pool(out, renderer, filters, columns)
+    )
+    os.makedirs(PDF_RESULT_DIR, exist_ok=True)
+    result_path = _pdf_result_path(job['id'])
+    with f, open(result_path + '.tmp', 'wb') as out:
+        shutil.copyfileobj(f, out)
+    os.replace(result_path + '.tmp', result_path)
+    
+    return {
+        'message': 'PDF已生成',
+        'size': os.path.getsize(result_path),
+        'cache': cache_status,
+        'renderer': renderer,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+        'expires_at': datetime.fromtimestamp(time.time() + PDF_RESULT_TTL_SECONDS).isoformat(timespec='seconds'),
+        'download_url': f"/api/export-pdf/jobs/{job['id']}/download"
+    }
+
+@app.route('/api/export-pdf/jobs', methods=['POST'])
+def enqueue_pdf_export():
+    """排队一个后台PDF导出任务，立即返回任务ID（状态见 /api/jobs/<id>，完成后从 download_url 下载）
+    ?renderer=auto（默认，按项目数选择）| styled | fast | parallel
+    部分导出：?category=&status=&budget_min=...&columns=...，见 parse_export_options
+    """
+    if not REPORTLAB_AVAILABLE:
+        return jsonify({'error': 'PDF导出功能不可用，请安装reportlab: pip install reportlab'}), 500
+    
+    try:
+        try:
+            filters, columns = parse_export_options(request.args)
+            renderer = choose_pdf_renderer(request.args.get('renderer'), filters)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        job_id = enqueue_job('pdf', {'renderer': renderer, 'filters': filters, 'columns': columns})
+        return jsonify({
+            'success': True,
+            'message': '正在后台生成PDF',
+            'job_id': job_id,
+            'renderer': renderer,
+            'status_url': f'/api/jobs/{job_id}',
+            'download_url': f'/api/export-pdf/jobs/{job_id}/download'
+        }), 202
+    except Exception as e:
+        import traceback
+        return jsonify({'error': str(e), 'traceback': traceback.format_exc()}), 500
+
+@app.route('/api/export-pdf/jobs/<job_id>/download', methods=['GET'])
+def download_pdf_export(job_id):
+    """下载后台PDF任务生成的文件"""
+    try:
+        job = get_job(job_id)
+        if job is None or job['kind'] != 'pdf':
+            return jsonify({'success': False, 'error': '任务不存在'}), 404
+        if job['status'] == 'failed':
+            return jsonify({'success': False, 'error': job['error'] or 'PDF生成失败'}), 409
+        if job['status'] != 'done':
+            return jsonify({'success': False, 'error': 'PDF尚未生成完成', 'status': job['status']}), 409
+        
+        result_path = _pdf_result_path(job_id)
+        try:
+            expired = time.time() - os.path.getmtime(result_path) > PDF_RESULT_TTL_SECONDS
+            f = None if expired else open(result_path, 'rb')
+        except FileNotFoundError:
+            f = None
+        if f is None:
+            return jsonify({'success': False, 'error': 'PDF已过期，请重新导出'}), 410
+        
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        return send_file(
+            f,
+            as_attachment=True,
+            download_name=f'红玺台复式装修预算表_导出_{timestamp}.pdf',
+            mimetype='application/pdf'
+        )
+    except Exception as e:
+        import traceback
+        return jsonify({'error': str(e), 'traceback': traceback.format_exc()}), 500
+
+@app.route('/api/export-data', methods=['GET'])
+def export_data():
+    """以数据交换格式导出（?format=csv|ndjson|parquet），直接从数据库流式写出，不经过Excel"""
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in INTERCHANGE_FORMATS:
+        return jsonify({'error': f'不支持的导出格式: {fmt}（可用 {", ".join(INTERCHANGE_FORMATS)}）'}), 400
+    if fmt == 'parquet' and not PYARROW_AVAILABLE:
+        return jsonify({'error': 'Parquet导出功能不可用，请安装pyarrow: pip install pyarrow'}), 500
+    
+    try:
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        export_filename = f'budget_{timestamp}.{fmt}'
+        
+        f, cache_status = open_export(fmt, {}, lambda out: INTERCHANGE_WRITERS[fmt](iter_item_rows(), out))
+        
+        response = send_file(
+            f,
+            as_attachment=True,
+            download_name=export_filename,
+            mimetype=INTERCHANGE_MIMETYPES[fmt]
+        )
+        response.headers['X-Export-Cache'] = cache_status
+        return response
+    except Exception as e:
+        import traceback
+        return jsonify({'error': str(e), 'traceback': traceback.format_exc()}), 500
+
+# 超过该大小的数据交换文件排队后台导入（与 /api/import 相同），较小的文件在请求中直接导入
+IMPORT_DATA_SYNC_MAX_BYTES = int(os.getenv('IMPORT_DATA_SYNC_MAX_MB', '1')) * 1024 * 1024
+
+def import_interchange_data(stream, fmt, mode):
+    """从数据交换格式的流中导入，返回 {'category_count', 'item_count', 'changes'}；文件中没有数据时返回None
+    replace 模式按批读取、按批写入，内存占用与行数无关；
+    merge 模式要与所有已有项目匹配，需要先读取全部行
+    格式错误时抛出 InterchangeError（整个导入回滚）
+    """
+    import itertools
+    
+    batches = iter_item_batches(stream, fmt)
+    first = next(batches, None)
+    if first is None:
+        return None
+    batches = itertools.chain([first], batches)
+    
+    if mode == 'merge':
+        data = {'categories': [], 'items': []}
+        for batch in batches:
+            data['categories'].extend(batch['categories'])
+            data['items'].extend(batch['items'])
+        changes = merge_import_excel_data(data)
+        return {
+            'category_count': len(data['categories']),
+            'item_count': len(data['items']),
+            'changes': changes
         }
+    
+    counts = import_item_batches(batches)
+    return {**counts, 'changes': None}
+
+@job_handler('import_data')
+def run_import_data_job(job):
+    """后台导入数据交换格式文件（上传文件在任务结束后由 run_job 删除）"""
+    payload = job['payload']
+    update_job(job['id'], stage='importing', rows_processed=0)
+    try:
+        with open(payload['path'], 'rb') as f:
+            result = import_interchange_data(f, payload['format'], payload['mode'])
+    except (InterchangeError, UnicodeDecodeError) as e:
+        raise JobFailed(f'文件格式错误: {str(e)}')
+    if result is None:
+        raise JobFailed('文件中没有数据')
+    
+    update_job(job['id'], rows_processed=result['item_count'])
+    return {
+        'message': '导入成功',
+        'format': payload['format'],
+        'mode': payload['mode'],
+        **result
+    }
+
+@app.route('/api/import-data', methods=['POST'])
+def import_data():
+    """导入数据交换格式文件（CSV/NDJSON/Parquet）
+    不超过 IMPORT_DATA_SYNC_MAX_BYTES 的文件直接从上传流按批读取并写入数据库；
+    更大的文件保存后排队后台导入，立即返回任务ID（进度见 /api/jobs/<id>）
+    表单字段 format: 可选，默认按文件扩展名判断
+    表单字段 mode: replace（默认）或 merge
+    """
+    try:
+        if 'file' not in request.files:
+            return jsonify({'error': '没有上传文件'}), 400
         
-        # 提取分类名和项目名称
-        # 如果文本包含逗号，第一个部分用于分类匹配，第二个部分用于项目名
-        parts = re.split(r'[，,，]', text)
-        parts = [p.strip() for p in parts if p.strip()]  # 去除空部分
-        
-        if len(parts) >= 2:
-            # 第一个部分用于分类匹配
-            category_candidate = parts[0]
-            # 从第二个部分开始查找项目名（跳过数量和预算信息）
-            project_name = None
-            for i in range(1, len(parts)):
-                part = parts[i].strip()
-                # 如果这个部分看起来像数量（数字+单位），跳过
-                if re.match(r'^\d+(?:\.\d+)?\s*(?:套|个|米|平方米|平方厘米|件|台|张|把|支|根|条|块|片|组|项)$', part):
-                    continue
-                # 如果这个部分看起来像预算/费用信息，跳过
-                if re.match(r'^(?:预算|当前|实际|最终|花费|费用|投入)[：:，,，\s]*\d+', part):
-                    continue
-                # 否则作为项目名
-                project_name = part
-                break
-            
-            # 如果没找到合适的项目名，使用第一个部分作为项目名（第一个部分可能是项目名而不是分类名）
-            if not project_name:
-                # 检查第一个部分是否看起来像分类名（包含"全屋"、"定制"等关键词）
-                if any(kw in category_candidate for kw in ['全屋', '定制', '基装', '智能', '家居']):
-                    # 第一个部分像分类名，但没有找到项目名，使用第二个部分（即使它可能是数量）
-                    if len(parts) >= 2:
-                        project_name = parts[1]
-                else:
-                    # 第一个部分不像分类名，可能是项目名
-                    project_name = category_candidate
-                    category_candidate = None  # 清空分类候选，后续根据项目名匹配
-            
-            if project_name:
-                result['项目'] = project_name
-            # 先尝试将第一个部分作为分类候选（后续会进行匹配）
-            if category_candidate:
-                result['category'] = category_candidate
-        else:
-            # 如果只有一个部分，需要智能提取项目名（排除数字、单位、预算等关键词）
-            # 提取项目名：从开头到第一个数字或关键词之前
-            # 先尝试匹配到第一个数字或关键词之前的内容
-            project_match = re.search(r'^([^，,，\d预算当前实际最终备注]+?)(?=[，,，]|\d|预算|当前|实际|最终|备注|$)', text)
-            if project_match:
-                project_name = project_match.group(1).strip()
-                # 清理项目名（去除末尾的单位、数字等）
-                project_name = re.sub(r'\s*\d+(?:\.\d+)?\s*(?:套|个|米|平方米|平方厘米|件|台|张|把|支|根|条|块|片|组|项)?\s*$', '', project_name)
-                if project_name:
-                    result['项目'] = project_name
-            else:
-                # 如果正则匹配失败，尝试直接提取第一个非数字、非关键词的部分
-                # 找到第一个逗号、数字或关键词的位置
-                match = re.search(r'^([^，,，\d预算当前实际最终备注]+)', text)
-                if match:
-                    project_name = match.group(1).strip()
-                    # 清理项目名
-                    project_name = re.sub(r'\s*\d+(?:\.\d+)?\s*(?:套|个|米|平方米|平方厘米|件|台|张|把|支|根|条|块|片|组|项)?\s*$', '', project_name)
-                    if project_name:
-                        result['项目'] = project_name
-        
-        # 提取数量（数字+单位，如"1套"、"3个"）
-        quantity_match = re.search(r'(\d+(?:\.\d+)?)\s*([套个米平方米平方厘米件台张把支根条块片组项])', text)
-        if quantity_match:
-            result['预算数量'] = quantity_match.group(1)
-            result['单位'] = quantity_match.group(2)
-        
-        # 提取费用（数字+元，或单独的数字）
-        # 预算费用（优先匹配"预算"关键词，支持"预算59000元"格式）
-        budget_match = re.search(r'预算\s*(\d+(?:\.\d+)?)\s*元?', text)
-        if budget_match:
-            result['预算费用'] = budget_match.group(1)
-        else:
-            # 如果没有明确标识，尝试找第一个费用数字（在"元"之前）
-            cost_match = re.search(r'(\d+(?:\.\d+)?)\s*元', text)
-            if cost_match:
-                result['预算费用'] = cost_match.group(1)
-        
-        # 当前投入（匹配"当前投入"、"当前花费"等，支持"当前投入2000元"格式）
-        current_match = re.search(r'当前投入\s*(\d+(?:\.\d+)?)\s*元?', text)
-        if current_match:
-            result['当前投入'] = current_match.group(1)
-        else:
-            result['当前投入'] = '0'
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({'error': '未选择文件'}), 400
         
-        # 最终花费（匹配"最终花费"、"实际花费"、"实际费用"等）
-        final_match = re.search(r'(?:最终花费|最终费用|实际花费|实际费用)\s*(\d+(?:\.\d+)?)\s*元?', text)
-        if final_match:
-            result['最终花费'] = final_match.group(1)
-        else:
-            result['最终花费'] = '0'
-        
-        # 提取备注（在"备注"、"品牌"、"型号"等关键词之后）
-        remark_keywords = ['备注', '品牌', '型号', '渠道', '介绍', '说明']
-        for keyword in remark_keywords:
-            remark_match = re.search(rf'{keyword}[：:，,，\s]+([^，,，]+)', text)
-            if remark_match:
-                remark_text = remark_match.group(1).strip()
-                # 排除纯数字（可能是误匹配）
-                if not re.match(r'^\d+(?:\.\d+)?\s*(?:元)?$', remark_text):
-                    result['备注'] = remark_text
-                    break
+        fmt = (request.form.get('format') or format_from_filename(file.filename) or '').lower()
+        if fmt not in INTERCHANGE_FORMATS:
+            return jsonify({'error': f'无法识别的文件格式，请上传 {", ".join(INTERCHANGE_FORMATS)} 文件'}), 400
+        if fmt == 'parquet' and not PYARROW_AVAILABLE:
+            return jsonify({'error': 'Parquet导入功能不可用，请安装pyarrow: pip install pyarrow'}), 500
         
-        # 如果没有找到备注，尝试提取最后一部分作为备注（排除数字和"实际XX"）
-        if not result['备注']:
-            # 提取最后一个逗号后的内容
-            parts = re.split(r'[，,，]', text)
-            if len(parts) > 1:
-                last_part = parts[-1].strip()
-                # 排除纯数字、"实际XX"这样的内容
-                if (not re.match(r'^\d+(?:\.\d+)?\s*(?:元|套|个|米)?$', last_part) and 
-                    not re.match(r'^实际\s*\d+', last_part)):
-                    result['备注'] = last_part
-        
-        # 自动匹配分类（根据项目名称关键词）
-        if not result['category'] and result['项目']:
-            project_name = result['项目']
-            matched = False
-            # 先尝试精确匹配分类名（如果项目名完全匹配某个分类）
-            for cat in categories:
-                if project_name == cat or cat in project_name:
-                    result['category'] = cat
-                    matched = True
-                    break
-            
-            # 如果没精确匹配，尝试模糊匹配（关键词匹配 + 相似度匹配）
-            if not matched:
-                best_match = None
-                best_score = 0
-                
-                for cat in categories:
-                    score = 0
-                    
-                    # 1. 关键词匹配（提高权重）
-                    # 基装相关
-                    if any(kw in project_name for kw in ['基装', '基础', '装修', '吊顶', '改水', '改电', '土建', '乳胶漆', '防锈漆', '楼梯']):
-                        if any(kw in cat for kw in ['基装', '基础', '装修']):
-                            score = max(score, 0.8)
-                    # 柜/定制相关（支持部分匹配）
-                    if any(kw in project_name for kw in ['柜', '衣柜', '鞋柜', '橱柜', '定制']):
-                        if any(kw in cat for kw in ['柜', '定制']):
-                            score = max(score, 0.8)
-                    # 电器相关
-                    if any(kw in project_name for kw in ['电器', '家电', '智能', '空调', '冰箱', '洗衣机', '电视', '家居']):
-                        if any(kw in cat for kw in ['电', '智能', '电器', '家居']):
-                            score = max(score, 0.8)
-                    # 卫浴相关
-                    if any(kw in project_name for kw in ['卫浴', '浴室', '卫生间', '马桶', '花洒', '洗手盆', '淋浴']):
-                        if any(kw in cat for kw in ['卫浴', '浴室', '卫生间']):
-                            score = max(score, 0.8)
-                    # 地板相关
-                    if any(kw in project_name for kw in ['地板', '地砖', '瓷砖', '木地板']):
-                        if any(kw in cat for kw in ['地板', '地砖', '瓷砖']):
-                            score = max(score, 0.8)
-                    # 门窗相关
-                    if any(kw in project_name for kw in ['门', '窗', '门窗', '防盗门', '铝合金']):
-                        if any(kw in cat for kw in ['门', '窗', '门窗']):
-                            score = max(score, 0.8)
-                    
-                    # 2. 字符相似度匹配（作为补充）
-                    # 提取关键词（去除常见修饰词）
-                    project_chars = set([c for c in project_name if c not in ['的', '和', '与', '及', '或', '、', ',', '，', ' ', '全', '屋']])
-                    cat_chars = set([c for c in cat if c not in ['的', '和', '与', '及', '或', '、', ',', '，', ' ', '全', '屋']])
-                    common_chars = project_chars & cat_chars
-                    if common_chars:
-                        max_len = max(len(project_chars), len(cat_chars))
-                        if max_len > 0:
-                            char_similarity = len(common_chars) / max_len
-                            # 如果字符相似度较高，提高分数
-                            if char_similarity > 0.3:
-                                score = max(score, char_similarity * 0.6)  # 字符相似度权重较低
-                    
-                    # 3. 部分匹配（如果项目名包含分类名的关键词，或分类名包含项目名的关键词）
-                    # 提取项目名和分类名的核心词（2个字符以上）
-                    project_words = [project_name[i:i+2] for i in range(len(project_name)-1)]
-                    cat_words = [cat[i:i+2] for i in range(len(cat)-1)]
-                    common_words = set(project_words) & set(cat_words)
-                    if common_words:
-                        word_similarity = len(common_words) / max(len(set(project_words)), len(set(cat_words)))
-                        if word_similarity > 0.2:
-                            score = max(score, word_similarity * 0.7)
-                    
-                    # 记录最佳匹配
-                    if score > best_score:
-                        best_score = score
-                        best_match = cat
-                
-                # 如果找到最佳匹配且相似度超过阈值，使用它
-                if best_match and best_score >= 0.3:
-                    result['category'] = best_match
-                    matched = True
+        mode = request.form.get('mode', 'replace')
+        if mode not in IMPORT_MODES:
+            return jsonify({'error': f'不支持的导入模式: {mode}'}), 400
+        
+        # 上传流是可定位的临时文件，先取大小再决定同步导入还是排队
+        file.stream.seek(0, os.SEEK_END)
+        size = file.stream.tell()
+        file.stream.seek(0)
+        
+        if size > IMPORT_DATA_SYNC_MAX_BYTES:
+            upload_path = make_upload_path('import_data', file.filename)
+            file.save(upload_path)
+            try:
+                job_id = enqueue_job('import_data', {
+                    'path': upload_path, 'filename': file.filename, 'format': fmt, 'mode': mode
+                })
+            except Exception:
+                os.remove(upload_path)
+                raise
             
-            # 如果还没匹配到，使用项目名称作为新分类名称
-            if not matched:
-                # 提取项目名称的关键部分作为分类名（去掉数量、单位等）
-                category_name = result['项目']
-                # 如果项目名包含逗号，取第一部分
-                if '，' in category_name or ',' in category_name:
-                    category_name = category_name.split('，')[0].split(',')[0].strip()
-                # 如果项目名太长，截取前10个字符
-                if len(category_name) > 10:
-                    category_name = category_name[:10]
-                result['category'] = category_name
-        
-        # 清理空值
-        for key in result:
-            if not result[key]:
-                result[key] = ''
-        
-        return {'success': True, 'item': result}
+            return jsonify({
+                'success': True,
+                'message': '文件已上传，正在后台导入',
+                'format': fmt,
+                'mode': mode,
+                'job_id': job_id,
+                'status_url': f'/api/jobs/{job_id}'
+            }), 202
+        
+        try:
+            result = import_interchange_data(file.stream, fmt, mode)
+        except (InterchangeError, UnicodeDecodeError) as e:
+            return jsonify({'success': False, 'error': f'文件格式错误: {str(e)}'}), 400
+        if result is None:
+            return jsonify({'success': False, 'error': '文件中没有数据'}), 400
         
+        return jsonify({
+            'success': True,
+            'message': '导入成功',
+            'format': fmt,
+            'mode': mode,
+            **result
+        })
+    except Exception as e:
+        import traceback
+        return jsonify({
+            'success': False,
+            'error': f'导入失败: {str(e)}',
+            'traceback': traceback.format_exc()
+        }), 500
+
+# 分类匹配器缓存：(分类版本号, CategoryMatcher)，分类增删改后下次使用时重建，项目变化不影响
+_CATEGORY_MATCHER = (None, None)
+_CATEGORY_MATCHER_LOCK = threading.Lock()
+
+def get_category_matcher():
+    """按数据库中的分类（按显示顺序）返回分类匹配器；分类没有变化时直接使用缓存的匹配器（只查询一次版本号）"""
+    global _CATEGORY_MATCHER
+    revision = get_categories_revision()
+    cached_revision, matcher = _CATEGORY_MATCHER
+    if cached_revision == revision:
+        return matcher
+    with _CATEGORY_MATCHER_LOCK:
+        cached_revision, matcher = _CATEGORY_MATCHER
+        if cached_revision != revision:
+            # 先读版本号再读分类：期间分类又有变化时，缓存的版本号偏旧，下次使用时会再重建
+            matcher = CategoryMatcher((category['name'] for category in get_all_categories()), revision)
+            _CATEGORY_MATCHER = (revision, matcher)
+        return matcher
+
+def parse_text_local(text, matcher=None):
+    """使用本地规则解析自然语言文本，提取装修项目信息（规则见 nl_parser.py）
+    matcher 为 CategoryMatcher；不传时使用缓存的分类匹配器
+    """
+    try:
+        if matcher is None:
+            matcher = get_category_matcher()
+        return {'success': True, 'item': parse_line(text, matcher)}
     except Exception as e:
         import traceback
         return {'error': f'解析失败: {str(e)}', 'traceback': traceback.format_exc()}
 
+def prepare_parsed_item(item):
+    """把解析结果整理成要添加的项目（原地修改）：移除分类字段、兼容旧字段名、计算差价；返回分类名"""
+    category = item.pop('category', '')
+    
+    # 兼容旧字段名，转换为新字段名
+    if '1st预算费用' in item and item['1st预算费用']:
+        if not item.get('预算费用'):
+            item['预算费用'] = item['1st预算费用']
+    if '2nd预算费用' in item and item['2nd预算费用']:
+        if not item.get('预算费用'):
+            item['预算费用'] = item['2nd预算费用']
+    if '最终实际花费' in item and item['最终实际花费']:
+        if not item.get('最终花费'):
+            item['最终花费'] = item['最终实际花费']
+    
+    # 计算差价
+    budget_cost = float(item.get('预算费用', 0) or 0)
+    final_cost = float(item.get('最终花费', 0) or 0)
+    item['差价'] = str(budget_cost - final_cost)
+    return category
+
 @app.route('/api/parse', methods=['POST'])
 def parse_text():
     """本地解析自然语言输入（支持批量）"""
@@ -2155,12 +3457,13 @@ def parse_text():
                 return jsonify(result), 500
             return jsonify({'success': True, 'item': result.get('item'), 'items': [result.get('item')], 'is_batch': False})
         else:
-            # 批量解析
+            # 批量解析（所有行共用一个分类匹配器）
             items = []
             errors = []
+            matcher = get_category_matcher()
             for i, line in enumerate(lines, 1):
                 try:
-                    result = parse_text_local(line)
+                    result = parse_text_local(line, matcher)
                     if 'item' in result:
                         items.append(result['item'])
                     else:
@@ -2231,27 +3534,7 @@ def parse_and_add():
                 return jsonify(parse_result), 500
             
             item = parse_result['item']
-            category = item.get('category', '')
-            
-            # 清理category字段，从item中移除
-            if 'category' in item:
-                del item['category']
-            
-            # 兼容旧字段名，转换为新字段名
-            if '1st预算费用' in item and item['1st预算费用']:
-                if not item.get('预算费用'):
-                    item['预算费用'] = item['1st预算费用']
-            if '2nd预算费用' in item and item['2nd预算费用']:
-                if not item.get('预算费用'):
-                    item['预算费用'] = item['2nd预算费用']
-            if '最终实际花费' in item and item['最终实际花费']:
-                if not item.get('最终花费'):
-                    item['最终花费'] = item['最终实际花费']
-            
-            # 计算差价
-            budget_cost = float(item.get('预算费用', 0) or 0)
-            final_cost = float(item.get('最终花费', 0) or 0)
-            item['差价'] = str(budget_cost - final_cost)
+            category = prepare_parsed_item(item)
             
             # 添加到数据库
             from database import add_item as db_add_item
@@ -2270,40 +3553,23 @@ def parse_and_add():
             success_count = 0
             error_count = 0
             errors = []
+            matcher = get_category_matcher()
             
             for i, line in enumerate(lines, 1):
                 try:
-                    parse_result = parse_text_local(line)
+                    parse_result = parse_text_local(line, matcher)
                     if 'error' in parse_result:
                         error_count += 1
                         errors.append(f'第{i}行: {parse_result.get("error", "解析失败")}')
                         continue
                     
                     item = parse_result['item']
-                    category = item.get('category', '')
-                    
-                    # 清理category字段
-                    if 'category' in item:
-                        del item['category']
-                    
-                    # 兼容旧字段名
-                    if '1st预算费用' in item and item['1st预算费用']:
-                        if not item.get('预算费用'):
-                            item['预算费用'] = item['1st预算费用']
-                    if '2nd预算费用' in item and item['2nd预算费用']:
-                        if not item.get('预算费用'):
-                            item['预算费用'] = item['2nd预算费用']
-                    if '最终实际花费' in item and item['最终实际花费']:
-                        if not item.get('最终花费'):
-                            item['最终花费'] = item['最终实际花费']
-                    
-                    # 计算差价
-                    budget_cost = float(item.get('预算费用', 0) or 0)
-                    final_cost = float(item.get('最终花费', 0) or 0)
-                    item['差价'] = str(budget_cost - final_cost)
+                    category = prepare_parsed_item(item)
                     
-                    # 添加项目
+                    # 添加项目（新建的分类加入匹配器，后面的行可以匹配到它）
                     db_add_item(item, category)
+                    if category and category not in matcher:
+                        matcher = get_category_matcher()
                     success_count += 1
                 except Exception as e:
                     error_count += 1
@@ -2330,6 +3596,187 @@ def parse_and_add():
         import traceback
         return jsonify({'error': str(e), 'traceback': traceback.format_exc()}), 500
 
+# 流式批量解析：结果按行以NDJSON输出（解析完一行输出一行），可以上传包含几千行的文本文件
+# 行数达到 PARSE_PARALLEL_MIN_LINES 时按 PARSE_CHUNK_LINES 行一段分给进程池解析（PARSE_WORKERS 为1时不使用进程池）
+PARSE_STREAM_MAX_LINES = int(os.getenv('PARSE_STREAM_MAX_LINES', '50000'))
+PARSE_PARALLEL_MIN_LINES = int(os.getenv('PARSE_PARALLEL_MIN_LINES', '2000'))
+PARSE_CHUNK_LINES = max(1, int(os.getenv('PARSE_CHUNK_LINES', '500')))
+PARSE_WORKERS = max(1, int(os.getenv('PARSE_WORKERS', str(os.cpu_count() or 1))))
+PARSE_ADD_BATCH_LINES = max(1, int(os.getenv('PARSE_ADD_BATCH_LINES', '200')))  # 添加模式下每个事务写入的行数
+PARSE_TEXT_ENCODINGS = ('utf-8-sig', 'gb18030')  # 上传文本文件依次尝试的编码
+_PARSE_POOL = None
+_PARSE_POOL_LOCK = threading.Lock()
+
+def _get_parse_pool():
+    """批量解析进程池（首次使用时创建，spawn方式启动；子进程只导入 nl_parser）"""
+    global _PARSE_POOL
+    with _PARSE_POOL_LOCK:
+        if _PARSE_POOL is None:
+            from concurrent.futures import ProcessPoolExecutor
+            import multiprocessing
+            _PARSE_POOL = ProcessPoolExecutor(
+                max_workers=PARSE_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _PARSE_POOL
+
+def _reset_parse_pool():
+    """子进程异常退出后进程池不可再用，丢弃它以便下次重新创建"""
+    global _PARSE_POOL
+    with _PARSE_POOL_LOCK:
+        _PARSE_POOL = None
+
+def iter_parse_results(lines):
+    """按行的顺序逐个产生解析结果（格式同 parse_text_local）
+    行数较多时把各段同时提交给进程池，再按段的顺序取回：前面的段解析完就先输出，不等全部完成
+    """
+    matcher = get_category_matcher()
+    if len(lines) < PARSE_PARALLEL_MIN_LINES or PARSE_WORKERS < 2:
+        for line in lines:
+            yield parse_text_local(line, matcher)
+        return
+    
+    from concurrent.futures.process import BrokenProcessPool
+    chunks = [lines[start:start + PARSE_CHUNK_LINES] for start in range(0, len(lines), PARSE_CHUNK_LINES)]
+    futures = []
+    broken = False
+    try:
+        pool = _get_parse_pool()
+        # 带上分类版本号：子进程在分类没有变化时复用上次构建的匹配器，不用每段都重建索引
+        futures = [pool.submit(parse_lines, chunk, matcher.categories, matcher.revision) for chunk in chunks]
+    except BrokenProcessPool as e:
+        broken = True
+        _reset_parse_pool()
+        print(f"⚠️ 解析进程池不可用，在当前进程解析: {e}")
+    
+    print(f"📝 并行解析 {len(lines)} 行（{len(chunks)} 段，{PARSE_WORKERS} 个进程）")
+    try:
+        for index, chunk in enumerate(chunks):
+            results = None
+            if not broken:
+                try:
+                    results = futures[index].result()
+                except BrokenProcessPool as e:
+                    # 子进程异常退出：剩下的段在当前进程解析
+                    broken = True
+                    _reset_parse_pool()
+                    print(f"⚠️ 解析进程池异常退出，剩余的行在当前进程解析: {e}")
+            if results is None:
+                results = [parse_text_local(line, matcher) for line in chunk]
+            yield from results
+    finally:
+        # 客户端中途断开时生成器被关闭，取消还没开始的段
+        for future in futures:
+            future.cancel()
+
+def iter_parse_and_add_results(lines):
+    """逐行解析并添加项目，按行的顺序产生结果
+    每 PARSE_ADD_BATCH_LINES 行在一个事务中写入数据库，写入后再输出这几行的结果；
+    新建的分类立即加入匹配器，后面的行可以匹配到它（与 /api/parse-and-add 逐行添加的结果一致，因此不使用进程池）
+    """
+    matcher = get_category_matcher()
+    for start in range(0, len(lines), PARSE_ADD_BATCH_LINES):
+        results = []
+        operations = []
+        for line in lines[start:start + PARSE_ADD_BATCH_LINES]:
+            result = parse_text_local(line, matcher)
+            if 'item' in result:
+                item = result['item']
+                category = prepare_parsed_item(item)
+                result['category'] = category
+                operations.append({'op': 'add', 'item': item, 'category': category})
+                if category and category not in matcher:
+                    matcher = CategoryMatcher(matcher.categories + [category])
+            results.append(result)
+        
+        if operations:
+            try:
+                added = iter(apply_batch_operations(operations))
+            except Exception as e:
+                # 整批回滚：这几行都算失败，匹配器恢复为数据库中的分类
+                for result in results:
+                    if 'item' in result:
+                        result.clear()
+                        result['error'] = f'添加失败: {str(e)}'
+                matcher = get_category_matcher()
+            else:
+                for result in results:
+                    if 'item' in result:
+                        result['id'] = next(added)['id']
+        yield from results
+
+def read_parse_stream_input():
+    """读取流式解析的输入，返回 (文本, 是否添加)
+    上传文本文件（表单字段 file，可选表单字段 add=true）或者JSON {"text": ..., "add": false}
+    """
+    if 'file' in request.files:
+        file = request.files['file']
+        if file.filename == '':
+            raise ValueError('未选择文件')
+        raw = file.read()
+        for encoding in PARSE_TEXT_ENCODINGS:
+            try:
+                text = raw.decode(encoding)
+                break
+            except UnicodeDecodeError:
+                continue
+        else:
+            raise ValueError('无法识别文件编码，请上传UTF-8或GBK编码的文本文件')
+        add = request.form.get('add', 'false').lower() == 'true'
+    else:
+        data = request.get_json(silent=True) or {}
+        text = data.get('text', '')
+        add = bool(data.get('add', False))
+    return text, add
+
+def generate_parse_stream(lines, add=False):
+    """流式解析的NDJSON输出：每行一个结果，最后一行是汇总（中途出错时汇总中带 error）"""
+    success_count = 0
+    error_count = 0
+    try:
+        results = iter_parse_and_add_results(lines) if add else iter_parse_results(lines)
+        for number, (line, result) in enumerate(zip(lines, results), 1):
+            if 'error' in result:
+                error_count += 1
+            else:
+                success_count += 1
+            yield json.dumps({'line': number, 'text': line, **result}, ensure_ascii=False) + '\n'
+        summary = {'done': True, 'total': len(lines), 'success_count': success_count, 'error_count': error_count}
+    except Exception as e:
+        print(f"❌ 流式解析失败: {e}")
+        summary = {'done': True, 'total': len(lines), 'success_count': success_count, 'error_count': error_count,
+                   'error': str(e)}
+    yield json.dumps(summary, ensure_ascii=False) + '\n'
+
+@app.route('/api/parse-stream', methods=['POST'])
+def parse_stream():
+    """流式批量解析（NDJSON）：每解析完一行就输出一行结果，适合粘贴或上传几千行的文本
+    请求：JSON {"text": "...", "add": false}，或 multipart 上传文本文件（字段 file，可选字段 add=true）
+    add 为 true 时同时添加解析成功的项目
+    输出（application/x-ndjson）：
+        {"line": 1, "text": "原文", "success": true, "item": {...}}（添加模式另有 "category"、"id"）
+        {"line": 2, "text": "原文", "error": "..."}
+        {"done": true, "total": 2, "success_count": 1, "error_count": 1}
+    """
+    try:
+        text, add = read_parse_stream_input()
+        lines = [line.strip() for line in text.split('\n') if line.strip()]
+        if not lines:
+            return jsonify({'error': '请输入文本'}), 400
+        if len(lines) > PARSE_STREAM_MAX_LINES:
+            return jsonify({'error': f'一次最多解析 {PARSE_STREAM_MAX_LINES} 行（当前 {len(lines)} 行）'}), 400
+        
+        return Response(
+            generate_parse_stream(lines, add),
+            mimetype='application/x-ndjson',
+            headers={'X-Accel-Buffering': 'no', 'Cache-Control': 'no-cache'}  # 不让反向代理缓冲输出
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        import traceback
+        return jsonify({'error': str(e), 'traceback': traceback.format_exc()}), 500
+
 # 应用启动时预注册中文字体（避免首次PDF导出时的延迟）
 def _init_fonts_on_startup():
     """在应用启动时预注册字体"""
@@ -2345,23 +3792,29 @@ def _init_fonts_on_startup():
         except Exception as e:
             print(f" ⚠ 字体注册失败: {e}")
 
+@app.route('/api/startup-report', methods=['GET'])
+def startup_report_route():
+    """查看启动耗时报告，以及重量级依赖是否已被加载"""
+    return jsonify({
+        'success': True,
+        'report': STARTUP_REPORT,
+        'lazy_modules_loaded': {
+            name: name in sys.modules for name in ('pandas', 'openpyxl', 'reportlab')
+        }
+    })
+
+# 模块导入耗时（不含一次性启动任务）
+STARTUP_REPORT['import_ms'] = round((time.perf_counter() - _IMPORT_STARTED) * 1000, 2)
+
 # 如果是直接运行（不是被导入），在启动时初始化字体
 if __name__ == '__main__':
-    import os
     # 检查环境变量，生产环境不使用debug模式
     debug_mode = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
     # 默认监听本地，可通过环境变量FLASK_HOST=0.0.0.0允许局域网访问
     host = os.getenv('FLASK_HOST', '127.0.0.1')
     port = int(os.getenv('FLASK_PORT', '5000'))
     
+    create_app()
     if REPORTLAB_AVAILABLE:
         _init_fonts_on_startup()
     app.run(debug=debug_mode, host=host, port=port)
-else:
-    # 如果是被导入（如gunicorn），使用异步初始化避免阻塞
-    if REPORTLAB_AVAILABLE:
-        import threading
-        def _init_fonts_async():
-            """异步初始化字体，避免阻塞应用启动"""
-            _init_fonts_on_startup()
-        threading.Thread(target=_init_fonts_async, daemon=True).start()
@@ -0,0 +1,181 @@
+"""
+分块断点续传上传
+每个上传会话在暂存目录中对应两个文件：<id>.part（已接收的数据）和 <id>.json（文件名、总大小、已接收字节数等）
+客户端按偏移量逐块追加，每块带SHA-256校验；连接中断后查询当前偏移量即可从断点继续
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，同一上传的并发追加由偏移量检查兜底
+    fcntl = None
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    """上传请求无效（返回给客户端的错误，status 为HTTP状态码）"""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class ChunkedUploadStore:
+    """分块上传暂存区（所有状态都在磁盘上，多个worker进程共享）"""
+
+    def __init__(self, staging_dir, max_size, max_age_seconds=24 * 60 * 60):
+        self.staging_dir = staging_dir
+        self.max_size = max_size
+        self.max_age_seconds = max_age_seconds
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+    def _paths(self, upload_id):
+        # upload_id 来自客户端，只接受自己生成的十六进制ID，防止路径穿越
+        if not upload_id or len(upload_id) != 32 or any(c not in '0123456789abcdef' for c in upload_id):
+            raise UploadError('上传不存在', status=404)
+        base = os.path.join(self.staging_dir, upload_id)
+        return base + '.part', base + '.json'
+
+    def _read_meta(self, meta_path):
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadError('上传不存在或已过期', status=404)
+
+    def _write_meta(self, meta_path, meta):
+        tmp_path = meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, meta_path)
+
+    def create(self, filename, size, checksum=None, extra=None):
+        """新建上传会话，返回会话信息"""
+        if size <= 0:
+            raise UploadError('文件大小无效')
+        if size > self.max_size:
+            raise UploadError(f'文件过大（最大 {self.max_size // (1024 * 1024)}MB）', status=413)
+
+        self.cleanup_expired()
+        upload_id = uuid.uuid4().hex
+        part_path, meta_path = self._paths(upload_id)
+        open(part_path, 'wb').close()
+        meta = {
+            'id': upload_id,
+            'filename': filename,
+            'size': size,
+            'checksum': checksum.lower() if checksum else None,
+            'offset': 0,
+            'extra': extra or {},
+            'created_at': time.time(),
+        }
+        self._write_meta(meta_path, meta)
+        return meta
+
+    def status(self, upload_id):
+        """上传会话的当前状态（offset 为已接收的字节数）"""
+        _, meta_path = self._paths(upload_id)
+        return self._read_meta(meta_path)
+
+    def append(self, upload_id, offset, stream, checksum=None):
+        """把一个分块从stream追加到暂存文件，返回更新后的会话信息
+
+        offset 必须等于已接收的字节数（否则返回409和当前偏移量，客户端据此续传）；
+        提供checksum时校验这一块的SHA-256，不一致则丢弃这一块
+        """
+        part_path, meta_path = self._paths(upload_id)
+        try:
+            part = open(part_path, 'r+b')
+        except FileNotFoundError:
+            raise UploadError('上传不存在或已完成', status=404)
+        with part:
+            if fcntl is not None:
+                fcntl.flock(part, fcntl.LOCK_EX)
+            meta = self._read_meta(meta_path)
+            # 以文件实际大小为准（sidecar 可能在上一次追加中途失败时落后）
+            received = min(os.fstat(part.fileno()).st_size, meta['offset'])
+            if offset != received:
+                raise UploadError('偏移量不匹配，请从服务器返回的偏移量继续上传', status=409, offset=received)
+
+            digest = hashlib.sha256()
+            part.seek(received)
+            part.truncate()
+            written = 0
+            while True:
+                block = stream.read(COPY_BUFFER_SIZE)
+                if not block:
+                    break
+                written += len(block)
+                if received + written > meta['size']:
+                    part.truncate(received)
+                    raise UploadError('数据超出声明的文件大小', offset=received)
+                digest.update(block)
+                part.write(block)
+
+            if checksum and digest.hexdigest() != checksum.lower():
+                part.truncate(received)
+                raise UploadError('分块校验失败，请重新上传这一块', status=422, offset=received)
+
+            part.flush()
+            os.fsync(part.fileno())
+            meta['offset'] = received + written
+            self._write_meta(meta_path, meta)
+        return meta
+
+    def finish(self, upload_id, dest_path):
+        """上传完成后校验整个文件（如果创建时提供了checksum），并移动到dest_path"""
+        part_path, meta_path = self._paths(upload_id)
+        meta = self._read_meta(meta_path)
+        if meta['offset'] != meta['size']:
+            raise UploadError('上传尚未完成', status=409, offset=meta['offset'])
+
+        if meta['checksum']:
+            digest = hashlib.sha256()
+            with open(part_path, 'rb') as f:
+                for block in iter(lambda: f.read(COPY_BUFFER_SIZE), b''):
+                    digest.update(block)
+            if digest.hexdigest() != meta['checksum']:
+                self.discard(upload_id)
+                raise UploadError('文件校验失败，请重新上传', status=422)
+
+        try:
+            os.replace(part_path, dest_path)
+        except FileNotFoundError:
+            # 并发的另一个请求已经完成了这个上传
+            raise UploadError('上传不存在或已完成', status=404)
+        os.remove(meta_path)
+        return meta
+
+    def discard(self, upload_id):
+        """放弃上传，删除暂存文件"""
+        for path in self._paths(upload_id):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def cleanup_expired(self):
+        """删除超过有效期仍未完成的上传，返回删除的会话数"""
+        deadline = time.time() - self.max_age_seconds
+        deleted = 0
+        try:
+            names = os.listdir(self.staging_dir)
+        except OSError:
+            return 0
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.staging_dir, name)
+            try:
+                if os.path.getmtime(path) < deadline:
+                    self.discard(name[:-len('.json')])
+                    deleted += 1
+            except (OSError, UploadError):
+                continue
+        return deleted
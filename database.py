@@ -6,8 +6,10 @@
 import sqlite3
 import os
 import shutil
+import json
+import uuid
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Iterator, Iterable
 
 # 持久存储路径（挂载的存储桶）
 PERSISTENT_STORAGE = '/mnt'
@@ -80,12 +82,6 @@ def _migrate_to_persistent_storage():
         except Exception as e:
             print(f"⚠️ 备份文件迁移失败: {e}")
 
-# 在模块加载时尝试迁移
-_migrate_to_persistent_storage()
-
-# 重新初始化路径（迁移后）
-DB_FILE, BACKUP_DIR, USE_PERSISTENT = _get_db_paths()
-
 def get_db_connection():
     """获取数据库连接，带错误处理和回退机制"""
     global DB_FILE, BACKUP_DIR, USE_PERSISTENT  # 在函数开始处声明 global
@@ -142,7 +138,10 @@ def get_db_connection():
             raise
 
 def init_database():
-    """初始化数据库，创建表结构"""
+    """初始化数据库，创建表结构（一次性启动任务，会先尝试迁移到持久存储）"""
+    # 迁移只复制文件，不改变路径（DB_FILE 在模块加载时已经指向持久存储）
+    _migrate_to_persistent_storage()
+    
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -181,9 +180,168 @@ def init_database():
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_seq_num ON items(seq_num)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_category_order ON categories(order_index)')
     
+    # 数据版本号（导出缓存用来判断数据是否变化）
+    _ensure_revision_tracking(cursor)
+    
+    # 后台任务表
+    _ensure_jobs_table(cursor)
+    
     conn.commit()
+    
+    # 启用增量自动清理，删除数据后的空闲页可以通过 incremental_vacuum 回收
+    _ensure_incremental_auto_vacuum(conn)
+    
     conn.close()
 
+def _ensure_revision_tracking(cursor):
+    """创建数据版本号和触发器：items/categories 的任何增删改都会让版本号加1"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('data_revision', 0)")
+    for table in ('items', 'categories'):
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_revision
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE meta SET value = value + 1 WHERE key = 'data_revision';
+                END
+            ''')
+    # 分类版本号：只在 categories 变化时递增（自然语言解析的分类匹配器据此判断是否需要重建）
+    cursor.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('categories_revision', 0)")
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_categories_{event.lower()}_categories_revision
+            AFTER {event} ON categories
+            BEGIN
+                UPDATE meta SET value = value + 1 WHERE key = 'categories_revision';
+            END
+        ''')
+
+def _get_meta_value(key: str, conn=None) -> int:
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row['value'] if row else 0
+    finally:
+        if own_conn:
+            conn.close()
+
+def get_data_revision(conn=None) -> int:
+    """获取当前数据版本号（数据每次变化都会递增）"""
+    return _get_meta_value('data_revision', conn)
+
+def get_categories_revision(conn=None) -> int:
+    """获取当前分类版本号（分类每次增删改都会递增，项目变化不影响）"""
+    return _get_meta_value('categories_revision', conn)
+
+def _ensure_incremental_auto_vacuum(conn):
+    """将数据库切换为 auto_vacuum=INCREMENTAL（已有数据库需要执行一次VACUUM才能生效）"""
+    try:
+        mode = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        if mode != 2:  # 0=NONE, 1=FULL, 2=INCREMENTAL
+            print("🔧 正在启用数据库增量清理（auto_vacuum=INCREMENTAL）...")
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+    except sqlite3.Error as e:
+        print(f"⚠️ 启用增量清理失败: {e}")
+
+def get_database_stats(conn=None) -> Dict:
+    """获取数据库文件统计信息（页数、空闲页数、页大小）"""
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    try:
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+        freelist_count = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        return {
+            'page_size': page_size,
+            'page_count': page_count,
+            'freelist_count': freelist_count,
+            'file_size': page_size * page_count,
+            'auto_vacuum': {0: 'none', 1: 'full', 2: 'incremental'}.get(auto_vacuum, str(auto_vacuum))
+        }
+    finally:
+        if own_conn:
+            conn.close()
+
+# 最近一次维护的报告（进程内）
+_LAST_MAINTENANCE_REPORT = None
+
+def run_maintenance(reason: str = 'scheduled', analyze: bool = False) -> Dict:
+    """数据库维护：回收空闲页、更新查询规划统计信息，返回维护报告
+    Args:
+        reason: 触发原因（scheduled/import/manual）
+        analyze: 是否执行完整的ANALYZE（批量导入后统计信息已失效），否则执行 PRAGMA optimize
+    """
+    global _LAST_MAINTENANCE_REPORT
+    import time
+    
+    started = time.perf_counter()
+    conn = get_db_connection()
+    try:
+        before = get_database_stats(conn)
+        
+        # 回收空闲页（execute 只会执行一步、回收一页，executescript 会执行到完成）
+        conn.executescript('PRAGMA incremental_vacuum;')
+        
+        # 更新查询规划统计信息
+        if analyze:
+            conn.execute('ANALYZE')
+        else:
+            conn.execute('PRAGMA optimize')
+        
+        _checkpoint(conn)
+        after = get_database_stats(conn)
+    finally:
+        conn.close()
+    
+    report = {
+        'reason': reason,
+        'analyzed': analyze,
+        'started_at': datetime.now().isoformat(),
+        'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+        'before': before,
+        'after': after,
+        'pages_reclaimed': before['page_count'] - after['page_count']
+    }
+    _LAST_MAINTENANCE_REPORT = report
+    return report
+
+def get_last_maintenance_report() -> Optional[Dict]:
+    """获取本进程最近一次维护报告"""
+    return _LAST_MAINTENANCE_REPORT
+
+def is_database_empty() -> bool:
+    """检查数据库是否没有任何分类和项目（不加载数据）"""
+    conn = get_db_connection()
+    try:
+        row = conn.execute(
+            'SELECT EXISTS(SELECT 1 FROM items) OR EXISTS(SELECT 1 FROM categories) AS has_data'
+        ).fetchone()
+        return not row['has_data']
+    finally:
+        conn.close()
+
+def get_item_count(filters: Dict = None) -> int:
+    """项目总数（不加载数据）；filters 见 build_item_filter"""
+    where_sql, where_params = build_item_filter(filters)
+    conn = get_db_connection()
+    try:
+        if where_sql:
+            return conn.execute(f'SELECT COUNT(*) FROM items WHERE {where_sql}', where_params).fetchone()[0]
+        return conn.execute('SELECT COUNT(*) FROM items').fetchone()[0]
+    finally:
+        conn.close()
+
 def get_all_categories() -> List[Dict]:
     """获取所有分类"""
     conn = get_db_connection()
@@ -202,15 +360,11 @@ def get_category_by_name(name: str) -> Optional[Dict]:
     conn.close()
     return dict(row) if row else None
 
-def add_category(name: str) -> int:
-    """添加分类，返回分类ID"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # 检查是否已存在
-    existing = get_category_by_name(name)
+def _get_or_create_category_id(cursor, name: str) -> int:
+    """在给定游标（事务）中获取或创建分类，返回分类ID"""
+    cursor.execute('SELECT id FROM categories WHERE name = ?', (name,))
+    existing = cursor.fetchone()
     if existing:
-        conn.close()
         return existing['id']
     
     # 获取最大order_index
@@ -222,10 +376,18 @@ def add_category(name: str) -> int:
         'INSERT INTO categories (name, order_index) VALUES (?, ?)',
         (name, max_order + 1)
     )
-    category_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return category_id
+    return cursor.lastrowid
+
+def add_category(name: str) -> int:
+    """添加分类，返回分类ID"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        category_id = _get_or_create_category_id(cursor, name)
+        conn.commit()
+        return category_id
+    finally:
+        conn.close()
 
 def delete_category(category_id: int) -> str:
     """删除分类及其关联的项目，返回消息"""
@@ -283,14 +445,20 @@ def get_item_by_id(item_id: int) -> Optional[Dict]:
     conn.close()
     return dict(row) if row else None
 
-def add_item(item_data: Dict, category_name: str = None) -> int:
-    """添加项目，返回项目ID"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
+def _checkpoint(conn):
+    """在WAL模式下执行checkpoint，确保数据同步到主数据库文件
+    这对于持久化存储（如COS挂载）很重要
+    """
+    try:
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    except:
+        pass  # 如果checkpoint失败，不影响主流程
+
+def _insert_item(cursor, item_data: Dict, category_name: str = None) -> int:
+    """在给定游标（事务）中插入项目，返回项目ID"""
     # 获取或创建分类
     if category_name:
-        category_id = add_category(category_name)
+        category_id = _get_or_create_category_id(cursor, category_name)
     else:
         category_id = None
     
@@ -327,29 +495,13 @@ def add_item(item_data: Dict, category_name: str = None) -> int:
         item_data.get('备注', '')
     ))
     
-    item_id = cursor.lastrowid
-    
-    # 提交事务，确保数据立即写入
-    conn.commit()
-    
-    # 在WAL模式下，执行checkpoint确保数据同步到主数据库文件
-    # 这对于持久化存储（如COS挂载）很重要
-    try:
-        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
-    except:
-        pass  # 如果checkpoint失败，不影响主流程
-    
-    conn.close()
-    return item_id
+    return cursor.lastrowid
 
-def update_item(item_id: int, item_data: Dict, category_name: str = None):
-    """更新项目"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
+def _update_item(cursor, item_id: int, item_data: Dict, category_name: str = None) -> int:
+    """在给定游标（事务）中更新项目，返回受影响的行数"""
     # 获取或创建分类
     if category_name:
-        category_id = add_category(category_name)
+        category_id = _get_or_create_category_id(cursor, category_name)
     else:
         # 保持原有分类
         cursor.execute('SELECT category_id FROM items WHERE id = ?', (item_id,))
@@ -389,28 +541,10 @@ def update_item(item_id: int, item_data: Dict, category_name: str = None):
         item_data.get('备注', ''),
         item_id
     ))
-    
-    # 提交事务，确保数据立即写入
-    conn.commit()
-    
-    # 在WAL模式下，执行checkpoint确保数据同步到主数据库文件
-    # 这对于持久化存储（如COS挂载）很重要
-    try:
-        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
-    except:
-        pass  # 如果checkpoint失败，不影响主流程
-    
-    conn.close()
+    return cursor.rowcount
 
-def delete_items(item_ids: List[int]) -> str:
-    """删除项目，返回消息"""
-    if not item_ids:
-        return ''
-    
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # 检查是否有分类行（项目名包含"合计"或"总计"的项目不能删除）
+def _split_protected_items(cursor, item_ids: List[int]) -> Tuple[List[int], List[int]]:
+    """将项目ID分为受保护的（合计行、总计行）和可删除的两组"""
     placeholders = ','.join(['?'] * len(item_ids))
     cursor.execute(f'''
         SELECT id, project_name FROM items WHERE id IN ({placeholders})
@@ -427,7 +561,48 @@ def delete_items(item_ids: List[int]) -> str:
         else:
             deletable_items.append(item['id'])
     
+    return protected_items, deletable_items
+
+def add_item(item_data: Dict, category_name: str = None) -> int:
+    """添加项目，返回项目ID"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    item_id = _insert_item(cursor, item_data, category_name)
+    
+    # 提交事务，确保数据立即写入
+    conn.commit()
+    _checkpoint(conn)
+    
+    conn.close()
+    return item_id
+
+def update_item(item_id: int, item_data: Dict, category_name: str = None):
+    """更新项目"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    _update_item(cursor, item_id, item_data, category_name)
+    
+    # 提交事务，确保数据立即写入
+    conn.commit()
+    _checkpoint(conn)
+    
+    conn.close()
+
+def delete_items(item_ids: List[int]) -> str:
+    """删除项目，返回消息"""
+    if not item_ids:
+        return ''
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    # 检查是否有分类行（项目名包含"合计"或"总计"的项目不能删除）
+    protected_items, deletable_items = _split_protected_items(cursor, item_ids)
+    
     if protected_items:
+        conn.close()
         return f'部分项目受保护，无法删除（合计行、总计行等）'
     
     if deletable_items:
@@ -438,6 +613,402 @@ def delete_items(item_ids: List[int]) -> str:
     conn.close()
     return '删除成功'
 
+class BatchOperationError(ValueError):
+    """批量操作中某个操作无效（index 为该操作在列表中的下标）"""
+
+    def __init__(self, index: int, message: str):
+        super().__init__(f'第{index + 1}个操作：{message}')
+        self.index = index
+
+# 批量操作中可以出现的数值字段（与 _insert_item / _update_item 的解析保持一致）
+_BATCH_NUMERIC_FIELDS = ('预算费用', '当前投入', '最终花费', '差价')
+
+def _is_row_id(value) -> bool:
+    """是否为有效的行ID（整数或纯数字字符串，布尔值除外）"""
+    if isinstance(value, bool):
+        return False
+    return isinstance(value, int) or (isinstance(value, str) and value.isdigit())
+
+def _is_integer(value) -> bool:
+    """是否为整数（布尔值除外）"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _validate_batch_item(item, require_id: bool = False) -> Optional[str]:
+    """检查增/改操作中的项目数据，返回错误信息（有效时返回None）"""
+    if not isinstance(item, dict):
+        return '缺少项目数据（item 必须是对象）'
+    if require_id and not _is_row_id(item.get('id')):
+        return '项目ID不能为空且必须是整数'
+    for field in _BATCH_NUMERIC_FIELDS:
+        value = item.get(field)
+        if value in (None, ''):
+            continue
+        if isinstance(value, bool):
+            return f'{field}必须是数字'
+        try:
+            float(value)
+        except (TypeError, ValueError):
+            return f'{field}必须是数字: {value}'
+    return None
+
+def validate_batch_operations(operations) -> None:
+    """在执行前检查每个批量操作的类型和必填字段，发现无效操作时抛出 BatchOperationError"""
+    if not isinstance(operations, list):
+        raise ValueError('operations 必须是列表')
+    
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            raise BatchOperationError(index, '操作必须是对象')
+        op = operation.get('op')
+        category = operation.get('category')
+        if category is not None and not isinstance(category, str):
+            raise BatchOperationError(index, '分类名称必须是字符串')
+        
+        if op in ('add', 'update'):
+            error = _validate_batch_item(operation.get('item'), require_id=(op == 'update'))
+            if error:
+                raise BatchOperationError(index, error)
+        
+        elif op == 'delete':
+            item_ids = operation.get('item_ids')
+            if not isinstance(item_ids, list) or not item_ids:
+                raise BatchOperationError(index, '请选择要删除的项目（item_ids 必须是非空列表）')
+            if not all(_is_row_id(item_id) for item_id in item_ids):
+                raise BatchOperationError(index, '项目ID必须是整数')
+        
+        elif op == 'reorder':
+            orders = operation.get('orders')
+            category_id = operation.get('category_id')
+            if category_id is not None and not _is_row_id(category_id):
+                raise BatchOperationError(index, '分类ID必须是整数')
+            if not isinstance(orders, list):
+                raise BatchOperationError(index, 'orders 必须是列表')
+            # 项目排序需要 seq_num，分类排序需要 order_index
+            order_key = 'seq_num' if category_id is not None else 'order_index'
+            for order in orders:
+                if not isinstance(order, dict) or not _is_row_id(order.get('id')):
+                    raise BatchOperationError(index, 'orders 中每一项都需要整数 id')
+                if not _is_integer(order.get(order_key)):
+                    raise BatchOperationError(index, f'orders 中每一项都需要整数 {order_key}')
+        
+        else:
+            raise BatchOperationError(index, f'不支持的操作类型: {op}')
+
+def apply_batch_operations(operations: List[Dict]) -> List[Dict]:
+    """在同一个事务中按顺序执行一组增/改/删/排序操作（全部成功或全部回滚）
+    Args:
+        operations: [
+            {'op': 'add', 'item': {...}, 'category': '分类名'},
+            {'op': 'update', 'item': {'id': 1, ...}, 'category': '分类名'},
+            {'op': 'delete', 'item_ids': [1, 2]},
+            {'op': 'reorder', 'category_id': 1, 'orders': [{'id': 1, 'seq_num': 1}, ...]},
+            {'op': 'reorder', 'orders': [{'id': 1, 'order_index': 0}, ...]},  # 分类排序
+        ]
+    Returns:
+        每个操作的执行结果列表
+    Raises:
+        BatchOperationError: 某个操作无效或执行失败（整批回滚）
+    """
+    # 先检查全部操作，避免执行到一半才发现格式错误
+    validate_batch_operations(operations)
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    results = []
+    
+    try:
+        cursor.execute('BEGIN IMMEDIATE TRANSACTION')
+        
+        for index, operation in enumerate(operations):
+            op = operation.get('op')
+            
+            if op == 'add':
+                item_id = _insert_item(cursor, operation['item'], operation.get('category') or None)
+                results.append({'index': index, 'op': op, 'id': item_id})
+            
+            elif op == 'update':
+                item = operation['item']
+                item_id = item['id']
+                if _update_item(cursor, item_id, item, operation.get('category') or None) == 0:
+                    raise BatchOperationError(index, f'项目不存在（ID: {item_id}）')
+                results.append({'index': index, 'op': op, 'id': item_id})
+            
+            elif op == 'delete':
+                protected_items, deletable_items = _split_protected_items(cursor, operation['item_ids'])
+                if protected_items:
+                    raise BatchOperationError(index, '部分项目受保护，无法删除（合计行、总计行等）')
+                if deletable_items:
+                    placeholders = ','.join(['?'] * len(deletable_items))
+                    cursor.execute(f'DELETE FROM items WHERE id IN ({placeholders})', deletable_items)
+                results.append({'index': index, 'op': op, 'deleted': len(deletable_items)})
+            
+            elif op == 'reorder':
+                orders = operation['orders']
+                category_id = operation.get('category_id')
+                if category_id is not None:
+                    cursor.executemany(
+                        'UPDATE items SET seq_num = ? WHERE id = ? AND category_id = ?',
+                        [(o['seq_num'], o['id'], category_id) for o in orders]
+                    )
+                else:
+                    cursor.executemany(
+                        'UPDATE categories SET order_index = ? WHERE id = ?',
+                        [(o['order_index'], o['id']) for o in orders]
+                    )
+                results.append({'index': index, 'op': op, 'updated': len(orders)})
+        
+        conn.commit()
+        _checkpoint(conn)
+        return results
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+# API字段名 -> items表列名
+ITEM_FIELD_COLUMNS = {
+    '项目': 'project_name',
+    '单位': 'unit',
+    '预算数量': 'budget_quantity',
+    '预算费用': 'budget_cost',
+    '当前投入': 'current_investment',
+    '最终花费': 'final_cost',
+    '差价': 'diff',
+    '备注': 'remark',
+}
+NUMERIC_ITEM_COLUMNS = {'budget_cost', 'current_investment', 'final_cost', 'diff'}
+
+# 金额范围筛选：筛选键前缀 -> 列名
+_RANGE_FILTER_COLUMNS = {
+    'budget': 'budget_cost',
+    'current': 'current_investment',
+    'final': 'final_cost',
+    'diff': 'diff',
+}
+
+# 状态筛选：状态名 -> 条件（多个状态之间为“或”）
+ITEM_STATUS_FILTERS = {
+    'pending': 'IFNULL(items.final_cost, 0) = 0',   # 还没有最终花费（待支出）
+    'settled': 'IFNULL(items.final_cost, 0) != 0',  # 已有最终花费
+    'in_progress': 'IFNULL(items.current_investment, 0) != 0 AND IFNULL(items.final_cost, 0) = 0',  # 已投入、未结算
+    'over_budget': 'IFNULL(items.final_cost, 0) > IFNULL(items.budget_cost, 0)',  # 最终花费超出预算
+}
+
+# 受保护的行（合计行、总计行），与 delete_items 的判断保持一致
+_PROTECTED_ITEM_SQL = "(IFNULL(items.project_name, '') LIKE '%合计%' OR IFNULL(items.project_name, '') LIKE '%总计%')"
+
+def _like_pattern(text: str) -> str:
+    """转义LIKE通配符，生成包含匹配的模式"""
+    escaped = str(text).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+def _as_list(value) -> list:
+    """将单个值或列表统一为列表"""
+    return value if isinstance(value, (list, tuple)) else [value]
+
+def build_item_filter(filters: Dict) -> Tuple[str, list]:
+    """根据筛选条件构建items表的WHERE子句
+    Args:
+        filters: {
+            'item_ids': [1, 2],
+            'category': '分类名' 或 ['分类1', '分类2'],
+            'category_id': 1 或 [1, 2],
+            'name_contains': '柜',            # 项目名包含
+            'remark_contains': '网购',        # 备注包含
+            'budget_min': 0, 'budget_max': 1000,   # 金额范围（budget/current/final/diff）
+            'empty': ['备注', '当前投入'],     # 字段为空（文本为空，数值为0）
+            'status': 'pending' 或 ['pending', 'over_budget'],  # 见 ITEM_STATUS_FILTERS
+        }
+    Returns:
+        (where_sql, params)，where_sql 不包含 WHERE 关键字
+    """
+    clauses = []
+    params = []
+    
+    for key, value in (filters or {}).items():
+        if value is None or value == '' or value == []:
+            continue
+        
+        if key == 'item_ids':
+            values = [int(v) for v in _as_list(value)]
+            clauses.append(f"items.id IN ({','.join(['?'] * len(values))})")
+            params.extend(values)
+        elif key == 'category':
+            values = _as_list(value)
+            clauses.append(
+                f"items.category_id IN (SELECT id FROM categories WHERE name IN ({','.join(['?'] * len(values))}))"
+            )
+            params.extend(values)
+        elif key == 'category_id':
+            values = [int(v) for v in _as_list(value)]
+            clauses.append(f"items.category_id IN ({','.join(['?'] * len(values))})")
+            params.extend(values)
+        elif key == 'name_contains':
+            clauses.append("items.project_name LIKE ? ESCAPE '\\'")
+            params.append(_like_pattern(value))
+        elif key == 'remark_contains':
+            clauses.append("items.remark LIKE ? ESCAPE '\\'")
+            params.append(_like_pattern(value))
+        elif key == 'empty':
+            for field in _as_list(value):
+                column = ITEM_FIELD_COLUMNS.get(field, field)
+                if column not in ITEM_FIELD_COLUMNS.values():
+                    raise ValueError(f'不支持的字段: {field}')
+                if column in NUMERIC_ITEM_COLUMNS:
+                    clauses.append(f'IFNULL(items.{column}, 0) = 0')
+                else:
+                    clauses.append(f"IFNULL(items.{column}, '') = ''")
+        elif key == 'status':
+            conditions = []
+            for status in _as_list(value):
+                if status not in ITEM_STATUS_FILTERS:
+                    raise ValueError(f'不支持的状态: {status}（可用 {"、".join(ITEM_STATUS_FILTERS)}）')
+                conditions.append(f'({ITEM_STATUS_FILTERS[status]})')
+            clauses.append(f"({' OR '.join(conditions)})")
+        elif key.endswith('_min') or key.endswith('_max'):
+            column = _RANGE_FILTER_COLUMNS.get(key[:-4])
+            if not column:
+                raise ValueError(f'不支持的筛选条件: {key}')
+            operator = '>=' if key.endswith('_min') else '<='
+            clauses.append(f'IFNULL(items.{column}, 0) {operator} ?')
+            params.append(float(value))
+        else:
+            raise ValueError(f'不支持的筛选条件: {key}')
+    
+    return ' AND '.join(clauses), params
+
+def bulk_update_items(filters: Dict, changes: Dict) -> Dict:
+    """按筛选条件批量更新项目（单条UPDATE语句），合计行、总计行不会被修改
+    Args:
+        filters: 筛选条件，见 build_item_filter
+        changes: {'category': '新分类', '当前投入': 0, '备注': '...'}
+    Returns:
+        {'updated': 更新数量, 'protected': 跳过的受保护行数量}
+    """
+    where_sql, where_params = build_item_filter(filters)
+    if not where_sql:
+        raise ValueError('请提供筛选条件')
+    if not changes:
+        raise ValueError('请提供要修改的字段')
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE TRANSACTION')
+        
+        assignments = []
+        set_params = []
+        new_values = {}
+        category_name = None
+        for field, value in changes.items():
+            if field == 'category':
+                if not value:
+                    raise ValueError('分类名称不能为空')
+                category_name = value
+                continue
+            column = ITEM_FIELD_COLUMNS.get(field)
+            if not column or column == 'diff':
+                raise ValueError(f'不支持修改的字段: {field}')
+            if column in NUMERIC_ITEM_COLUMNS:
+                value = float(value or 0)
+            else:
+                value = '' if value is None else str(value)
+            assignments.append(f'{column} = ?')
+            set_params.append(value)
+            new_values[column] = value
+        
+        # 预算费用或最终花费变化时重新计算差价（预算费用 - 最终花费）
+        if 'budget_cost' in new_values or 'final_cost' in new_values:
+            budget_expr = '?' if 'budget_cost' in new_values else 'IFNULL(budget_cost, 0)'
+            final_expr = '?' if 'final_cost' in new_values else 'IFNULL(final_cost, 0)'
+            assignments.append(f'diff = {budget_expr} - {final_expr}')
+            if 'budget_cost' in new_values:
+                set_params.append(new_values['budget_cost'])
+            if 'final_cost' in new_values:
+                set_params.append(new_values['final_cost'])
+        
+        assignments.append('updated_at = CURRENT_TIMESTAMP')
+        
+        cursor.execute(
+            f'SELECT COUNT(*) AS count FROM items WHERE {where_sql} AND {_PROTECTED_ITEM_SQL}',
+            where_params
+        )
+        protected_count = cursor.fetchone()['count']
+        
+        moving = []
+        if category_name is not None:
+            # 移动分类：先按原来的显示顺序找出要移动的项目（分类变化后筛选条件可能不再匹配）
+            cursor.execute(f'''
+                SELECT items.id, items.category_id FROM items
+                LEFT JOIN categories c ON c.id = items.category_id
+                WHERE {where_sql} AND NOT {_PROTECTED_ITEM_SQL}
+                ORDER BY c.order_index, items.category_id, items.seq_num, items.id
+            ''', where_params)
+            moving = cursor.fetchall()
+            if not moving:
+                # 没有可移动的项目：不创建目标分类
+                conn.rollback()
+                return {'updated': 0, 'protected': protected_count}
+        
+        cursor.execute(
+            f"UPDATE items SET {', '.join(assignments)} WHERE {where_sql} AND NOT {_PROTECTED_ITEM_SQL}",
+            set_params + where_params
+        )
+        updated_count = cursor.rowcount
+        
+        if moving:
+            # 移入的项目排在目标分类已有项目之后，按原来的顺序重新编号（已在目标分类中的项目保持原序号）
+            category_id = _get_or_create_category_id(cursor, category_name)
+            moved_ids = [row['id'] for row in moving if row['category_id'] != category_id]
+            cursor.execute('SELECT MAX(seq_num) AS max_seq FROM items WHERE category_id = ?', (category_id,))
+            max_seq = cursor.fetchone()['max_seq'] or 0
+            cursor.executemany(
+                'UPDATE items SET category_id = ?, seq_num = ? WHERE id = ?',
+                [(category_id, max_seq + offset, item_id) for offset, item_id in enumerate(moved_ids, 1)]
+            )
+        
+        conn.commit()
+        _checkpoint(conn)
+        return {'updated': updated_count, 'protected': protected_count}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def bulk_delete_items(filters: Dict) -> Dict:
+    """按筛选条件批量删除项目（单条DELETE语句），合计行、总计行不会被删除
+    Returns:
+        {'deleted': 删除数量, 'protected': 跳过的受保护行数量}
+    """
+    where_sql, where_params = build_item_filter(filters)
+    if not where_sql:
+        raise ValueError('请提供筛选条件')
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE TRANSACTION')
+        
+        cursor.execute(
+            f'SELECT COUNT(*) AS count FROM items WHERE {where_sql} AND {_PROTECTED_ITEM_SQL}',
+            where_params
+        )
+        protected_count = cursor.fetchone()['count']
+        
+        cursor.execute(f'DELETE FROM items WHERE {where_sql} AND NOT {_PROTECTED_ITEM_SQL}', where_params)
+        deleted_count = cursor.rowcount
+        
+        conn.commit()
+        _checkpoint(conn)
+        return {'deleted': deleted_count, 'protected': protected_count}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
 def renumber_items_in_category(category_id: int):
     """重新编号分类下的项目"""
     conn = get_db_connection()
@@ -495,10 +1066,276 @@ def get_data_for_api() -> Dict:
         'headers': ['序号', '项目', '单位', '预算数量', '预算费用', '当前投入', '最终花费', '差价', '备注']
     }
 
+def iter_export_records(filters: Dict = None) -> Iterator[Tuple[str, Dict]]:
+    """按导出顺序逐行读取数据（游标迭代，不一次性载入内存）
+
+    依次产出 ('totals', 总合计)，然后每个分类产出 ('category', {'name'}) 和若干 ('item', 项目行)。
+    总合计与明细在同一个读事务里查询，保证两者来自同一份数据快照。
+    filters（见 build_item_filter）不为空时筛选条件直接放进查询，总合计只统计筛选出的项目，
+    没有匹配项目的分类不输出
+    """
+    where_sql, where_params = build_item_filter(filters)
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN')
+        cursor = conn.cursor()
+
+        # 总合计（只统计有分类的项目，与导出的明细一致）
+        cursor.execute(f'''
+            SELECT IFNULL(SUM(items.budget_cost), 0) AS budget_cost,
+                   IFNULL(SUM(items.current_investment), 0) AS current_investment,
+                   IFNULL(SUM(items.final_cost), 0) AS final_cost
+            FROM items
+            JOIN categories c ON items.category_id = c.id
+            {f'WHERE {where_sql}' if where_sql else ''}
+        ''', where_params)
+        yield 'totals', dict(cursor.fetchone())
+
+        columns = '''c.id AS cat_id, c.name AS category_name,
+                   items.id, items.seq_num, items.project_name, items.unit, items.budget_quantity,
+                   items.budget_cost, items.current_investment, items.final_cost, items.remark'''
+        if where_sql:
+            # 从筛选出的项目出发，读取量与筛选结果成正比（按分类筛选时走 idx_category_id）
+            cursor.execute(f'''
+                SELECT {columns}
+                FROM items
+                JOIN categories c ON items.category_id = c.id
+                WHERE {where_sql}
+                ORDER BY c.order_index, c.id, items.seq_num, items.id
+            ''', where_params)
+        else:
+            # LEFT JOIN 保证没有项目的分类也会输出（此时项目列为NULL）
+            cursor.execute(f'''
+                SELECT {columns}
+                FROM categories c
+                LEFT JOIN items ON items.category_id = c.id
+                ORDER BY c.order_index, c.id, items.seq_num, items.id
+            ''')
+        current_category = None
+        for row in cursor:
+            if row['cat_id'] != current_category:
+                current_category = row['cat_id']
+                yield 'category', {'name': row['category_name']}
+            if row['id'] is not None:
+                yield 'item', dict(row)
+    finally:
+        conn.close()
+
+def iter_item_rows() -> Iterator[Dict]:
+    """按导出顺序逐行读取项目（游标迭代），数值列保持数据库原生类型，供CSV/NDJSON/Parquet导出
+
+    每行的键为 category, seq_num, project_name, unit, budget_quantity, budget_cost,
+    current_investment, final_cost, diff, remark；没有项目的分类产出一行只有 category 的记录
+    """
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT c.name AS category, i.seq_num, i.project_name, i.unit, i.budget_quantity,
+                   i.budget_cost, i.current_investment, i.final_cost, i.diff, i.remark
+            FROM categories c
+            LEFT JOIN items i ON i.category_id = c.id
+            ORDER BY c.order_index, c.id, i.seq_num, i.id
+        ''')
+        for row in cursor:
+            yield dict(row)
+    finally:
+        conn.close()
+
+# 导入时逐项比较的字段（不含分类和序号，它们是匹配键的一部分）
+_MERGE_COMPARE_COLUMNS = ('project_name', 'unit', 'budget_quantity', 'budget_cost',
+                          'current_investment', 'final_cost', 'diff', 'remark')
+
+def _excel_item_values(item: Dict) -> Dict:
+    """把Excel解析出的项目转换为items表的列值"""
+    return {
+        'seq_num': int(item.get('序号', 0)),
+        'project_name': item.get('项目', ''),
+        'unit': item.get('单位', ''),
+        'budget_quantity': item.get('预算数量', ''),
+        'budget_cost': float(item.get('预算费用', 0) or 0),
+        'current_investment': float(item.get('当前投入', 0) or 0),
+        'final_cost': float(item.get('最终花费', 0) or 0),
+        'diff': float(item.get('差价', 0) or 0),
+        'remark': item.get('备注', '')
+    }
+
+def _same_item_values(existing: Dict, values: Dict) -> bool:
+    """比较数据库中的项目与导入的值是否一致（空字符串与NULL视为相同）"""
+    for column in _MERGE_COMPARE_COLUMNS:
+        old, new = existing[column], values[column]
+        if column in NUMERIC_ITEM_COLUMNS:
+            if abs(float(old or 0) - float(new or 0)) > 1e-9:
+                return False
+        elif (old or '') != (new or ''):
+            return False
+    return True
+
+def merge_import_excel_data(excel_data: Dict) -> Dict:
+    """合并导入：按 分类+项目名称+序号 匹配已有项目，只执行必要的新增、修改和删除
+    匹配上的项目保留原ID；工作簿中不存在的项目和分类会被删除（最终结果与全量导入一致）
+    Returns:
+        变更摘要 {'categories_added', 'categories_removed', 'categories_reordered',
+                  'items_added', 'items_updated', 'items_deleted', 'items_unchanged'}
+    """
+    summary = {
+        'categories_added': 0, 'categories_removed': 0, 'categories_reordered': 0,
+        'items_added': 0, 'items_updated': 0, 'items_deleted': 0, 'items_unchanged': 0
+    }
+    
+    # 导入后的分类顺序：工作簿中的分类，然后是项目引用但未声明的分类
+    category_order = []
+    for cat_name in excel_data.get('categories', []):
+        if cat_name and cat_name.strip() and cat_name not in category_order:
+            category_order.append(cat_name)
+    incoming = []
+    for item in excel_data.get('items', []):
+        category_name = item.get('category', '未分类')
+        if not category_name or category_name.strip() == '':
+            category_name = '未分类'
+        if category_name not in category_order:
+            category_order.append(category_name)
+        incoming.append((category_name, _excel_item_values(item)))
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE TRANSACTION')
+        
+        # 分类：新增缺少的分类，调整顺序
+        cursor.execute('SELECT id, name, order_index FROM categories')
+        existing_categories = {row['name']: dict(row) for row in cursor.fetchall()}
+        categories_map = {}
+        for order_index, cat_name in enumerate(category_order, 1):
+            existing = existing_categories.get(cat_name)
+            if existing is None:
+                cursor.execute(
+                    'INSERT INTO categories (name, order_index) VALUES (?, ?)',
+                    (cat_name, order_index)
+                )
+                categories_map[cat_name] = cursor.lastrowid
+                summary['categories_added'] += 1
+            else:
+                categories_map[cat_name] = existing['id']
+                if existing['order_index'] != order_index:
+                    cursor.execute('UPDATE categories SET order_index = ? WHERE id = ?',
+                                   (order_index, existing['id']))
+                    summary['categories_reordered'] += 1
+        
+        # 已有项目索引：(分类ID, 项目名称, 序号) -> [项目]，以及 (分类ID, 项目名称) -> [项目] 用于序号变化的项目
+        cursor.execute('''
+            SELECT id, category_id, seq_num, project_name, unit, budget_quantity,
+                   budget_cost, current_investment, final_cost, diff, remark
+            FROM items ORDER BY id
+        ''')
+        by_key = {}
+        by_name = {}
+        for row in cursor.fetchall():
+            existing = dict(row)
+            by_key.setdefault((existing['category_id'], existing['project_name'], existing['seq_num']), []).append(existing)
+            by_name.setdefault((existing['category_id'], existing['project_name']), []).append(existing)
+        matched_ids = set()
+        
+        def take(candidates):
+            """取出第一个尚未被匹配的项目"""
+            while candidates:
+                existing = candidates.pop(0)
+                if existing['id'] not in matched_ids:
+                    matched_ids.add(existing['id'])
+                    return existing
+            return None
+        
+        # 先按完整键匹配所有行，剩下的再按 分类+名称 匹配（序号变化的项目），避免抢占其他行的精确匹配
+        matches = []
+        for category_name, values in incoming:
+            category_id = categories_map[category_name]
+            matches.append(take(by_key.get((category_id, values['project_name'], values['seq_num']), [])))
+        for index, (category_name, values) in enumerate(incoming):
+            if matches[index] is None:
+                category_id = categories_map[category_name]
+                matches[index] = take(by_name.get((category_id, values['project_name']), []))
+        
+        pending_updates = []
+        pending_inserts = []
+        for (category_name, values), existing in zip(incoming, matches):
+            category_id = categories_map[category_name]
+            if existing is None:
+                pending_inserts.append((category_id, values))
+            elif existing['seq_num'] != values['seq_num'] or not _same_item_values(existing, values):
+                pending_updates.append((existing['id'], values))
+            else:
+                summary['items_unchanged'] += 1
+        
+        # 先删除，再修改和新增
+        cursor.execute('SELECT id FROM items')
+        stale_ids = [row['id'] for row in cursor.fetchall() if row['id'] not in matched_ids]
+        for start in range(0, len(stale_ids), 500):
+            chunk = stale_ids[start:start + 500]
+            cursor.execute(f"DELETE FROM items WHERE id IN ({', '.join('?' for _ in chunk)})", chunk)
+        summary['items_deleted'] = len(stale_ids)
+        
+        for item_id, values in pending_updates:
+            cursor.execute('''
+                UPDATE items SET seq_num = ?, project_name = ?, unit = ?, budget_quantity = ?,
+                    budget_cost = ?, current_investment = ?, final_cost = ?, diff = ?, remark = ?,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (
+                values['seq_num'], values['project_name'], values['unit'], values['budget_quantity'],
+                values['budget_cost'], values['current_investment'], values['final_cost'],
+                values['diff'], values['remark'], item_id
+            ))
+        summary['items_updated'] = len(pending_updates)
+        
+        cursor.executemany('''
+            INSERT INTO items (
+                category_id, seq_num, project_name, unit, budget_quantity,
+                budget_cost, current_investment, final_cost, diff, remark
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(
+            category_id, values['seq_num'], values['project_name'], values['unit'],
+            values['budget_quantity'], values['budget_cost'], values['current_investment'],
+            values['final_cost'], values['diff'], values['remark']
+        ) for category_id, values in pending_inserts])
+        summary['items_added'] = len(pending_inserts)
+        
+        # 删除工作簿中已经不存在的分类
+        removed = [cat['id'] for name, cat in existing_categories.items() if name not in categories_map]
+        for category_id in removed:
+            cursor.execute('DELETE FROM categories WHERE id = ?', (category_id,))
+        summary['categories_removed'] = len(removed)
+        
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    
+    # 只有删除了数据才需要回收空闲页
+    if summary['items_deleted'] or summary['categories_removed']:
+        try:
+            run_maintenance('merge_import')
+        except Exception as e:
+            print(f"⚠️ 导入后数据库维护失败: {e}")
+    return summary
+
 def import_from_excel_data(excel_data: Dict):
     """从Excel解析的数据导入到数据库"""
+    import_item_batches([excel_data])
+    return True
+
+def import_item_batches(batches: Iterable[Dict]) -> Dict:
+    """全量导入（流式）：在一个事务中清空现有数据，再逐批写入
+    每批的结构与Excel解析结果相同 {'categories': [...], 'items': [...]}，批之间不需要全部放在内存中
+    读取某一批时出错（例如文件格式错误）会回滚整个导入，原有数据保持不变
+    Returns:
+        {'category_count', 'item_count'}
+    """
     conn = get_db_connection()
     cursor = conn.cursor()
+    categories_map = {}  # 分类名 -> category_id
+    item_count = 0
     
     try:
         # 开始事务
@@ -507,75 +1344,71 @@ def import_from_excel_data(excel_data: Dict):
         # 清空现有数据
         cursor.execute('DELETE FROM items')
         cursor.execute('DELETE FROM categories')
+        max_order = 0
         
-        # 导入分类（直接在当前连接中插入，避免创建新连接）
-        categories_map = {}  # 分类名 -> category_id
-        
-        # 获取最大order_index
-        cursor.execute('SELECT MAX(order_index) as max_order FROM categories')
-        result = cursor.fetchone()
-        max_order = result['max_order'] if result and result['max_order'] is not None else 0
-        
-        for cat_name in excel_data.get('categories', []):
-            if not cat_name or cat_name.strip() == '':
-                continue
-            max_order += 1
-            cursor.execute(
-                'INSERT INTO categories (name, order_index) VALUES (?, ?)',
-                (cat_name, max_order)
-            )
-            category_id = cursor.lastrowid
-            categories_map[cat_name] = category_id
-        
-        # 导入项目
-        for item in excel_data.get('items', []):
-            category_name = item.get('category', '未分类')
-            if not category_name or category_name.strip() == '':
-                category_name = '未分类'
-            
-            category_id = categories_map.get(category_name)
-            if not category_id:
-                # 如果分类不存在，创建它（在当前连接中）
+        def category_id_for(cat_name):
+            """返回分类ID，分类不存在时创建（在当前连接中，排在已有分类之后）"""
+            nonlocal max_order
+            category_id = categories_map.get(cat_name)
+            if category_id is None:
                 max_order += 1
                 cursor.execute(
                     'INSERT INTO categories (name, order_index) VALUES (?, ?)',
-                    (category_name, max_order)
+                    (cat_name, max_order)
                 )
                 category_id = cursor.lastrowid
-                categories_map[category_name] = category_id
-            
-            # 解析数值字段
-            budget_cost = float(item.get('预算费用', 0) or 0)
-            current_investment = float(item.get('当前投入', 0) or 0)
-            final_cost = float(item.get('最终花费', 0) or 0)
-            diff = float(item.get('差价', 0) or 0)
+                categories_map[cat_name] = category_id
+            return category_id
+        
+        for batch in batches:
+            # 导入分类（先按声明顺序创建本批的分类）
+            for cat_name in batch.get('categories', []):
+                if not cat_name or cat_name.strip() == '':
+                    continue
+                category_id_for(cat_name)
             
-            cursor.execute('''
+            # 导入项目
+            rows = []
+            for item in batch.get('items', []):
+                category_name = item.get('category', '未分类')
+                if not category_name or category_name.strip() == '':
+                    category_name = '未分类'
+                values = _excel_item_values(item)
+                rows.append((
+                    category_id_for(category_name),
+                    values['seq_num'],
+                    values['project_name'],
+                    values['unit'],
+                    values['budget_quantity'],
+                    values['budget_cost'],
+                    values['current_investment'],
+                    values['final_cost'],
+                    values['diff'],
+                    values['remark']
+                ))
+            cursor.executemany('''
                 INSERT INTO items (
                     category_id, seq_num, project_name, unit, budget_quantity,
                     budget_cost, current_investment, final_cost, diff, remark
                 ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                category_id,
-                int(item.get('序号', 0)),
-                item.get('项目', ''),
-                item.get('单位', ''),
-                item.get('预算数量', ''),
-                budget_cost,
-                current_investment,
-                final_cost,
-                diff,
-                item.get('备注', '')
-            ))
+            ''', rows)
+            item_count += len(rows)
         
         # 提交事务
         conn.commit()
-        return True
     except Exception as e:
         conn.rollback()
         raise e
     finally:
         conn.close()
+    
+    # 全量导入会删除并重建所有数据，回收空闲页并刷新统计信息
+    try:
+        report = run_maintenance('import', analyze=True)
+        print(f"🧹 导入后数据库维护完成: 回收 {report['pages_reclaimed']} 页，耗时 {report['duration_ms']}ms")
+    except Exception as e:
+        print(f"⚠️ 导入后数据库维护失败: {e}")
+    return {'category_count': len(categories_map), 'item_count': item_count}
 
 def backup_database(description: str = '') -> Dict:
     """备份数据库，返回备份信息"""
@@ -659,10 +1492,40 @@ def restore_database(backup_filename: str) -> str:
     except Exception:
         pass
     
+    # 记录恢复前的版本号，恢复后的版本号必须比它大，否则导出缓存和分类匹配器会使用恢复前的数据
+    try:
+        previous_revision = get_data_revision()
+        previous_categories_revision = get_categories_revision()
+    except sqlite3.Error:
+        previous_revision = previous_categories_revision = 0
+    
     # 复制备份文件到数据库文件
     import shutil
     shutil.copy2(backup_path, DB_FILE)
     
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        _ensure_revision_tracking(cursor)
+        # 旧备份可能没有任务表；备份里排队中/运行中的任务记录是备份时的状态，不能再执行（上传文件等已不存在）
+        _ensure_jobs_table(cursor)
+        cursor.execute(
+            "UPDATE jobs SET status = 'failed', stage = 'failed', error = ?, updated_at = CURRENT_TIMESTAMP "
+            "WHERE status IN ('queued', 'running')",
+            ('数据库已从备份恢复，备份中未完成的任务已取消',)
+        )
+        cursor.execute(
+            "UPDATE meta SET value = MAX(value, ?) + 1 WHERE key = 'data_revision'",
+            (previous_revision,)
+        )
+        cursor.execute(
+            "UPDATE meta SET value = MAX(value, ?) + 1 WHERE key = 'categories_revision'",
+            (previous_categories_revision,)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    
     return f'数据库已从备份恢复: {backup_filename}. {current_backup_msg}'
 
 def delete_backup(backup_filename: str) -> str:
@@ -731,3 +1594,151 @@ def update_item_order(category_id: int, item_orders: List[Dict[str, int]]):
     finally:
         conn.close()
 
+
+# ==================== 后台任务 ====================
+
+JOB_STATUSES = ('queued', 'running', 'done', 'failed')
+
+def _ensure_jobs_table(cursor):
+    """创建后台任务表（导入等耗时操作在后台执行，请求只负责排队）"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            stage TEXT,
+            rows_processed INTEGER DEFAULT 0,
+            payload TEXT,
+            result TEXT,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)')
+
+def _job_from_row(row) -> Dict:
+    job = dict(row)
+    job['payload'] = json.loads(job['payload']) if job['payload'] else {}
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return job
+
+def create_job(kind: str, payload: Dict = None) -> str:
+    """新建一个排队中的任务，返回任务ID"""
+    job_id = uuid.uuid4().hex
+    conn = get_db_connection()
+    try:
+        conn.execute(
+            'INSERT INTO jobs (id, kind, status, stage, payload) VALUES (?, ?, ?, ?, ?)',
+            (job_id, kind, 'queued', 'queued', json.dumps(payload or {}, ensure_ascii=False))
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return job_id
+
+def claim_next_job(kinds: List[str] = None) -> Optional[Dict]:
+    """领取最早排队的任务并标记为运行中（多进程同时领取时只有一个能成功），没有任务时返回None"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE TRANSACTION')
+        sql = "SELECT * FROM jobs WHERE status = 'queued'"
+        params = []
+        if kinds:
+            sql += f" AND kind IN ({', '.join('?' for _ in kinds)})"
+            params.extend(kinds)
+        cursor.execute(sql + ' ORDER BY created_at, rowid LIMIT 1', params)
+        row = cursor.fetchone()
+        if row is None:
+            conn.rollback()
+            return None
+        cursor.execute(
+            "UPDATE jobs SET status = 'running', stage = 'started', updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (row['id'],)
+        )
+        conn.commit()
+        job = _job_from_row(row)
+        job['status'] = 'running'
+        job['stage'] = 'started'
+        return job
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def update_job(job_id: str, **fields):
+    """更新任务字段（status/stage/rows_processed/result/error）"""
+    allowed = {'status', 'stage', 'rows_processed', 'result', 'error'}
+    unknown = set(fields) - allowed
+    if unknown:
+        raise ValueError(f'不支持的任务字段: {", ".join(sorted(unknown))}')
+    if 'status' in fields and fields['status'] not in JOB_STATUSES:
+        raise ValueError(f'无效的任务状态: {fields["status"]}')
+    if 'result' in fields and fields['result'] is not None:
+        fields['result'] = json.dumps(fields['result'], ensure_ascii=False)
+    if not fields:
+        return
+    
+    assignments = ', '.join(f'{name} = ?' for name in fields)
+    conn = get_db_connection()
+    try:
+        conn.execute(
+            f'UPDATE jobs SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+            list(fields.values()) + [job_id]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+def touch_job(job_id: str) -> bool:
+    """任务心跳：更新运行中任务的 updated_at（不会被 requeue_interrupted_jobs 当作中断的任务），返回任务是否仍在运行"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute(
+            "UPDATE jobs SET updated_at = CURRENT_TIMESTAMP WHERE id = ? AND status = 'running'",
+            (job_id,)
+        )
+        conn.commit()
+        return cursor.rowcount > 0
+    finally:
+        conn.close()
+
+def get_job(job_id: str) -> Optional[Dict]:
+    """获取任务信息，不存在时返回None"""
+    conn = get_db_connection()
+    try:
+        row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return _job_from_row(row) if row else None
+    finally:
+        conn.close()
+
+def requeue_interrupted_jobs(stale_seconds: int = 600) -> int:
+    """把运行中但超过N秒没有更新的任务（进程重启导致中断）重新排队，返回任务数
+    正在执行的任务由 run_job 定期调用 touch_job 更新，不会被重新排队
+    """
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute(
+            "UPDATE jobs SET status = 'queued', stage = 'queued', updated_at = CURRENT_TIMESTAMP "
+            "WHERE status = 'running' AND updated_at < datetime('now', ?)",
+            (f'-{int(stale_seconds)} seconds',)
+        )
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        conn.close()
+
+def cleanup_old_jobs(keep_days: int = 7) -> int:
+    """删除已结束超过N天的任务记录，返回删除数量"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < datetime('now', ?)",
+            (f'-{int(keep_days)} days',)
+        )
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        conn.close()
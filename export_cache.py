@@ -0,0 +1,168 @@
+"""
+导出文件缓存
+按 (格式, 选项, 数据版本号) 缓存导出的Excel/PDF文件，缓存放在磁盘上，多个gunicorn worker共享
+同一个键同时只生成一次（文件锁），其余请求等待生成完成后直接读取；按最近使用时间和总大小淘汰
+"""
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，只能在进程内互斥
+    fcntl = None
+
+
+class ExportCache:
+    """磁盘导出缓存（单次生成 + LRU/容量淘汰）"""
+
+    def __init__(self, cache_dir, max_bytes=200 * 1024 * 1024, max_entries=50):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._local_lock = threading.Lock()  # 没有fcntl时的退化方案
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0 and self.max_entries > 0
+
+    def _entry_path(self, fmt, options, revision):
+        key_source = json.dumps([fmt, options or {}, revision], sort_keys=True, ensure_ascii=False)
+        key = hashlib.sha1(key_source.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f'{key}.{fmt}')
+
+    def _open_hit(self, path):
+        """打开已缓存的文件并刷新最近使用时间，不存在时返回None"""
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return f
+
+    def _lock(self, path):
+        """获取某个缓存键的生成锁（跨进程），返回需要在finally中释放的对象"""
+        if fcntl is None:
+            self._local_lock.acquire()
+            return None
+        lock_file = open(path + '.lock', 'w')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def _unlock(self, lock_file):
+        if lock_file is None:
+            self._local_lock.release()
+            return
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+    def open_or_build(self, fmt, options, revision, build):
+        """返回 (打开的缓存文件, 是否命中)
+
+        build(f) 负责把导出内容写入文件对象f，只在缓存未命中时调用；
+        同一个键的并发请求只有一个会调用build，其他请求等待后直接读取结果
+        """
+        path = self._entry_path(fmt, options, revision)
+        f = self._open_hit(path)
+        if f is not None:
+            return f, True
+
+        lock_file = self._lock(path)
+        try:
+            # 等锁期间可能已经有其他请求生成好了
+            f = self._open_hit(path)
+            if f is not None:
+                return f, True
+
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as tmp:
+                    build(tmp)
+                os.replace(tmp_path, path)
+            except BaseException:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                raise
+            # 先打开再淘汰，淘汰时即使删掉了这个文件也不影响本次读取
+            f = open(path, 'rb')
+        finally:
+            self._unlock(lock_file)
+
+        self.evict(keep=path)
+        return f, False
+
+    def _entries(self):
+        """所有缓存文件：[(最近使用时间, 大小, 路径)]，不包括锁文件和生成中的临时文件"""
+        entries = []
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return entries
+        for name in names:
+            if name.endswith('.lock') or name.endswith('.tmp'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self, keep=None):
+        """按最近使用时间淘汰，直到条目数和总大小都在限制以内，返回删除的文件数"""
+        entries = sorted(self._entries(), reverse=True)  # 最近使用的在前
+        kept_count = 0
+        kept_bytes = 0
+        deleted = 0
+        for _, size, path in entries:
+            over_limit = kept_count >= self.max_entries or kept_bytes + size > self.max_bytes
+            if over_limit and path != keep:
+                try:
+                    os.remove(path)
+                    deleted += 1
+                    continue
+                except OSError:
+                    pass
+            kept_count += 1
+            kept_bytes += size
+        self._cleanup_stale_files()
+        return deleted
+
+    def _cleanup_stale_files(self, max_age=3600):
+        """清理对应缓存已被淘汰的锁文件，以及异常退出遗留的临时文件"""
+        now = time.time()
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.cache_dir, name)
+            try:
+                if name.endswith('.lock'):
+                    if os.path.exists(path[:-len('.lock')]) or now - os.path.getmtime(path) < max_age:
+                        continue
+                elif not name.endswith('.tmp') or now - os.path.getmtime(path) < max_age:
+                    continue
+                os.remove(path)
+            except OSError:
+                continue
+
+    def stats(self):
+        """缓存统计信息"""
+        entries = self._entries()
+        return {
+            'entries': len(entries),
+            'total_bytes': sum(size for _, size, _ in entries),
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+        }
@@ -0,0 +1,196 @@
+"""
+PDF中文字体缓存
+从TTC字体集合中提取的TTF、按字符集裁剪的子集字体都保存在磁盘缓存目录中，文件名是源字体和字符集的哈希，
+所有worker进程共享，每种字体只需生成一次（文件锁保证同一个文件同时只生成一次）
+子集字体只包含常用汉字和预算表用到的字符，注册（解析字体文件）比完整的CJK字体快得多
+"""
+import os
+import hashlib
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，只能在进程内互斥
+    fcntl = None
+
+# 子集字体的基础字符集：ASCII、常用中文标点/全角字符、GB2312 全部汉字
+_BASE_CHARSET = None
+
+
+def base_charset():
+    """子集字体的基础字符集（frozenset），首次调用时生成"""
+    global _BASE_CHARSET
+    if _BASE_CHARSET is None:
+        chars = {chr(code) for code in range(0x20, 0x7f)}
+        chars.update(chr(code) for code in range(0x3000, 0x3040))  # 中文标点
+        chars.update(chr(code) for code in range(0xff01, 0xff5f))  # 全角字符
+        chars.update('…—–‘’“”·×÷¥￥℃°±')
+        # GB2312 一级、二级汉字（0xB0A1-0xF7FE）
+        for high in range(0xb0, 0xf8):
+            for low in range(0xa1, 0xff):
+                try:
+                    chars.add(bytes((high, low)).decode('gb2312'))
+                except UnicodeDecodeError:
+                    continue
+        _BASE_CHARSET = frozenset(chars)
+    return _BASE_CHARSET
+
+
+class FontCache:
+    """磁盘字体缓存（TTC提取 + 字符集子集）"""
+
+    def __init__(self, cache_dir, max_subsets=16, max_bytes=200 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        # 子集字体的数量和总大小上限：每种额外字符组合都会生成一个新的子集，超过后按最近使用时间淘汰
+        self.max_subsets = max_subsets
+        self.max_bytes = max_bytes
+        self._local_lock = threading.Lock()  # 没有fcntl时的退化方案
+
+    def _source_key(self, path, font_number=0):
+        """源字体的键：路径、大小、修改时间（字体文件被替换后自动失效）"""
+        stat = os.stat(path)
+        source = f'{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}|{font_number}'
+        return hashlib.sha1(source.encode('utf-8')).hexdigest()[:16]
+
+    def _build_once(self, path, build):
+        """缓存文件不存在时调用 build(临时路径) 生成，同一个文件同时只有一个进程生成"""
+        if os.path.exists(path):
+            return path
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if fcntl is None:
+            self._local_lock.acquire()
+            lock_file = None
+        else:
+            lock_file = open(path + '.lock', 'w')
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            # 等锁期间可能已经有其他进程生成好了
+            if os.path.exists(path):
+                return path
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            os.close(fd)
+            try:
+                build(tmp_path)
+                os.replace(tmp_path, path)
+            except BaseException:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                raise
+            return path
+        finally:
+            if lock_file is None:
+                self._local_lock.release()
+            else:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+                try:
+                    os.remove(path + '.lock')
+                except OSError:
+                    pass
+
+    def extract_ttc(self, ttc_path, font_number=0):
+        """从TTC字体集合中提取一个字体为TTF，返回缓存文件路径"""
+        path = os.path.join(self.cache_dir, f'ttc-{self._source_key(ttc_path, font_number)}.ttf')
+
+        def build(tmp_path):
+            from fontTools.ttLib import TTFont
+            font = TTFont(ttc_path, fontNumber=font_number)
+            try:
+                font.save(tmp_path)
+            finally:
+                font.close()
+
+        return self._build_once(path, build)
+
+    def subset_path(self, font_path, chars):
+        """子集字体的缓存文件路径（不生成文件），文件名是源字体和字符集的哈希"""
+        charset_key = hashlib.sha1(''.join(sorted(chars)).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f'subset-{self._source_key(font_path)}-{charset_key}.ttf')
+
+    def subset(self, font_path, chars):
+        """生成只包含chars中字符的子集字体，返回缓存文件路径（字符集相同的子集只生成一次）
+        使用已有的子集时更新其修改时间（作为最近使用时间），生成新的子集后淘汰最久未使用的子集
+        """
+        path = self.subset_path(font_path, chars)
+        if os.path.exists(path):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return path
+
+        def build(tmp_path):
+            from fontTools import subset
+            from fontTools.ttLib import TTFont
+            options = subset.Options()
+            options.hinting = False  # PDF中不需要hinting，去掉可以进一步减小文件
+            options.layout_features = []
+            options.notdef_outline = True
+            font = TTFont(font_path)
+            try:
+                subsetter = subset.Subsetter(options=options)
+                subsetter.populate(unicodes=[ord(ch) for ch in chars])
+                subsetter.subset(font)
+                font.save(tmp_path)
+            finally:
+                font.close()
+
+        self._build_once(path, build)
+        self.evict(keep=path)
+        return path
+
+    def _subset_entries(self):
+        """所有子集字体：[(最近使用时间, 大小, 路径)]"""
+        entries = []
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return entries
+        for name in names:
+            if not (name.startswith('subset-') and name.endswith('.ttf')):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self, keep=None):
+        """按最近使用时间淘汰子集字体，直到数量和总大小都在限制以内，返回删除的文件数
+        （与导出缓存的淘汰方式相同；TTC提取的字体每个源字体只有一个，不淘汰）
+        """
+        entries = sorted(self._subset_entries(), reverse=True)  # 最近使用的在前
+        kept_count = 0
+        kept_bytes = 0
+        deleted = 0
+        for _, size, path in entries:
+            over_limit = kept_count >= self.max_subsets or kept_bytes + size > self.max_bytes
+            if over_limit and path != keep:
+                try:
+                    os.remove(path)
+                    deleted += 1
+                    continue
+                except OSError:
+                    pass
+            kept_count += 1
+            kept_bytes += size
+        return deleted
+
+    def stats(self):
+        """缓存统计信息"""
+        try:
+            names = [name for name in os.listdir(self.cache_dir) if name.endswith('.ttf')]
+        except OSError:
+            names = []
+        return {
+            'files': len(names),
+            'total_bytes': sum(os.path.getsize(os.path.join(self.cache_dir, name)) for name in names),
+            'max_subsets': self.max_subsets,
+            'max_bytes': self.max_bytes,
+        }
@@ -34,3 +34,14 @@ limit_request_line = 4094
 limit_request_fields = 100
 limit_request_field_size = 8190
 
+
+# 后台服务（自动备份、数据库维护、后台任务）不在master进程中运行：
+# 预加载app时 create_app 只执行数据库初始化/迁移，worker fork后再由 post_fork 启动后台服务，
+# 所有worker中只有拿到文件锁的一个真正运行它们（见 app.start_background_services），
+# 任务崩溃或内存溢出只影响这个worker，master会重新fork，中断的任务会重新排队
+os.environ['BACKGROUND_SERVICES_IN_WORKERS'] = 'True'
+
+
+def post_fork(server, worker):
+    from app import start_background_services
+    start_background_services()
@@ -0,0 +1,244 @@
+"""
+数据交换格式（CSV / NDJSON / Parquet）
+机器之间批量传输数据时不经过Excel：每行一个项目，列名与items表一致，数值列保持原生类型
+读取和写入都是流式的，内存占用与行数无关（Parquet按批读写）
+"""
+import io
+import csv
+import json
+import math
+import importlib.util
+
+# pyarrow 是可选依赖，只在读写Parquet时才导入
+PYARROW_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+
+INTERCHANGE_FORMATS = ('csv', 'ndjson', 'parquet')
+INTERCHANGE_MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+# 上传文件扩展名 -> 格式
+INTERCHANGE_EXTENSIONS = {'csv': 'csv', 'ndjson': 'ndjson', 'jsonl': 'ndjson', 'parquet': 'parquet'}
+
+# 导出列（与items表列名一致，category 为分类名）
+INTERCHANGE_COLUMNS = ('category', 'seq_num', 'project_name', 'unit', 'budget_quantity',
+                       'budget_cost', 'current_investment', 'final_cost', 'diff', 'remark')
+NUMERIC_COLUMNS = ('budget_cost', 'current_investment', 'final_cost', 'diff')
+
+# 导入时也接受Excel/API使用的中文列名
+COLUMN_ALIASES = {
+    '分类': 'category', '序号': 'seq_num', '项目': 'project_name', '单位': 'unit',
+    '预算数量': 'budget_quantity', '预算费用': 'budget_cost', '当前投入': 'current_investment',
+    '最终花费': 'final_cost', '差价': 'diff', '备注': 'remark',
+}
+
+PARQUET_BATCH_ROWS = 10000
+IMPORT_BATCH_ROWS = 1000  # 导入时每批交给数据库的行数
+
+
+class InterchangeError(ValueError):
+    """导入数据格式错误（行号从1开始，CSV不含表头行）"""
+
+
+def format_from_filename(filename):
+    """根据文件扩展名判断格式，无法识别时返回None"""
+    if not filename or '.' not in filename:
+        return None
+    return INTERCHANGE_EXTENSIONS.get(filename.rsplit('.', 1)[1].lower())
+
+
+# ---------- 导出 ----------
+
+def _csv_value(value):
+    return '' if value is None else value
+
+
+def write_csv(rows, f):
+    """把行（dict，键为 INTERCHANGE_COLUMNS）写成UTF-8 CSV"""
+    text = io.TextIOWrapper(f, encoding='utf-8', newline='', write_through=True)
+    try:
+        writer = csv.writer(text)
+        writer.writerow(INTERCHANGE_COLUMNS)
+        for row in rows:
+            writer.writerow([_csv_value(row[column]) for column in INTERCHANGE_COLUMNS])
+        text.flush()
+    finally:
+        # 不关闭底层文件，调用方还要继续使用
+        text.detach()
+
+
+def write_ndjson(rows, f):
+    """每行一个JSON对象，数值列为JSON数字，空值为null"""
+    for row in rows:
+        line = json.dumps({column: row[column] for column in INTERCHANGE_COLUMNS}, ensure_ascii=False)
+        f.write(line.encode('utf-8'))
+        f.write(b'\n')
+
+
+def _parquet_schema():
+    import pyarrow as pa
+    types = {'seq_num': pa.int64()}
+    types.update({column: pa.float64() for column in NUMERIC_COLUMNS})
+    return pa.schema([(column, types.get(column, pa.string())) for column in INTERCHANGE_COLUMNS])
+
+
+def write_parquet(rows, f):
+    """按批写入Parquet（seq_num为int64，金额列为float64，其余为字符串）"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema()
+    writer = pq.ParquetWriter(f, schema)
+    try:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= PARQUET_BATCH_ROWS:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+    finally:
+        writer.close()
+
+
+WRITERS = {'csv': write_csv, 'ndjson': write_ndjson, 'parquet': write_parquet}
+
+
+# ---------- 导入 ----------
+
+def _iter_csv(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        yield from csv.DictReader(text)
+    finally:
+        text.detach()
+
+
+def _iter_ndjson(stream):
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise InterchangeError(f'第{line_no}行不是有效的JSON: {e}')
+        if not isinstance(record, dict):
+            raise InterchangeError(f'第{line_no}行应为JSON对象')
+        yield record
+
+
+def _iter_parquet(stream):
+    import pyarrow.parquet as pq
+    parquet_file = pq.ParquetFile(stream)
+    for batch in parquet_file.iter_batches(batch_size=PARQUET_BATCH_ROWS):
+        yield from batch.to_pylist()
+
+
+READERS = {'csv': _iter_csv, 'ndjson': _iter_ndjson, 'parquet': _iter_parquet}
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _number(value, column, row_no):
+    if value is None or value == '':
+        return 0.0
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise InterchangeError(f'第{row_no}行 {column} 不是数字: {value}')
+    # NaN/Infinity（CSV中的 "nan"、JSON中的 NaN）无法参与金额计算，写入数据库后合计也会变成NaN
+    if not math.isfinite(number):
+        raise InterchangeError(f'第{row_no}行 {column} 不是有效的数字: {value}')
+    return number
+
+
+def iter_item_batches(stream, fmt, batch_rows=IMPORT_BATCH_ROWS):
+    """流式读取交换格式的数据，每 batch_rows 行产出一批 {'categories', 'items'}（结构与Excel解析结果相同）
+    categories 为本批中第一次出现的分类（按出现顺序），内存占用与文件行数无关
+
+    只有分类、没有项目名称的行表示空分类；缺少 seq_num 时按分类内的顺序编号
+    格式错误在读到对应的行时抛出 InterchangeError
+    """
+    if fmt not in READERS:
+        raise InterchangeError(f'不支持的格式: {fmt}')
+    return _iter_item_batches(READERS[fmt](stream), batch_rows)
+
+
+def _iter_item_batches(records, batch_rows):
+    seen_categories = set()
+    next_seq = {}
+    categories = []
+    items = []
+    rows = 0
+    for row_no, record in enumerate(records, start=1):
+        if rows >= batch_rows:
+            yield {'categories': categories, 'items': items}
+            categories = []
+            items = []
+            rows = 0
+        rows += 1
+
+        record = {COLUMN_ALIASES.get(key, key): value for key, value in record.items()}
+        category = _text(record.get('category')) or '未分类'
+        if category not in seen_categories:
+            seen_categories.add(category)
+            categories.append(category)
+
+        name = _text(record.get('project_name'))
+        if not name:
+            if any(_text(record.get(column)) for column in INTERCHANGE_COLUMNS[2:]):
+                raise InterchangeError(f'第{row_no}行缺少 project_name')
+            continue
+
+        seq = _text(record.get('seq_num'))
+        if seq:
+            try:
+                seq_num = int(float(seq))
+            except (ValueError, OverflowError):
+                raise InterchangeError(f'第{row_no}行 seq_num 不是整数: {seq}')
+        else:
+            seq_num = next_seq.get(category, 0) + 1
+        next_seq[category] = max(next_seq.get(category, 0), seq_num)
+
+        items.append({
+            'category': category,
+            '序号': seq_num,
+            '项目': name,
+            '单位': _text(record.get('unit')),
+            '预算数量': _text(record.get('budget_quantity')),
+            '预算费用': _number(record.get('budget_cost'), 'budget_cost', row_no),
+            '当前投入': _number(record.get('current_investment'), 'current_investment', row_no),
+            '最终花费': _number(record.get('final_cost'), 'final_cost', row_no),
+            '差价': _number(record.get('diff'), 'diff', row_no),
+            '备注': _text(record.get('remark')),
+        })
+
+    if rows:
+        yield {'categories': categories, 'items': items}
+
+
+def read_items(stream, fmt):
+    """读取交换格式的全部数据，返回与Excel解析结果相同结构的 {'categories', 'items', ...}
+    可直接交给 import_from_excel_data / merge_import_excel_data（数据量大时用 iter_item_batches 按批处理）
+    """
+    categories = []
+    items = []
+    for batch in iter_item_batches(stream, fmt):
+        categories.extend(batch['categories'])
+        items.extend(batch['items'])
+
+    return {
+        'categories': categories,
+        'items': items,
+        'category_count': len(categories),
+        'item_count': len(items),
+    }
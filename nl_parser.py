@@ -0,0 +1,355 @@
+"""
+自然语言项目解析（规则引擎）
+单位、关键词、分类关键词组等规则都是数据表，正则在导入时编译一次；
+每行文本只切分一次、数字只扫描一次，再按规则的优先级取出项目名、数量/单位、金额和备注。
+不依赖Flask和数据库：parse_line(text, CategoryMatcher(分类名列表)) 可以单独调用和测试
+"""
+import re
+
+# ---------- 规则数据 ----------
+
+# 数量单位（数量+单位的分段不会被当作项目名，项目名末尾的数量+单位会被去掉）
+UNITS = ('套', '个', '米', '平方米', '平方厘米', '件', '台', '张', '把', '支', '根', '条', '块', '片', '组', '项')
+# 提取数量时，数字后面紧跟的单位字符（单位表中出现的所有字符）
+QUANTITY_UNIT_CHARS = ''.join(dict.fromkeys(''.join(UNITS)))
+
+# 分段的分隔符
+SEPARATORS = '，,'
+# 以这些词开头、后面跟数字的分段是金额信息，不是项目名
+AMOUNT_PART_KEYWORDS = ('预算', '当前', '实际', '最终', '花费', '费用', '投入')
+# 只有一段文本时，项目名在第一个数字或这些词之前结束
+PROJECT_STOP_WORDS = ('预算', '当前', '实际', '最终', '备注')
+# 第一段包含这些词时看作分类名
+CATEGORY_HINT_KEYWORDS = ('全屋', '定制', '基装', '智能', '家居')
+
+# 金额关键词 -> 字段（关键词后面紧跟数字）
+BUDGET_KEYWORDS = ('预算',)
+CURRENT_KEYWORDS = ('当前投入',)
+FINAL_KEYWORDS = ('最终花费', '最终费用', '实际花费', '实际费用')
+
+# 备注关键词（按优先级），关键词后面到下一个分隔符之间的内容是备注
+REMARK_KEYWORDS = ('备注', '品牌', '型号', '渠道', '介绍', '说明')
+
+# 分类关键词组：(项目名关键词, 分类名关键词)，项目名和分类名都命中同一组时得分 CATEGORY_KEYWORD_SCORE
+CATEGORY_KEYWORD_RULES = (
+    (('基装', '基础', '装修', '吊顶', '改水', '改电', '土建', '乳胶漆', '防锈漆', '楼梯'), ('基装', '基础', '装修')),  # 基装
+    (('柜', '衣柜', '鞋柜', '橱柜', '定制'), ('柜', '定制')),  # 柜/定制
+    (('电器', '家电', '智能', '空调', '冰箱', '洗衣机', '电视', '家居'), ('电', '智能', '电器', '家居')),  # 电器
+    (('卫浴', '浴室', '卫生间', '马桶', '花洒', '洗手盆', '淋浴'), ('卫浴', '浴室', '卫生间')),  # 卫浴
+    (('地板', '地砖', '瓷砖', '木地板'), ('地板', '地砖', '瓷砖')),  # 地板
+    (('门', '窗', '门窗', '防盗门', '铝合金'), ('门', '窗', '门窗')),  # 门窗
+)
+CATEGORY_KEYWORD_SCORE = 0.8
+# 字符相似度：比较时忽略的字符，相似度超过阈值时得分为 相似度 * 权重
+SIMILARITY_IGNORED_CHARS = frozenset(['的', '和', '与', '及', '或', '、', ',', '，', ' ', '全', '屋'])
+CHAR_SIMILARITY_THRESHOLD = 0.3
+CHAR_SIMILARITY_WEIGHT = 0.6
+# 双字词相似度
+WORD_SIMILARITY_THRESHOLD = 0.2
+WORD_SIMILARITY_WEIGHT = 0.7
+# 最佳匹配低于该分数时不使用已有分类
+CATEGORY_MATCH_MIN_SCORE = 0.3
+# 没有匹配的分类时，用项目名（最多这么多个字）作为新分类名
+NEW_CATEGORY_MAX_LENGTH = 10
+
+# ---------- 编译后的规则 ----------
+
+_NUMBER = r'\d+(?:\.\d+)?'
+_UNIT_ALTERNATION = '|'.join(UNITS)
+
+
+def _alternation(words):
+    return '|'.join(re.escape(word) for word in words)
+
+
+SEPARATOR_RE = re.compile(f'[{SEPARATORS}]')
+QUANTITY_PART_RE = re.compile(rf'^{_NUMBER}\s*(?:{_UNIT_ALTERNATION})$')
+AMOUNT_PART_RE = re.compile(rf'^(?:{_alternation(AMOUNT_PART_KEYWORDS)})[：:{SEPARATORS}\s]*\d+')
+_STOP_CHARS = ''.join(dict.fromkeys(''.join(PROJECT_STOP_WORDS)))
+PROJECT_RE = re.compile(
+    rf'^([^{SEPARATORS}\d{_STOP_CHARS}]+?)(?=[{SEPARATORS}]|\d|{_alternation(PROJECT_STOP_WORDS)}|$)'
+)
+PROJECT_FALLBACK_RE = re.compile(rf'^([^{SEPARATORS}\d{_STOP_CHARS}]+)')
+TRAILING_QUANTITY_RE = re.compile(rf'\s*{_NUMBER}\s*(?:{_UNIT_ALTERNATION})?\s*$')
+
+# 数字记号：金额关键词，或者一段连续数字的开头（数字及其后的“元”/单位字符放在前瞻里读取、不消耗，
+# 这样像“1.5.2个”这种写法里每一段数字都会被检查，与逐条规则搜索的结果一致）；一次扫描得到所有数量和金额
+_AMOUNT_KEYWORDS = BUDGET_KEYWORDS + CURRENT_KEYWORDS + FINAL_KEYWORDS
+NUMBER_TOKEN_RE = re.compile(
+    rf'(?P<keyword>{_alternation(_AMOUNT_KEYWORDS)})\s*(?=\d)'
+    rf'|(?<!\d)(?=(?P<number>{_NUMBER})\s*(?P<suffix>元|[{QUANTITY_UNIT_CHARS}])?)\d'
+)
+
+REMARK_RES = tuple(
+    re.compile(rf'{re.escape(keyword)}[：:{SEPARATORS}\s]+([^{SEPARATORS}]+)') for keyword in REMARK_KEYWORDS
+)
+REMARK_NUMBER_RE = re.compile(rf'^{_NUMBER}\s*(?:元)?$')
+LAST_PART_NOT_REMARK_RES = (
+    re.compile(rf'^{_NUMBER}\s*(?:元|套|个|米)?$'),
+    re.compile(r'^实际\s*\d+'),
+)
+
+
+# ---------- 分类匹配 ----------
+
+def _similarity_chars(text):
+    return {ch for ch in text if ch not in SIMILARITY_IGNORED_CHARS}
+
+
+def _bigrams(text):
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def _keyword_groups(text, side):
+    """text 命中的分类关键词组序号（side=0 按项目名关键词，1 按分类名关键词）"""
+    return frozenset(index for index, rule in enumerate(CATEGORY_KEYWORD_RULES)
+                     if any(keyword in text for keyword in rule[side]))
+
+
+class CategoryMatcher:
+    """按项目名匹配已有分类
+    构造时为所有分类建立倒排索引（首字符、关键词组、字符、双字词 -> 分类序号），
+    匹配时只对和项目名有共同字符/双字词/关键词组的候选分类计算分数，不用逐个比较所有分类
+    """
+
+    def __init__(self, categories, revision=None):
+        self.categories = list(categories)
+        self.revision = revision  # 分类版本号（由调用方提供，进程池子进程据此判断能否复用匹配器）
+        self._names = set(self.categories)
+        self._features = []
+        self._first_char_index = {}  # 首字符 -> 分类序号（项目名包含分类名时，分类名的首字符一定在项目名中）
+        self._empty_position = None  # 空分类名包含在任何项目名中
+        self._group_index = {}
+        self._char_index = {}
+        self._word_index = {}
+        for position, name in enumerate(self.categories):
+            features = (name, _keyword_groups(name, 1), _similarity_chars(name), _bigrams(name))
+            self._features.append(features)
+            if name:
+                self._first_char_index.setdefault(name[0], []).append(position)
+            elif self._empty_position is None:
+                self._empty_position = position
+            for index, keys in ((self._group_index, features[1]), (self._char_index, features[2]),
+                                (self._word_index, features[3])):
+                for key in keys:
+                    index.setdefault(key, []).append(position)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def __len__(self):
+        return len(self.categories)
+
+    def score(self, project_name, category):
+        """项目名与一个分类的匹配分数（0-1）"""
+        return self._score(_keyword_groups(project_name, 0), _similarity_chars(project_name), _bigrams(project_name),
+                           (category, _keyword_groups(category, 1), _similarity_chars(category), _bigrams(category)))
+
+    @staticmethod
+    def _score(project_groups, project_chars, project_words, features):
+        _, category_groups, category_chars, category_words = features
+        score = 0
+        # 1. 关键词匹配
+        if project_groups & category_groups:
+            score = CATEGORY_KEYWORD_SCORE
+        # 2. 字符相似度
+        common_chars = project_chars & category_chars
+        if common_chars:
+            char_similarity = len(common_chars) / max(len(project_chars), len(category_chars))
+            if char_similarity > CHAR_SIMILARITY_THRESHOLD:
+                score = max(score, char_similarity * CHAR_SIMILARITY_WEIGHT)
+        # 3. 双字词相似度
+        common_words = project_words & category_words
+        if common_words:
+            word_similarity = len(common_words) / max(len(project_words), len(category_words))
+            if word_similarity > WORD_SIMILARITY_THRESHOLD:
+                score = max(score, word_similarity * WORD_SIMILARITY_WEIGHT)
+        return score
+
+    @staticmethod
+    def _lookup(index, keys, candidates):
+        for key in keys:
+            positions = index.get(key)
+            if positions:
+                candidates.update(positions)
+
+    def _contained(self, project_name):
+        """按分类顺序第一个被项目名包含（或等于项目名）的分类"""
+        candidates = set()
+        self._lookup(self._first_char_index, set(project_name), candidates)
+        if self._empty_position is not None:
+            candidates.add(self._empty_position)
+        for position in sorted(candidates):
+            name = self.categories[position]
+            if name in project_name:
+                return name
+        return None
+
+    def match(self, project_name):
+        """返回匹配的已有分类名，没有足够相似的分类时返回None"""
+        # 项目名等于或包含分类名
+        name = self._contained(project_name)
+        if name is not None:
+            return name
+
+        # 和项目名没有共同关键词组、字符、双字词的分类得分为0，不需要计算
+        project_groups = _keyword_groups(project_name, 0)
+        project_chars = _similarity_chars(project_name)
+        project_words = _bigrams(project_name)
+        candidates = set()
+        self._lookup(self._group_index, project_groups, candidates)
+        self._lookup(self._char_index, project_chars, candidates)
+        self._lookup(self._word_index, project_words, candidates)
+
+        # 按分类顺序比较，分数相同时取靠前的分类
+        best_match = None
+        best_score = 0
+        for position in sorted(candidates):
+            features = self._features[position]
+            score = self._score(project_groups, project_chars, project_words, features)
+            if score > best_score:
+                best_score = score
+                best_match = features[0]
+        if best_match and best_score >= CATEGORY_MATCH_MIN_SCORE:
+            return best_match
+        return None
+
+
+def new_category_name(project_name):
+    """没有匹配的已有分类时，由项目名生成新分类名"""
+    name = SEPARATOR_RE.split(project_name, 1)[0].strip() if SEPARATOR_RE.search(project_name) else project_name
+    return name[:NEW_CATEGORY_MAX_LENGTH]
+
+
+# ---------- 解析 ----------
+
+def scan_numbers(text):
+    """一次扫描提取数量/单位和各项金额，返回 {'预算数量', '单位', '预算费用', '当前投入', '最终花费'} 中找到的字段
+    预算费用优先取“预算”后面的数字，没有时取第一个以“元”结尾的数字
+    """
+    found = {}
+    first_yuan = None
+    keyword = None
+    for token in NUMBER_TOKEN_RE.finditer(text):
+        if token.group('keyword'):
+            # 关键词后面紧跟的就是它的数字
+            keyword = token.group('keyword')
+            continue
+        number = token.group('number')
+        suffix = token.group('suffix')
+        if suffix == '元':
+            if first_yuan is None:
+                first_yuan = number
+        elif suffix and '预算数量' not in found:
+            found['预算数量'] = number
+            found['单位'] = suffix
+        if keyword in BUDGET_KEYWORDS:
+            found.setdefault('预算费用', number)
+        elif keyword in CURRENT_KEYWORDS:
+            found.setdefault('当前投入', number)
+        elif keyword in FINAL_KEYWORDS:
+            found.setdefault('最终花费', number)
+        keyword = None
+    if '预算费用' not in found and first_yuan is not None:
+        found['预算费用'] = first_yuan
+    return found
+
+
+def _strip_trailing_quantity(name):
+    return TRAILING_QUANTITY_RE.sub('', name)
+
+
+def extract_project(text, parts):
+    """提取项目名和分类候选，返回 (项目名, 分类候选)；parts 为按分隔符切分并去掉空白的分段"""
+    if len(parts) >= 2:
+        # 第一段用于分类匹配，从第二段开始找项目名（跳过数量和金额分段）
+        category_candidate = parts[0]
+        project_name = None
+        for part in parts[1:]:
+            if QUANTITY_PART_RE.match(part) or AMOUNT_PART_RE.match(part):
+                continue
+            project_name = part
+            break
+        if not project_name:
+            if any(keyword in category_candidate for keyword in CATEGORY_HINT_KEYWORDS):
+                # 第一段像分类名但没有找到项目名，使用第二段（即使它可能是数量）
+                project_name = parts[1]
+            else:
+                # 第一段不像分类名，是项目名，分类稍后根据项目名匹配
+                project_name = category_candidate
+                category_candidate = None
+        return project_name or '', category_candidate or ''
+
+    # 只有一段：项目名在第一个数字或关键词之前，去掉末尾的数量和单位
+    match = PROJECT_RE.search(text) or PROJECT_FALLBACK_RE.search(text)
+    if match:
+        return _strip_trailing_quantity(match.group(1).strip()), ''
+    return '', ''
+
+
+def extract_remark(text, raw_parts):
+    """备注：优先取备注关键词后面的内容，否则取最后一段（不是数字或“实际XX”时）"""
+    for pattern in REMARK_RES:
+        match = pattern.search(text)
+        if match:
+            remark = match.group(1).strip()
+            # 排除纯数字（可能是误匹配）
+            if not REMARK_NUMBER_RE.match(remark):
+                if remark:
+                    return remark
+                # 关键词后面只有空白：不再尝试其他关键词，改取最后一段
+                break
+    if len(raw_parts) > 1:
+        last_part = raw_parts[-1].strip()
+        if not any(pattern.match(last_part) for pattern in LAST_PART_NOT_REMARK_RES):
+            return last_part
+    return ''
+
+
+def parse_line(text, matcher):
+    """解析一行文本，返回项目字段（值都是字符串）；matcher 为 CategoryMatcher"""
+    raw_parts = SEPARATOR_RE.split(text)
+    parts = [part.strip() for part in raw_parts if part.strip()]
+
+    project_name, category = extract_project(text, parts)
+    numbers = scan_numbers(text)
+    item = {
+        '项目': project_name,
+        'category': category,
+        '单位': numbers.get('单位', ''),
+        '预算数量': numbers.get('预算数量', ''),
+        '预算费用': numbers.get('预算费用', ''),
+        '当前投入': numbers.get('当前投入', '0'),
+        '最终花费': numbers.get('最终花费', '0'),
+        '备注': extract_remark(text, raw_parts),
+    }
+
+    # 没有分类候选时，根据项目名匹配已有分类，仍然没有时用项目名作为新分类
+    if not item['category'] and project_name:
+        matched = matcher.match(project_name)
+        item['category'] = new_category_name(project_name) if matched is None else matched
+    return item
+
+
+# ---------- 批量解析（进程池任务） ----------
+
+_WORKER_MATCHER = (None, None)  # 进程池子进程中缓存的 (分类版本号, CategoryMatcher)
+
+
+def parse_lines(lines, categories, revision=None):
+    """解析多行文本，返回每行的结果：{'success': True, 'item': {...}} 或 {'error': ...}
+    供进程池调用：只依赖本模块，子进程不需要导入Flask；revision 与上一次调用相同时复用已构建的匹配器
+    """
+    global _WORKER_MATCHER
+    cached_revision, matcher = _WORKER_MATCHER
+    if matcher is None or revision is None or cached_revision != revision:
+        matcher = CategoryMatcher(categories, revision)
+        _WORKER_MATCHER = (revision, matcher)
+
+    results = []
+    for text in lines:
+        try:
+            results.append({'success': True, 'item': parse_line(text, matcher)})
+        except Exception as e:
+            results.append({'error': f'解析失败: {str(e)}'})
+    return results
@@ -0,0 +1,337 @@
+"""
+快速PDF渲染（大预算表）
+不经过platypus排版，按预先计算的列宽直接在canvas上逐行绘制并手动分页；
+不传canvas时只计算分页、不绘制（纯算术，几万行也只需几毫秒），并行渲染前用它确定每一段从第几页开始
+"""
+from datetime import datetime
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.pdfbase import pdfmetrics
+
+PAGE_WIDTH, PAGE_HEIGHT = A4
+MARGIN = 2 * cm
+BOTTOM = MARGIN + 12  # 页码占用底部一行
+ROW_HEIGHT = 14
+HEADER_HEIGHT = 18
+PADDING = 3
+THEME = colors.HexColor('#667eea')
+
+# 项目表的列：(字段, 表头, 宽度)；只导出部分列时按宽度比例放大到整个表格宽度
+ITEM_COLUMNS = (
+    ('seq_num', '序号', 0.8 * cm),
+    ('project_name', '项目名称', 4 * cm),
+    ('unit', '单位', 1 * cm),
+    ('budget_quantity', '数量', 1 * cm),
+    ('budget_cost', '预算费用', 1.8 * cm),
+    ('current_investment', '当前投入', 1.8 * cm),
+    ('final_cost', '最终花费', 1.8 * cm),
+    ('diff', '差价', 1.8 * cm),
+    ('remark', '备注', 2 * cm),
+)
+AMOUNT_FIELDS = ('budget_cost', 'current_investment', 'final_cost', 'diff')
+TABLE_WIDTH = sum(width for _, _, width in ITEM_COLUMNS)
+# 分类汇总表（并行渲染的首页），总宽度与项目表相同
+SUMMARY_COL_WIDTHS = [w * cm for w in (4.6, 1.2, 2.2, 2.2, 2.2, 2.2, 1.4)]
+SUMMARY_HEADERS = ['分类', '项目数', '预算费用', '当前投入', '最终花费', '差价', '页码']
+SUMMARY_RIGHT_ALIGNED = (1, 2, 3, 4, 5, 6)
+
+
+def format_number(value):
+    return f'{value or 0:,.2f}'
+
+
+def section_totals(rows):
+    """一组项目行的预算费用、当前投入、最终花费合计"""
+    totals = {'budget_cost': 0, 'current_investment': 0, 'final_cost': 0}
+    for row in rows:
+        for key in totals:
+            totals[key] += row[key] or 0
+    return totals
+
+
+def _column_x(widths):
+    col_x = [MARGIN]
+    for width in widths:
+        col_x.append(col_x[-1] + width)
+    return col_x
+
+
+class FastPdfRenderer:
+    """在canvas上逐行绘制预算表并手动分页；canvas为None时只计算分页（page_number 与实际绘制完全一致）
+    columns 为要输出的项目表字段（ITEM_COLUMNS 中的字段名），None 表示全部
+    """
+
+    def __init__(self, canvas=None, font_name='Helvetica', first_page=1, columns=None):
+        self.c = canvas
+        self.font_name = font_name
+        self.first_page = first_page
+        self.page_number = first_page
+        self.y = PAGE_HEIGHT - MARGIN
+        self.table_width = TABLE_WIDTH
+        item_columns = [column for column in ITEM_COLUMNS if columns is None or column[0] in columns]
+        scale = TABLE_WIDTH / sum(width for _, _, width in item_columns)
+        self.item_fields = [field for field, _, _ in item_columns]
+        self.item_headers = [title for _, title, _ in item_columns]
+        self.item_widths = [width * scale for _, _, width in item_columns]
+        self.item_x = _column_x(self.item_widths)
+        self.item_right_aligned = [i for i, field in enumerate(self.item_fields) if field in AMOUNT_FIELDS]
+        self.summary_x = _column_x(SUMMARY_COL_WIDTHS)
+        # 文字宽度测量缓存：reportlab不做字距调整，字符串宽度等于各字符宽度之和
+        self._char_widths = {}
+        self._fit_cache = {}
+
+    @property
+    def page_count(self):
+        return self.page_number - self.first_page + 1
+
+    # ---------- 文字 ----------
+
+    def text_width(self, text, size):
+        widths = self._char_widths.setdefault(size, {})
+        total = 0
+        for ch in text:
+            width = widths.get(ch)
+            if width is None:
+                width = widths[ch] = pdfmetrics.stringWidth(ch, self.font_name, size)
+            total += width
+        return total
+
+    def fit(self, text, max_width, size):
+        """截断文本使其不超过max_width，超出部分用...表示（结果缓存）"""
+        key = (text, max_width, size)
+        fitted = self._fit_cache.get(key)
+        if fitted is None:
+            if self.text_width(text, size) <= max_width:
+                fitted = text
+            else:
+                available = max_width - self.text_width('...', size)
+                widths = self._char_widths[size]
+                used = 0
+                end = 0
+                for ch in text:
+                    if used + widths[ch] > available:
+                        break
+                    used += widths[ch]
+                    end += 1
+                fitted = text[:end] + '...'
+            self._fit_cache[key] = fitted
+        return fitted
+
+    # ---------- 分页 ----------
+
+    def _draw_page_number(self):
+        c = self.c
+        c.setFont(self.font_name, 8)
+        c.setFillColor(colors.grey)
+        c.drawCentredString(PAGE_WIDTH / 2, MARGIN - 12, f'第 {self.page_number} 页')
+
+    def new_page(self):
+        if self.c is not None:
+            self._draw_page_number()
+            self.c.showPage()
+        self.page_number += 1
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def ensure_space(self, height):
+        if self.y - height < BOTTOM:
+            self.new_page()
+
+    def finish(self):
+        """绘制最后一页的页码并保存，返回本次绘制的页数"""
+        if self.c is not None:
+            self._draw_page_number()
+            self.c.save()
+        return self.page_count
+
+    # ---------- 元素 ----------
+
+    def column_header(self, col_x, titles, right_aligned):
+        c = self.c
+        if c is not None:
+            y = self.y
+            c.setFillColor(colors.HexColor('#f8f9fa'))
+            c.rect(MARGIN, y - HEADER_HEIGHT, self.table_width, HEADER_HEIGHT, stroke=0, fill=1)
+            c.setFillColor(colors.black)
+            c.setFont(self.font_name, 9)
+            for i, title in enumerate(titles):
+                if i in right_aligned:
+                    c.drawRightString(col_x[i + 1] - PADDING, y - HEADER_HEIGHT + 6, title)
+                else:
+                    c.drawString(col_x[i] + PADDING, y - HEADER_HEIGHT + 6, title)
+            c.setStrokeColor(colors.black)
+            c.setLineWidth(1.5)
+            c.line(MARGIN, y - HEADER_HEIGHT, MARGIN + self.table_width, y - HEADER_HEIGHT)
+        self.y -= HEADER_HEIGHT
+
+    def grid(self, col_x, top):
+        """表格一段（同一页内）的竖线和外框"""
+        c = self.c
+        if c is None:
+            return
+        c.setStrokeColor(colors.grey)
+        c.setLineWidth(0.5)
+        for x in col_x:
+            c.line(x, top, x, self.y)
+        c.line(MARGIN, top, MARGIN + self.table_width, top)
+        c.line(MARGIN, self.y, MARGIN + self.table_width, self.y)
+
+    def band(self, text, height, fill, text_color, size, centered=False):
+        """整行色块（分类标题、合计）"""
+        self.ensure_space(height)
+        c = self.c
+        if c is not None:
+            y = self.y
+            c.setFillColor(fill)
+            c.rect(MARGIN, y - height, self.table_width, height, stroke=0, fill=1)
+            c.setFillColor(text_color)
+            c.setFont(self.font_name, size)
+            text = self.fit(text, self.table_width - 2 * PADDING, size)
+            if centered:
+                c.drawCentredString(MARGIN + self.table_width / 2, y - height / 2 - size / 3, text)
+            else:
+                c.drawString(MARGIN + 10, y - height / 2 - size / 3, text)
+        self.y -= height
+
+    def title(self, totals, generated_at=None):
+        """标题、生成时间和总合计（总合计来自数据库，与明细是同一份数据快照）；generated_at 不传时取当前时间"""
+        c = self.c
+        if c is not None:
+            y = self.y
+            c.setFillColor(THEME)
+            c.setFont(self.font_name, 20)
+            c.drawCentredString(PAGE_WIDTH / 2, y - 20, '装修预算表')
+            c.setFillColor(colors.grey)
+            c.setFont(self.font_name, 10)
+            c.drawCentredString(PAGE_WIDTH / 2, y - 40, f'生成时间：{generated_at or datetime.now().strftime("%Y年%m月%d日 %H:%M")}')
+        self.y -= 60
+
+        grand_budget = totals['budget_cost'] if totals else 0
+        grand_current = totals['current_investment'] if totals else 0
+        grand_final = totals['final_cost'] if totals else 0
+        total_text = (f'总合计：预算费用 {format_number(grand_budget)} 元 | 当前投入 {format_number(grand_current)} 元 | '
+                      f'最终花费 {format_number(grand_final)} 元 | 差价 {format_number(grand_budget - grand_final)} 元')
+        self.band(total_text, 30, colors.HexColor('#f8f9fa'), THEME, 9, centered=True)
+        if c is not None:
+            c.setStrokeColor(THEME)
+            c.setLineWidth(2)
+            c.rect(MARGIN, self.y, self.table_width, 30, stroke=1, fill=0)
+        self.y -= 14
+
+    def section(self, name, rows, item_count=None, start_seq=1, continued=False, totals=None, summary=True):
+        """一个分类（或分类的一段）：标题色块、项目表、本分类合计
+        大分类拆成多段并行渲染时，后续段 continued=True、序号从 start_seq 开始，
+        只有最后一段 summary=True 并传入整个分类的 totals；返回分类标题所在的页码
+        """
+        item_count = len(rows) if item_count is None else item_count
+        self.ensure_space(26 + HEADER_HEIGHT + ROW_HEIGHT)
+        label = f'{name}（续）' if continued else name
+        self.band(f'{label} ({item_count} 项)', 26, THEME, colors.white, 12)
+        start_page = self.page_number
+
+        c = self.c
+        col_x = self.item_x
+        widths = self.item_widths
+        fields = self.item_fields
+        headers = self.item_headers
+        right_aligned = self.item_right_aligned
+        if rows:
+            self.column_header(col_x, headers, right_aligned)
+            segment_top = self.y + HEADER_HEIGHT
+            for seq_num, row in enumerate(rows, start=start_seq):
+                if self.y - ROW_HEIGHT < BOTTOM:
+                    self.grid(col_x, segment_top)
+                    self.new_page()
+                    self.column_header(col_x, headers, right_aligned)
+                    segment_top = self.y + HEADER_HEIGHT
+
+                if c is not None:
+                    y = self.y
+                    if seq_num % 2 == 0:
+                        c.setFillColor(colors.HexColor('#f9f9f9'))
+                        c.rect(MARGIN, y - ROW_HEIGHT, self.table_width, ROW_HEIGHT, stroke=0, fill=1)
+                    c.setFillColor(colors.black)
+                    baseline = y - ROW_HEIGHT + 4
+                    c.setFont(self.font_name, 8)
+                    for col, field in enumerate(fields):
+                        if field == 'seq_num':
+                            c.drawString(col_x[col] + PADDING, baseline, str(seq_num))
+                        elif field == 'diff':
+                            value = (row['budget_cost'] or 0) - (row['final_cost'] or 0)
+                            c.drawRightString(col_x[col + 1] - PADDING, baseline, format_number(value))
+                        elif field in AMOUNT_FIELDS:
+                            c.drawRightString(col_x[col + 1] - PADDING, baseline, format_number(row[field]))
+                        elif field == 'remark':
+                            # 备注总是最后一列，用更小的灰色字
+                            if row['remark']:
+                                c.setFillColor(colors.HexColor('#666666'))
+                                c.setFont(self.font_name, 7)
+                                c.drawString(col_x[col] + PADDING, baseline,
+                                             self.fit(str(row['remark']), widths[col] - 2 * PADDING, 7))
+                        elif row[field]:
+                            c.drawString(col_x[col] + PADDING, baseline,
+                                         self.fit(str(row[field]), widths[col] - 2 * PADDING, 8))
+                    c.setStrokeColor(colors.grey)
+                    c.setLineWidth(0.5)
+                    c.line(MARGIN, y - ROW_HEIGHT, MARGIN + self.table_width, y - ROW_HEIGHT)
+                self.y -= ROW_HEIGHT
+            self.grid(col_x, segment_top)
+
+        if summary:
+            totals = totals or section_totals(rows)
+            total_budget = totals['budget_cost']
+            total_final = totals['final_cost']
+            summary_text = (f'本分类合计：预算费用 {format_number(total_budget)} 元 | '
+                            f'当前投入 {format_number(totals["current_investment"])} 元 | '
+                            f'最终花费 {format_number(total_final)} 元 | 差价 {format_number(total_budget - total_final)} 元')
+            self.band(summary_text, 20, colors.HexColor('#f0f0f0'), THEME, 8, centered=True)
+            self.y -= 8
+        return start_page
+
+    def summary_table(self, entries):
+        """分类汇总表：entries 为 [{'name', 'item_count', 'totals', 'page'}]，page 为该分类开始的页码"""
+        c = self.c
+        col_x = self.summary_x
+        widths = SUMMARY_COL_WIDTHS
+        self.ensure_space(HEADER_HEIGHT + ROW_HEIGHT)
+        self.column_header(col_x, SUMMARY_HEADERS, SUMMARY_RIGHT_ALIGNED)
+        segment_top = self.y + HEADER_HEIGHT
+        for index, entry in enumerate(entries):
+            if self.y - ROW_HEIGHT < BOTTOM:
+                self.grid(col_x, segment_top)
+                self.new_page()
+                self.column_header(col_x, SUMMARY_HEADERS, SUMMARY_RIGHT_ALIGNED)
+                segment_top = self.y + HEADER_HEIGHT
+
+            if c is not None:
+                y = self.y
+                totals = entry['totals']
+                budget = totals['budget_cost']
+                final = totals['final_cost']
+                if index % 2 == 1:
+                    c.setFillColor(colors.HexColor('#f9f9f9'))
+                    c.rect(MARGIN, y - ROW_HEIGHT, self.table_width, ROW_HEIGHT, stroke=0, fill=1)
+                c.setFillColor(colors.black)
+                baseline = y - ROW_HEIGHT + 4
+                c.setFont(self.font_name, 8)
+                c.drawString(col_x[0] + PADDING, baseline, self.fit(entry['name'], widths[0] - 2 * PADDING, 8))
+                values = (str(entry['item_count']), format_number(budget), format_number(totals['current_investment']),
+                          format_number(final), format_number(budget - final), str(entry['page']))
+                for col, value in enumerate(values, start=1):
+                    c.drawRightString(col_x[col + 1] - PADDING, baseline, value)
+                c.setStrokeColor(colors.grey)
+                c.setLineWidth(0.5)
+                c.line(MARGIN, y - ROW_HEIGHT, MARGIN + self.table_width, y - ROW_HEIGHT)
+            self.y -= ROW_HEIGHT
+        self.grid(col_x, segment_top)
+        self.y -= 8
+
+    def closing_note(self):
+        """文末说明"""
+        self.ensure_space(20)
+        if self.c is not None:
+            self.c.setFillColor(colors.grey)
+            self.c.setFont(self.font_name, 8)
+            self.c.drawCentredString(PAGE_WIDTH / 2, self.y - 20, '本预算表由装修预算表管理系统自动生成')
+        self.y -= 20
@@ -0,0 +1,40 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+# 测试直接导入仓库根目录下的模块（nl_parser、app 等）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app 在导入时按 DATA_DIR 创建上传/导出目录，测试时放到临时目录，不写入仓库
+if 'DATA_DIR' not in os.environ:
+    _DATA_DIR = os.environ['DATA_DIR'] = tempfile.mkdtemp(prefix='budget-test-')
+else:
+    _DATA_DIR = None
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if _DATA_DIR:
+        shutil.rmtree(_DATA_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """每个测试使用一个新的临时数据库"""
+    import database
+    monkeypatch.setattr(database, 'DB_FILE', str(tmp_path / 'budget.db'))
+    monkeypatch.setattr(database, 'BACKUP_DIR', str(tmp_path / 'backups'))
+    database.init_database()
+    return database
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    """Flask 测试客户端（连接临时数据库）"""
+    import app as app_module
+    # 分类匹配器按分类版本号缓存，换了数据库后需要重建
+    monkeypatch.setattr(app_module, '_CATEGORY_MATCHER', (None, None))
+    app_module.app.config['TESTING'] = True
+    return app_module.app.test_client()
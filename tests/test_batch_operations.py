@@ -0,0 +1,69 @@
+import pytest
+
+
+def post_batch(client, operations):
+    return client.post('/api/batch', json={'operations': operations})
+
+
+def item_names(db):
+    conn = db.get_db_connection()
+    try:
+        return [row['project_name'] for row in conn.execute('SELECT project_name FROM items ORDER BY id')]
+    finally:
+        conn.close()
+
+
+def test_batch_applies_operations_in_one_transaction(client, db):
+    response = post_batch(client, [
+        {'op': 'add', 'item': {'项目': '沙发', '预算费用': '3000'}, 'category': '客厅'},
+        {'op': 'add', 'item': {'项目': '餐桌', '预算费用': '2000', 'category': '餐厅'}},
+    ])
+    assert response.status_code == 200
+    assert [result['op'] for result in response.get_json()['results']] == ['add', 'add']
+    assert item_names(db) == ['沙发', '餐桌']
+
+
+@pytest.mark.parametrize('operation', [
+    'add',
+    {'item': {'项目': '沙发'}},
+    {'op': 'move', 'item': {'项目': '沙发'}},
+    {'op': 'add'},
+    {'op': 'add', 'item': ['沙发']},
+    {'op': 'add', 'item': {'项目': '沙发', '预算费用': 'abc'}},
+    {'op': 'add', 'item': {'项目': '沙发'}, 'category': 1},
+    {'op': 'update', 'item': {'项目': '沙发'}},
+    {'op': 'delete'},
+    {'op': 'delete', 'item_ids': []},
+    {'op': 'delete', 'item_ids': [1, None]},
+    {'op': 'reorder'},
+    {'op': 'reorder', 'category_id': 1, 'orders': [{'id': 1}]},
+    {'op': 'reorder', 'category_id': 1, 'orders': [{'id': 1, 'order_index': 0}]},
+    {'op': 'reorder', 'orders': [{'seq_num': 1, 'order_index': 0}]},
+    {'op': 'reorder', 'orders': ['1']},
+])
+def test_invalid_operation_is_rejected_with_its_index(client, db, operation):
+    response = post_batch(client, [
+        {'op': 'add', 'item': {'项目': '沙发'}, 'category': '客厅'},
+        operation,
+    ])
+    assert response.status_code == 400
+    body = response.get_json()
+    assert body['index'] == 1
+    assert body['error'].startswith('第2个操作')
+    # 校验在执行前完成，第一个操作也没有写入
+    assert item_names(db) == []
+
+
+def test_failed_operation_rolls_back_the_batch(client, db):
+    response = post_batch(client, [
+        {'op': 'add', 'item': {'项目': '沙发'}, 'category': '客厅'},
+        {'op': 'update', 'item': {'id': 999, '项目': '餐桌'}},
+    ])
+    assert response.status_code == 400
+    assert response.get_json()['index'] == 1
+    assert item_names(db) == []
+
+
+def test_operations_must_be_a_list(client, db):
+    response = client.post('/api/batch', json={'operations': {'op': 'add'}})
+    assert response.status_code == 400
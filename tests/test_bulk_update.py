@@ -0,0 +1,46 @@
+def category_names(db):
+    return [category['name'] for category in db.get_all_categories()]
+
+
+def items_by_category(db):
+    conn = db.get_db_connection()
+    try:
+        rows = conn.execute(
+            'SELECT c.name, i.seq_num, i.project_name FROM items i JOIN categories c ON c.id = i.category_id '
+            'ORDER BY c.order_index, i.seq_num, i.id'
+        ).fetchall()
+        return [tuple(row) for row in rows]
+    finally:
+        conn.close()
+
+
+def seed(db):
+    for category, name in [('客厅', '沙发'), ('客厅', '茶几'), ('客厅', '合计'), ('卧室', '床'), ('卧室', '衣柜')]:
+        db.add_item({'项目': name}, category)
+
+
+def test_move_without_matches_does_not_create_category(db):
+    seed(db)
+    result = db.bulk_update_items({'name_contains': '不存在'}, {'category': '书房'})
+    assert result == {'updated': 0, 'protected': 0}
+    # 只匹配到受保护的合计行
+    result = db.bulk_update_items({'name_contains': '合计'}, {'category': '书房'})
+    assert result == {'updated': 0, 'protected': 1}
+    assert category_names(db) == ['客厅', '卧室']
+
+
+def test_moved_items_are_numbered_after_target_category(db):
+    seed(db)
+    result = db.bulk_update_items({'category': '客厅'}, {'category': '卧室', '备注': '已移动'})
+    assert result == {'updated': 2, 'protected': 1}
+    assert items_by_category(db) == [
+        ('客厅', 3, '合计'),
+        ('卧室', 1, '床'), ('卧室', 2, '衣柜'), ('卧室', 3, '沙发'), ('卧室', 4, '茶几'),
+    ]
+
+
+def test_move_to_new_category(db):
+    seed(db)
+    db.bulk_update_items({'name_contains': '柜'}, {'category': '书房'})
+    assert category_names(db) == ['客厅', '卧室', '书房']
+    assert items_by_category(db)[-1] == ('书房', 1, '衣柜')
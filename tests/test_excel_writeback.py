@@ -0,0 +1,65 @@
+from openpyxl import Workbook, load_workbook
+
+import app
+
+
+def make_workbook(path):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(['装修预算'])
+    ws.append(['序号', '项目', '单位', '预算数量', '预算费用', '当前投入', '最终花费', '差价', '备注'])
+    ws.append(['一、客厅'])
+    ws.append([1, '沙发', '个', 1, 3000, None, None, 3000, None])
+    ws.append(['合计'])
+    wb.save(path)
+
+
+def rows(path):
+    return [[cell.value for cell in row][:9] for row in load_workbook(path).active.iter_rows(min_row=4)]
+
+
+def test_add_item_keeps_current_equal_to_budget_and_blanks_bad_numbers(tmp_path):
+    path = str(tmp_path / 'budget.xlsx')
+    make_workbook(path)
+    with app.ExcelSession(path) as session:
+        app.add_item_to_excel({'项目': '茶几', '预算费用': '800', '当前投入': '800', '最终花费': '1.2.3'}, '客厅',
+                              session=session)
+    assert rows(path)[1] == [2, '茶几', None, None, 800, 800, None, 800, None]
+    # 合计行已重新计算
+    assert rows(path)[2][4:8] == [3800, 800, None, 3800]
+
+
+def test_save_excel_uses_legacy_budget_columns(tmp_path):
+    path = str(tmp_path / 'budget.xlsx')
+    make_workbook(path)
+    item = {'row_index': 3, '序号': 1, '项目': '沙发', '单位': '个', '预算数量': '1',
+            '1st预算费用': '2800', '2nd预算费用': '3200', '最终实际花费': '-', '最终花费': '3100', '备注': ''}
+    with app.ExcelSession(path) as session:
+        app.save_excel({'items': [item]}, session=session)
+    assert rows(path)[0] == [1, '沙发', '个', '1', 3200, None, 3100, 100, None]
+
+
+def test_add_item_into_category_with_merged_range_spanning_insert_row(tmp_path):
+    path = str(tmp_path / 'budget.xlsx')
+    wb = Workbook()
+    ws = wb.active
+    ws.append(['装修预算'])
+    ws.append(['序号', '项目', '单位', '预算数量', '预算费用', '当前投入', '最终花费', '差价', '备注'])
+    ws.append(['一、客厅'])
+    ws.append([1, '沙发', '个', 1, 3000, None, None, 3000, '整体选购'])
+    ws.append([2, '电视柜', '个', 1, 1000, None, None, 1000, None])
+    ws.append(['合计'])
+    ws.merge_cells('I4:I6')  # 备注列跨过合计行（新项目插入在第6行）
+    wb.save(path)
+
+    with app.ExcelSession(path) as session:
+        app.add_item_to_excel({'项目': '茶几', '预算费用': '800', '备注': '同款'}, '客厅', session=session)
+        app.add_category_to_excel('卧室', session=session)
+
+    ws = load_workbook(path).active
+    assert [r.coord for r in ws.merged_cells.ranges] == ['I4:I7']
+    assert rows(path)[2][:8] == [3, '茶几', None, None, 800, None, None, 800]
+    assert rows(path)[3][:8] == ['合计', None, None, None, 4800, None, None, 4800]
+    assert [row[0] for row in rows(path)[4:]] == ['二、卧室', '序号', '合计']
+    # 合并区域中只保留左上角的备注
+    assert ws['I4'].value == '整体选购'
@@ -0,0 +1,51 @@
+import os
+import time
+
+import pytest
+
+from font_cache import FontCache
+
+pytest.importorskip('fontTools')
+
+FONT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fonts')
+
+
+def find_font():
+    """测试用的TTF字体：项目 fonts/ 目录或系统字体目录中的任意一个"""
+    import glob
+    for pattern in (os.path.join(FONT_DIR, '*.ttf'), '/usr/share/fonts/**/*.ttf', '/Library/Fonts/*.ttf'):
+        paths = sorted(glob.glob(pattern, recursive=True))
+        if paths:
+            return paths[0]
+    pytest.skip('没有可用于测试的TTF字体')
+
+
+def subset_files(cache):
+    return sorted(name for name in os.listdir(cache.cache_dir) if name.startswith('subset-'))
+
+
+def test_subsets_are_evicted_least_recently_used_first(tmp_path):
+    font = find_font()
+    cache = FontCache(str(tmp_path), max_subsets=2)
+    first = cache.subset(font, set('abc'))
+    second = cache.subset(font, set('abd'))
+    # 确保修改时间可以区分先后
+    old = time.time() - 100
+    os.utime(first, (old, old))
+    os.utime(second, (old - 10, old - 10))
+
+    assert cache.subset(font, set('abc')) == first  # 复用并更新最近使用时间
+    third = cache.subset(font, set('abe'))
+
+    assert subset_files(cache) == sorted(os.path.basename(path) for path in (first, third))
+    assert not os.path.exists(second)
+
+
+def test_subsets_respect_size_limit(tmp_path):
+    font = find_font()
+    cache = FontCache(str(tmp_path), max_bytes=1)
+    path = cache.subset(font, set('abc'))
+    assert os.path.exists(path)  # 刚生成的子集总是保留
+    cache.subset(font, set('xyz'))
+    assert not os.path.exists(path)
+    assert len(subset_files(cache)) == 1
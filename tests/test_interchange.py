@@ -0,0 +1,101 @@
+import io
+import json
+import os
+
+import pytest
+
+from interchange import InterchangeError, iter_item_batches, read_items
+
+
+def ndjson(*records):
+    return io.BytesIO(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records).encode('utf-8'))
+
+
+@pytest.mark.parametrize('value', ['nan', 'NaN', 'inf', '-Infinity', '1e999'])
+def test_non_finite_numbers_are_rejected_in_csv(value):
+    stream = io.BytesIO(f'category,project_name,budget_cost\n客厅,沙发,{value}\n'.encode('utf-8'))
+    with pytest.raises(InterchangeError, match='第1行 budget_cost'):
+        read_items(stream, 'csv')
+
+
+def test_non_finite_numbers_are_rejected_in_ndjson():
+    stream = io.BytesIO(b'{"category": "\\u5ba2\\u5385", "project_name": "a", "final_cost": NaN}\n')
+    with pytest.raises(InterchangeError, match='final_cost'):
+        read_items(stream, 'ndjson')
+
+
+def test_infinite_seq_num_is_rejected():
+    stream = io.BytesIO('category,project_name,seq_num\n客厅,沙发,inf\n'.encode('utf-8'))
+    with pytest.raises(InterchangeError, match='seq_num'):
+        read_items(stream, 'csv')
+
+
+def test_items_are_read_in_batches():
+    records = [{'category': f'分类{i % 3}', 'project_name': f'项目{i}', 'budget_cost': i} for i in range(7)]
+    batches = list(iter_item_batches(ndjson(*records), 'ndjson', batch_rows=3))
+    assert [len(batch['items']) for batch in batches] == [3, 3, 1]
+    # 每个分类只在第一次出现的那一批中列出
+    assert [batch['categories'] for batch in batches] == [['分类0', '分类1', '分类2'], [], []]
+    # 序号按分类跨批连续编号
+    assert [item['序号'] for item in batches[2]['items']] == [3]
+
+
+def import_data(client, body, filename='data.ndjson', **form):
+    return client.post('/api/import-data', data={'file': (io.BytesIO(body), filename), **form},
+                       content_type='multipart/form-data')
+
+
+def item_rows(db):
+    conn = db.get_db_connection()
+    try:
+        return [tuple(row) for row in conn.execute(
+            'SELECT c.name, i.project_name, i.budget_cost FROM items i JOIN categories c ON c.id = i.category_id '
+            'ORDER BY c.order_index, i.seq_num')]
+    finally:
+        conn.close()
+
+
+def test_import_data_streams_into_database(client, db, monkeypatch):
+    import interchange
+    monkeypatch.setattr(interchange, 'IMPORT_BATCH_ROWS', 2)
+    body = ndjson(
+        {'category': '客厅', 'project_name': '沙发', 'budget_cost': 3000},
+        {'category': '餐厅'},
+        {'category': '客厅', 'project_name': '茶几', 'budget_cost': 800},
+        {'category': '餐厅', 'project_name': '餐桌', 'budget_cost': 2000},
+    ).getvalue()
+    response = import_data(client, body)
+    assert response.status_code == 200
+    assert response.get_json()['item_count'] == 3
+    assert response.get_json()['category_count'] == 2
+    assert item_rows(db) == [('客厅', '沙发', 3000.0), ('客厅', '茶几', 800.0), ('餐厅', '餐桌', 2000.0)]
+
+
+def test_import_data_rolls_back_on_bad_row(client, db):
+    import_data(client, ndjson({'category': '客厅', 'project_name': '沙发', 'budget_cost': 1}).getvalue())
+    response = import_data(client, 'category,project_name,budget_cost\n厨房,橱柜,1\n厨房,冰箱,inf\n'.encode('utf-8'),
+                           filename='data.csv')
+    assert response.status_code == 400
+    assert 'budget_cost' in response.get_json()['error']
+    assert item_rows(db) == [('客厅', '沙发', 1.0)]
+
+
+def test_large_import_data_runs_as_job(client, db, monkeypatch):
+    import app as app_module
+    monkeypatch.setattr(app_module, 'IMPORT_DATA_SYNC_MAX_BYTES', 0)
+    response = import_data(client, ndjson({'category': '客厅', 'project_name': '沙发', 'budget_cost': 5}).getvalue(),
+                           mode='merge')
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+    assert item_rows(db) == []
+
+    job = db.claim_next_job(['import_data'])
+    assert job['id'] == job_id
+    app_module.run_job(job)
+    # 上传文件在任务结束后删除
+    assert not os.path.exists(job['payload']['path'])
+
+    job = client.get(f'/api/jobs/{job_id}').get_json()['job']
+    assert job['status'] == 'done'
+    assert job['result']['item_count'] == 1
+    assert item_rows(db) == [('客厅', '沙发', 5.0)]
@@ -0,0 +1,28 @@
+import time
+
+import app
+
+
+def test_running_job_heartbeat_prevents_requeue(db, monkeypatch):
+    seen = {}
+
+    def slow_handler(job):
+        # 运行时间超过 stale_seconds，期间其他进程检查中断的任务
+        time.sleep(2.5)
+        seen['requeued'] = db.requeue_interrupted_jobs(stale_seconds=1)
+        seen['status'] = db.get_job(job['id'])['status']
+        return {}
+
+    monkeypatch.setitem(app.JOB_HANDLERS, 'slow', slow_handler)
+    monkeypatch.setattr(app, 'JOB_HEARTBEAT_INTERVAL', 0.2)
+    job_id = app.enqueue_job('slow')
+    app.run_job(db.claim_next_job(['slow']))
+
+    assert seen == {'requeued': 0, 'status': 'running'}
+    assert db.get_job(job_id)['status'] == 'done'
+
+
+def test_touch_job_ignores_finished_jobs(db):
+    job_id = app.enqueue_job('slow')
+    db.update_job(job_id, status='done')
+    assert db.touch_job(job_id) is False
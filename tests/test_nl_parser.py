@@ -0,0 +1,42 @@
+"""nl_parser 的解析规则（与原 parse_text_local 的结果一致）"""
+from nl_parser import CategoryMatcher, parse_line
+
+CATEGORIES = ['基装', '全屋定制', '智能家居', '卫浴', '门窗']
+
+
+def parse(text, categories=CATEGORIES):
+    return parse_line(text, CategoryMatcher(categories))
+
+
+def test_full_line():
+    item = parse('全屋定制，衣柜，1套，预算59000元，当前投入2000元，备注：索菲亚')
+    assert item['category'] == '全屋定制'
+    assert item['项目'] == '衣柜'
+    assert (item['预算数量'], item['单位']) == ('1', '套')
+    assert (item['预算费用'], item['当前投入'], item['最终花费']) == ('59000', '2000', '0')
+    assert item['备注'] == '索菲亚'
+
+
+def test_malformed_decimal_quantity():
+    # 每一段数字都会被检查：取能跟单位连在一起的“5.2个”
+    item = parse('沙发 1.5.2个')
+    assert (item['预算数量'], item['单位']) == ('5.2', '个')
+
+
+def test_empty_remark_after_keyword_falls_back_to_last_part():
+    # 备注关键词后面只有空白时，改取最后一段作为备注
+    assert parse('全屋定制衣柜,：元备注: ')['备注'] == '：元备注:'
+
+
+def test_numeric_remark_is_ignored():
+    # 备注关键词后面是纯数字、最后一段也是数量时，没有备注
+    assert parse('沙发，备注：500元，3个')['备注'] == ''
+
+
+def test_empty_category_name_matches_everything():
+    assert parse('沙发 3个', ['', '卫浴'])['category'] == ''
+
+
+def test_new_category_from_project_name():
+    assert parse('防盗门', [])['category'] == '防盗门'
+    assert parse('马桶 1个')['category'] == '卫浴'
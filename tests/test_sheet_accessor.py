@@ -0,0 +1,86 @@
+import pytest
+from openpyxl import Workbook
+from openpyxl.cell.cell import MergedCell
+
+from app import SheetAccessor
+
+
+def make_sheet(*ranges):
+    ws = Workbook().active
+    for row in range(1, 9):
+        for col in range(1, 4):
+            ws.cell(row, col, value=f'{row}-{col}')
+    for coord in ranges:
+        ws.merge_cells(coord)
+    return ws
+
+
+def merged(ws):
+    return sorted(r.coord for r in ws.merged_cells.ranges)
+
+
+@pytest.mark.parametrize('ranges, idx, amount, expected', [
+    (['B2:C3'], 2, 1, ['B2:C2']),           # 删除左上角所在行：缩小成一行
+    (['B1:C3'], 2, 1, ['B1:C2']),           # 删除区域中间的行：缩小
+    (['B2:C4'], 2, 1, ['B2:C3']),           # 删除左上角所在行：缩小
+    (['B2:C4'], 3, 2, ['B2:C2']),           # 删除区域底部，跨出区域
+    (['B1:C3'], 3, 3, ['B1:C2']),
+    (['B2:C3'], 1, 3, []),                  # 区域被整体删除
+    (['A2:A3'], 2, 1, []),                  # 只剩一个单元格：取消合并
+    (['B5:C6'], 2, 2, ['B3:C4']),           # 下方的区域上移
+    (['B2:C3', 'B5:C6'], 3, 1, ['B2:C2', 'B4:C5']),
+])
+def test_delete_rows_adjusts_merged_ranges(ranges, idx, amount, expected):
+    ws = make_sheet(*ranges)
+    sheet = SheetAccessor(ws)
+    sheet.delete_rows(idx, amount)
+    assert merged(ws) == expected
+    # 索引与重新建立的索引一致
+    assert sheet._anchors == SheetAccessor(ws)._anchors
+
+
+def test_delete_rows_shrinks_a_range_straddling_the_edit_point():
+    ws = make_sheet('B2:C3')
+    sheet = SheetAccessor(ws)
+    sheet.delete_rows(2)
+    # B2:C3 删除第2行后只剩 B2:C2
+    assert merged(ws) == ['B2:C2']
+    # 新的左上角可以写入，值通过索引读取
+    sheet.set(2, 3, '忽略')
+    sheet.set(2, 2, '沙发')
+    assert sheet.get(2, 3) == '沙发'
+    assert isinstance(ws.cell(2, 3), MergedCell)
+    # 下面的行正常上移
+    assert sheet.get(3, 1) == '4-1'
+
+
+def test_delete_rows_keeps_anchor_value():
+    ws = make_sheet('B1:C3')
+    sheet = SheetAccessor(ws)
+    sheet.delete_rows(2)
+    assert sheet.get(2, 3) == '1-2'
+    assert sheet.get(3, 2) == '4-2'
+
+
+@pytest.mark.parametrize('ranges, idx, amount, expected', [
+    (['B2:C4'], 3, 1, ['B2:C5']),           # 在区域内部插入：扩大
+    (['B2:C4'], 4, 2, ['B2:C6']),
+    (['B2:C4'], 2, 1, ['B3:C5']),           # 在区域上方插入：下移
+    (['B2:C4'], 5, 1, ['B2:C4']),           # 在区域下方插入：不变
+    (['B2:C3', 'B5:C6'], 3, 1, ['B2:C4', 'B6:C7']),
+])
+def test_insert_rows_adjusts_merged_ranges(ranges, idx, amount, expected):
+    ws = make_sheet(*ranges)
+    sheet = SheetAccessor(ws)
+    sheet.insert_rows(idx, amount)
+    assert merged(ws) == expected
+    assert sheet._anchors == SheetAccessor(ws)._anchors
+
+
+def test_insert_rows_inside_range_merges_new_cells():
+    ws = make_sheet('B2:C4')
+    sheet = SheetAccessor(ws)
+    sheet.insert_rows(3)
+    assert sheet.get(3, 3) == '2-2'
+    assert isinstance(ws.cell(3, 2), MergedCell)
+    assert sheet.get(6, 2) == '5-2'
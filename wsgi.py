@@ -1,8 +1,10 @@
 """
 WSGI入口文件（用于生产环境部署）
+通过应用工厂创建应用：一次性启动任务只执行一次，重量级依赖在首次使用时才加载
 """
-from app import app
+from app import create_app
+
+app = create_app()
 
 if __name__ == "__main__":
     app.run()
-